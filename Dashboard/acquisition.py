@@ -0,0 +1,133 @@
+# acquisition.py
+"""
+Reparto de muestras del colector a consumidores independientes.
+
+El productor (el bucle de lectura del medidor) publica cada muestra en el
+SampleBus, que la copia a la cola de cada Sink sin bloquear. Cada Sink tiene su
+propio hilo, tamano de lote y espera maxima: toma de su cola hasta batch_size
+muestras (o las que lleguen en max_wait segundos) y se las pasa a su writer.
+Si un consumidor se atrasa (p. ej. un fsync lento en la SD) su cola se llena y
+se descartan sus muestras mas antiguas; el productor y los demas consumidores
+no se detienen.
+
+Un writer es cualquier objeto con write_batch(batch) y, opcionalmente, close().
+"""
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+# Registrar una muestra descartada de cada tantas para no llenar el log
+DROP_LOG_EVERY = 100
+
+class Sink:
+    def __init__(self, name, writer, max_queue=720, batch_size=1, max_wait=0.0):
+        self.name = name
+        self.writer = writer
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def put(self, sample):
+        """Encola sin bloquear; con la cola llena se descarta la muestra mas antigua."""
+        while True:
+            try:
+                self._queue.put_nowait(sample)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.dropped += 1
+                if self.dropped % DROP_LOG_EVERY == 1:
+                    logger.warning(f"Consumidor {self.name} atrasado: {self.dropped} muestras descartadas")
+                    print(f"Consumidor {self.name} atrasado: {self.dropped} muestras descartadas")
+
+    def _next_batch(self):
+        """Espera la primera muestra y junta las siguientes hasta batch_size o max_wait; devuelve (lote, detener)."""
+        sample = self._queue.get()
+        if sample is _STOP:
+            return [], True
+        batch = [sample]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                sample = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if sample is _STOP:
+                return batch, True
+            batch.append(sample)
+        return batch, False
+
+    def _write(self, batch):
+        try:
+            self.writer.write_batch(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error en el consumidor {self.name} ({len(batch)} muestras): {e}", exc_info=True)
+            print(f"Error en el consumidor {self.name}: {e}")
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write(batch)
+        close = getattr(self.writer, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.error(f"Error cerrando el consumidor {self.name}: {e}", exc_info=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"consumidor_{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        """Procesa lo que quede en la cola, cierra el writer y espera al hilo."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"El consumidor {self.name} no termino en {timeout} s ({self._queue.qsize()} muestras pendientes)")
+
+    def stats(self):
+        return {
+            'pendientes': self._queue.qsize(),
+            'escritas': self.written,
+            'descartadas': self.dropped,
+            'errores': self.errors
+        }
+
+class SampleBus:
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+        logger.info(f"Consumidores iniciados: {', '.join(sink.name for sink in self.sinks)}")
+
+    def publish(self, sample):
+        for sink in self.sinks:
+            sink.put(sample)
+
+    def stop(self):
+        for sink in self.sinks:
+            sink.stop()
+
+    def stats(self):
+        return {sink.name: sink.stats() for sink in self.sinks}
@@ -0,0 +1,464 @@
+# alert_store.py
+"""
+Almacen de alertas basado en un registro de eventos.
+
+Cada cambio de estado se agrega como una linea JSON en ALERTS_EVENTS_FILE:
+  {"evento": "abrir", "id": ..., "variable": ..., "start_time": ..., "end_time": ..., "message": ..., "value": ...}
+  {"evento": "cerrar", "id": ..., "end_time": ..., "message": ..., "value": ...}
+  {"evento": "borrar", "id": ...}
+  {"evento": "borrar_todo"}
+Solo se escribe en transiciones. Cada evento se aplica tambien al indice
+ALERTS_INDEX_FILE (SQLite, una fila por alerta) que usa la pagina de alertas
+para consultas paginadas por variable y rango de fechas, y se reescribe el
+resumen con los conteos por variable (ALERTS_SUMMARY_FILE) que lee el contador
+del dashboard. El registro se compacta en segundo plano reescribiendo solo las
+alertas vigentes y aplicando la retencion (ALERTS_RETENTION_DAYS y
+ALERTS_MAX_COUNT; las alertas activas no se eliminan).
+
+Varios procesos (alertas_manager y la pagina de alertas) escriben el mismo
+registro: cada escritura toma un bloqueo con fcntl y primero aplica los eventos
+que haya agregado otro proceso. El bloqueo es sobre ALERTS_LOCK_FILE y no sobre el
+registro, porque compact() reemplaza el registro: quien esperaba el bloqueo sobre
+el archivo anterior escribiria en un archivo ya desvinculado.
+"""
+import os
+import json
+import uuid
+import fcntl
+import sqlite3
+import threading
+import logging
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
+from buffer_segments import set_file_owner
+from config import (
+    ALERTS_STORAGE_FILE, ALERTS_EVENTS_FILE, ALERTS_INDEX_FILE, ALERTS_SUMMARY_FILE,
+    ALERTS_RETENTION_DAYS, ALERTS_MAX_COUNT
+)
+
+logger = logging.getLogger(__name__)
+
+# Compactar cuando el registro tenga mas de este numero de eventos sobrantes
+COMPACT_MIN_EXTRA_EVENTS = 500
+PAGE_SIZE = 50
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alertas (
+    id TEXT PRIMARY KEY,
+    orden INTEGER NOT NULL,
+    variable TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    message TEXT,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS alertas_orden ON alertas (orden);
+CREATE INDEX IF NOT EXISTS alertas_variable ON alertas (variable, orden);
+CREATE INDEX IF NOT EXISTS alertas_inicio ON alertas (start_time);
+CREATE TABLE IF NOT EXISTS estado (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+INDEX_COLUMNS = ('id', 'variable', 'start_time', 'end_time', 'message', 'value')
+
+# Archivo estable para el bloqueo entre procesos (el registro se reemplaza al compactar)
+ALERTS_LOCK_FILE = ALERTS_EVENTS_FILE + '.lock'
+
+@contextmanager
+def _log_lock():
+    """Bloqueo exclusivo del registro entre procesos."""
+    new_file = not os.path.exists(ALERTS_LOCK_FILE)
+    with open(ALERTS_LOCK_FILE, 'a') as lock_file:
+        if new_file:
+            set_file_owner(ALERTS_LOCK_FILE)
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write_json(path, data):
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(data, f)
+    new_file = not os.path.exists(path)
+    os.replace(temp_file, path)
+    if new_file:
+        set_file_owner(path)
+
+def _connect_index():
+    new_file = not os.path.exists(ALERTS_INDEX_FILE)
+    conn = sqlite3.connect(ALERTS_INDEX_FILE, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(INDEX_SCHEMA)
+    if new_file:
+        try:
+            set_file_owner(ALERTS_INDEX_FILE)
+        except OSError as e:
+            logger.warning(f"No se pudo ajustar permisos de {ALERTS_INDEX_FILE}: {e}")
+    return conn
+
+def _format_time(value):
+    return value.strftime(TIMESTAMP_FORMAT) if isinstance(value, datetime) else value
+
+def query_alerts(variable=None, start=None, end=None, page=0, page_size=PAGE_SIZE):
+    """
+    Una pagina de alertas (mas reciente primero) y el total que cumple el filtro.
+    start y end (datetime o texto) filtran por start_time.
+    """
+    if not os.path.exists(ALERTS_INDEX_FILE):
+        logger.warning(f"No existe {ALERTS_INDEX_FILE}")
+        return [], 0
+    where = []
+    params = []
+    if variable:
+        where.append("variable = ?")
+        params.append(variable)
+    if start is not None:
+        where.append("start_time >= ?")
+        params.append(_format_time(start))
+    if end is not None:
+        where.append("start_time <= ?")
+        params.append(_format_time(end))
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    with closing(_connect_index()) as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM alertas {where_sql}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(INDEX_COLUMNS)} FROM alertas {where_sql} ORDER BY orden DESC LIMIT ? OFFSET ?",
+            params + [page_size, page * page_size]).fetchall()
+    return [dict(zip(INDEX_COLUMNS, row)) for row in rows], total
+
+def load_summary():
+    """{'total': n, 'activas': n, 'por_variable': {variable: {'total': n, 'activas': n}}} escrito en cada transicion."""
+    try:
+        with open(ALERTS_SUMMARY_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"No existe {ALERTS_SUMMARY_FILE}")
+    except (OSError, ValueError) as e:
+        logger.error(f"Error cargando {ALERTS_SUMMARY_FILE}: {e}")
+    return {'total': 0, 'activas': 0, 'por_variable': {}}
+
+class AlertStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._alerts = {}
+        self._events = 0
+        self._offset = 0
+        self._inode = None
+        self._pending_values = {}
+        with self._lock:
+            with _log_lock():
+                self._migrate_legacy_storage()
+            self._catch_up()
+            self._check_index()
+
+    # Lectura del registro
+
+    def _apply(self, event):
+        kind = event.get('evento')
+        if kind == 'abrir':
+            self._alerts[event['id']] = {
+                'id': event['id'],
+                'variable': event['variable'],
+                'start_time': event['start_time'],
+                'end_time': event.get('end_time'),
+                'message': event['message'],
+                'value': event.get('value')
+            }
+            if event.get('clave'):
+                self._alerts[event['id']]['clave'] = event['clave']
+        elif kind == 'cerrar':
+            alert = self._alerts.get(event['id'])
+            if alert is not None:
+                alert['end_time'] = event['end_time']
+                if event.get('message') is not None:
+                    alert['message'] = event['message']
+                if 'value' in event:
+                    alert['value'] = event['value']
+        elif kind == 'borrar':
+            self._alerts.pop(event['id'], None)
+        elif kind == 'borrar_todo':
+            self._alerts = {}
+        else:
+            logger.warning(f"Evento de alerta desconocido: {event}")
+        self._events += 1
+
+    def _catch_up(self):
+        """Aplica los eventos agregados desde la ultima lectura; si el archivo se compacto se relee completo."""
+        try:
+            stat = os.stat(ALERTS_EVENTS_FILE)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self._alerts = {}
+            self._events = 0
+            self._offset = 0
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+        with open(ALERTS_EVENTS_FILE, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError) as e:
+                logger.error(f"Evento de alerta invalido en {ALERTS_EVENTS_FILE}: {line[:200]}, error: {e}")
+        self._offset += end
+
+    def refresh(self):
+        with self._lock:
+            self._catch_up()
+
+    # Indice y resumen
+
+    def _log_position(self):
+        return f"{self._inode}:{self._offset}"
+
+    def _index_events(self, conn, events):
+        for event in events:
+            kind = event.get('evento')
+            if kind == 'abrir':
+                conn.execute(
+                    "INSERT OR REPLACE INTO alertas (id, orden, variable, start_time, end_time, message, value) "
+                    "VALUES (?, (SELECT COALESCE(MAX(orden), 0) + 1 FROM alertas), ?, ?, ?, ?, ?)",
+                    (event['id'], event['variable'], event['start_time'], event.get('end_time'),
+                     event['message'], event.get('value')))
+            elif kind == 'cerrar':
+                alert = self._alerts.get(event['id'])
+                if alert is not None:
+                    conn.execute(
+                        "UPDATE alertas SET end_time = ?, message = ?, value = ? WHERE id = ?",
+                        (alert['end_time'], alert['message'], alert['value'], alert['id']))
+            elif kind == 'borrar':
+                conn.execute("DELETE FROM alertas WHERE id = ?", (event['id'],))
+            elif kind == 'borrar_todo':
+                conn.execute("DELETE FROM alertas")
+        conn.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('registro', ?)", (self._log_position(),))
+
+    def _rebuild_index(self):
+        """Reescribe el indice completo desde las alertas en memoria."""
+        with closing(_connect_index()) as conn, conn:
+            conn.execute("DELETE FROM alertas")
+            conn.executemany(
+                "INSERT INTO alertas (id, orden, variable, start_time, end_time, message, value) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(alert['id'], orden, alert['variable'], alert['start_time'], alert['end_time'], alert['message'], alert['value'])
+                 for orden, alert in enumerate(self._alerts.values(), start=1)])
+            conn.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('registro', ?)", (self._log_position(),))
+        logger.info(f"Indice de alertas reconstruido: {len(self._alerts)} alertas")
+
+    def _check_index(self):
+        """Reconstruye el indice si no corresponde a la posicion actual del registro (p. ej. tras un corte)."""
+        if self._inode is None:
+            return
+        try:
+            with closing(_connect_index()) as conn:
+                row = conn.execute("SELECT valor FROM estado WHERE clave = 'registro'").fetchone()
+            if row is not None and row[0] == self._log_position():
+                return
+            with _log_lock():
+                self._catch_up()
+                self._rebuild_index()
+                self._write_summary()
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Error verificando {ALERTS_INDEX_FILE}: {e}")
+
+    def _write_summary(self):
+        by_variable = {}
+        for alert in self._alerts.values():
+            counts = by_variable.setdefault(alert['variable'], {'total': 0, 'activas': 0})
+            counts['total'] += 1
+            if not alert.get('end_time'):
+                counts['activas'] += 1
+        _write_json(ALERTS_SUMMARY_FILE, {
+            'total': len(self._alerts),
+            'activas': sum(counts['activas'] for counts in by_variable.values()),
+            'por_variable': by_variable
+        })
+
+    # Escritura
+
+    def _append(self, events):
+        """Agrega eventos bajo bloqueo exclusivo, despues de aplicar los de otros procesos."""
+        with self._lock:
+            with _log_lock():
+                new_file = not os.path.exists(ALERTS_EVENTS_FILE)
+                self._catch_up()
+                with open(ALERTS_EVENTS_FILE, 'a') as f:
+                    for event in events:
+                        f.write(json.dumps(event) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                if new_file:
+                    set_file_owner(ALERTS_EVENTS_FILE)
+                self._catch_up()
+                try:
+                    with closing(_connect_index()) as conn, conn:
+                        self._index_events(conn, events)
+                except sqlite3.Error as e:
+                    # El registro ya tiene el evento; el indice se reconstruye al compactar o al abrir el almacen
+                    logger.error(f"Error actualizando {ALERTS_INDEX_FILE}: {e}")
+                self._write_summary()
+
+    def open_alert(self, variable, start_time, message, value=None, end_time=None, clave=None):
+        """clave distingue varias alertas activas de la misma variable (p. ej. 'Voltaje_fase_1:sostenido')."""
+        alert_id = uuid.uuid4().hex[:12]
+        event = {
+            'evento': 'abrir', 'id': alert_id, 'variable': variable, 'start_time': start_time,
+            'end_time': end_time, 'message': message, 'value': value
+        }
+        if clave:
+            event['clave'] = clave
+        self._append([event])
+        logger.info(f"Alerta {alert_id} abierta para {variable}: {message}")
+        return self.get(alert_id)
+
+    def set_value(self, alert_id, value):
+        """Ultimo valor de una alerta activa; solo en memoria, se guarda al cerrarla."""
+        with self._lock:
+            self._pending_values[alert_id] = value
+
+    def close_alert(self, alert_id, end_time, message=None, value=None):
+        with self._lock:
+            pending = self._pending_values.pop(alert_id, None)
+        value = value if value is not None else pending
+        event = {'evento': 'cerrar', 'id': alert_id, 'end_time': end_time, 'message': message}
+        if value is not None:
+            event['value'] = value
+        self._append([event])
+        logger.info(f"Alerta {alert_id} cerrada: {message}")
+        return self.get(alert_id)
+
+    def delete_alert(self, alert_id):
+        self._append([{'evento': 'borrar', 'id': alert_id}])
+        logger.info(f"Alerta {alert_id} eliminada")
+
+    def delete_all(self):
+        self._append([{'evento': 'borrar_todo'}])
+        logger.info("Todas las alertas eliminadas")
+
+    # Consultas en memoria
+
+    def get(self, alert_id):
+        with self._lock:
+            alert = self._alerts.get(alert_id)
+            return dict(alert) if alert else None
+
+    def active_by_variable(self):
+        """Indice {clave o variable: alerta} de las alertas activas (sin end_time)."""
+        with self._lock:
+            active = {}
+            for alert in self._alerts.values():
+                if not alert.get('end_time'):
+                    key = alert.get('clave') or alert['variable']
+                    active[key] = dict(alert)
+                    if alert['id'] in self._pending_values:
+                        active[key]['value'] = self._pending_values[alert['id']]
+            return active
+
+    def alerts(self):
+        with self._lock:
+            return [dict(alert) for alert in reversed(list(self._alerts.values()))]
+
+    # Retencion y compactacion
+
+    def _expired_ids(self, now=None):
+        """Alertas finalizadas fuera de la retencion: mas antiguas que ALERTS_RETENTION_DAYS o excedentes de ALERTS_MAX_COUNT."""
+        cutoff = ((now or datetime.now()) - timedelta(days=ALERTS_RETENTION_DAYS)).strftime(TIMESTAMP_FORMAT)
+        expired = set()
+        closed = []
+        for alert in self._alerts.values():
+            if not alert.get('end_time'):
+                continue
+            if str(alert['end_time']) < cutoff:
+                expired.add(alert['id'])
+            else:
+                closed.append(alert['id'])
+        excess = len(self._alerts) - len(expired) - ALERTS_MAX_COUNT
+        if excess > 0:
+            # Las alertas en memoria estan en orden de creacion: se eliminan las mas antiguas
+            expired.update(closed[:excess])
+        return expired
+
+    def compact(self, now=None):
+        """Reescribe el registro con un evento 'abrir' por alerta vigente dentro de la retencion."""
+        with self._lock:
+            with _log_lock():
+                self._catch_up()
+                expired = self._expired_ids(now)
+                temp_file = ALERTS_EVENTS_FILE + '.tmp'
+                with open(temp_file, 'w') as f:
+                    for alert in self._alerts.values():
+                        if alert['id'] not in expired:
+                            f.write(json.dumps(dict(alert, evento='abrir')) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, ALERTS_EVENTS_FILE)
+                set_file_owner(ALERTS_EVENTS_FILE)
+                before = self._events
+                self._inode = None
+                self._catch_up()
+                self._rebuild_index()
+                self._write_summary()
+        logger.info(f"Registro de alertas compactado: {before} -> {self._events} eventos, {len(expired)} alertas fuera de retencion")
+
+    def compact_if_needed(self, now=None):
+        with self._lock:
+            self._catch_up()
+            extra = self._events - len(self._alerts)
+            expired = self._expired_ids(now)
+        if extra >= COMPACT_MIN_EXTRA_EVENTS or expired:
+            self.compact(now)
+            return True
+        return False
+
+    def start_compactor(self, interval=3600):
+        """Hilo en segundo plano que compacta el registro cuando crece demasiado."""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.compact_if_needed()
+                except Exception as e:
+                    logger.error(f"Error compactando registro de alertas: {e}", exc_info=True)
+
+        thread = threading.Thread(target=run, name="compactador_alertas", daemon=True)
+        thread.start()
+        return stop
+
+    # Migracion
+
+    def _migrate_legacy_storage(self):
+        """Convierte alerts_storage.json (lista completa) en eventos, solo si aun no hay registro."""
+        if os.path.exists(ALERTS_EVENTS_FILE) or not os.path.exists(ALERTS_STORAGE_FILE):
+            return
+        try:
+            with open(ALERTS_STORAGE_FILE, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error leyendo {ALERTS_STORAGE_FILE} para migrar: {e}")
+            return
+        temp_file = ALERTS_EVENTS_FILE + '.tmp'
+        with open(temp_file, 'w') as f:
+            # La lista anterior tiene la alerta mas reciente primero
+            for alert in reversed(legacy):
+                f.write(json.dumps({
+                    'evento': 'abrir', 'id': uuid.uuid4().hex[:12], 'variable': alert.get('variable'),
+                    'start_time': alert.get('start_time'), 'end_time': alert.get('end_time'),
+                    'message': alert.get('message'), 'value': alert.get('value')
+                }) + '\n')
+        os.replace(temp_file, ALERTS_EVENTS_FILE)
+        set_file_owner(ALERTS_EVENTS_FILE)
+        os.replace(ALERTS_STORAGE_FILE, ALERTS_STORAGE_FILE + '.migrado')
+        self._catch_up()
+        self._rebuild_index()
+        self._write_summary()
+        logger.info(f"{ALERTS_STORAGE_FILE} migrado a {ALERTS_EVENTS_FILE} ({len(legacy)} alertas)")
@@ -7,8 +7,11 @@ import getpass
 import pwd
 import time
 import sys
-import subprocess
-import psutil
+import buffer_segments
+import latest_sample
+import system_probes
+from alert_store import AlertStore
+from anomaly_detectors import DetectorBank, DETECTOR_NAMES
 
 # Configuracion
 VERIFICACION = 60  # Intervalo para alertas del sistema (segundos)
@@ -18,6 +21,13 @@ MEMORIA_RAM_LIMITE = 90  # Umbral para uso de disco (%)
 MEMORIA_LIBRE_LIMITE = 2  # Umbral para espacio libre (GB)
 TEMPERATURA_LIMITE = 70  # Umbral para temperatura (C)
 DISCO_LIBRE_INTERVAL = 3600  # Intervalo para verificar espacio libre en disco (1 hora en segundos)
+# Periodo de cada sonda del sistema (segundos); corren en hilos aparte y UPDATE_alerts lee su ultimo resultado
+PROBE_PERIODS = {
+    'cpu': VERIFICACION,
+    'disco': VERIFICACION,
+    'temperatura': VERIFICACION,
+    'internet': VERIFICACION
+}
 
 # Variables electricas
 VARIABLES = [
@@ -42,12 +52,18 @@ PER_VARIABLE_NAME = {
     'Factor_Potencia': 'Factor de Potencia',
     'frecuencia': 'Frecuencia'
 }
-DATA_BUFFER_HOME = "/home/pi/Desktop/Medidor/Dashboard/data_buffer.csv"
 ALERTS_CONFIG_HOME = "/home/pi/Desktop/Medidor/Dashboard/alerts_config.json"
-ALERTS_STORAGE_HOME = "/home/pi/Desktop/Medidor/Dashboard/alerts_storage.json"
 HEARTBEAT_FILE = "/home/pi/last_heartbeat.txt"
 LOG_DIR = "/home/pi/logs"
 
+# Almacen de alertas (se crea en initialize_alerts_storage)
+alert_store = None
+# Sondas del sistema (se crean en initialize_probes)
+probes = None
+# Detectores de anomalias por variable (seccion "detectores" de alerts_config.json)
+detector_bank = DetectorBank()
+last_detector_sample = None
+
 os.makedirs(LOG_DIR, exist_ok=True)
 logging.basicConfig(
     filename=os.path.join(LOG_DIR, 'alertas_manager_error.log'),
@@ -87,18 +103,12 @@ def initialize_alerts_config():
         sys.exit(1)
 
 def initialize_alerts_storage():
+    global alert_store
     try:
-        os.makedirs(os.path.dirname(ALERTS_STORAGE_HOME), exist_ok=True)
-        if not os.path.exists(ALERTS_STORAGE_HOME):
-            with open(ALERTS_STORAGE_HOME, 'w') as f:
-                json.dump([], f, indent=4)
-            os.chmod(ALERTS_STORAGE_HOME, 0o664)
-            user = pwd.getpwnam(getpass.getuser())
-            os.chown(ALERTS_STORAGE_HOME, user.pw_uid, user.pw_gid)
-            logger.info(f"Archivo de almacenamiento creado: {ALERTS_STORAGE_HOME}")
-            print(f"Archivo de almacenamiento creado: {ALERTS_STORAGE_HOME}")
-        else:
-            logger.debug(f"Archivo de almacenamiento ya existe: {ALERTS_STORAGE_HOME}")
+        alert_store = AlertStore()
+        alert_store.start_compactor()
+        logger.info(f"Registro de alertas listo: {len(alert_store.alerts())} alertas")
+        print(f"Registro de alertas listo: {len(alert_store.alerts())} alertas")
     except Exception as e:
         logger.error(f"Error inicializando almacenamiento: {e}", exc_info=True)
         print(f"Error inicializando almacenamiento: {e}")
@@ -118,32 +128,6 @@ def load_alerts_config():
         print(f"Error cargando configuracion: {e}")
         return {var: {"min": None, "max": None} for var in VARIABLES}
 
-def load_alerts_storage():
-    try:
-        with open(ALERTS_STORAGE_HOME, 'r') as f:
-            alerts = json.load(f)
-        logger.debug(f"Alertas cargadas: {len(alerts)} alertas")
-        return alerts
-    except Exception as e:
-        logger.error(f"Error cargando almacenamiento: {e}", exc_info=True)
-        print(f"Error cargando almacenamiento: {e}")
-        return []
-
-def save_alerts_storage(alerts):
-    try:
-        temp_file = ALERTS_STORAGE_HOME + '.tmp'
-        with open(temp_file, 'w') as f:
-            json.dump(alerts, f, indent=4)
-        os.replace(temp_file, ALERTS_STORAGE_HOME)
-        os.chmod(ALERTS_STORAGE_HOME, 0o664)
-        user = pwd.getpwnam(getpass.getuser())
-        os.chown(ALERTS_STORAGE_HOME, user.pw_uid, user.pw_gid)
-        logger.debug(f"Alertas guardadas: {len(alerts)} alertas")
-        print(f"Alertas guardadas en {ALERTS_STORAGE_HOME}")
-    except Exception as e:
-        logger.error(f"Error guardando alertas: {e}", exc_info=True)
-        print(f"Error guardando alertas: {e}")
-
 def update_heartbeat():
     try:
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -173,63 +157,84 @@ def check_raspberry_status():
         logger.error(f"Error verificando estado de Raspberry Pi: {e}", exc_info=True)
         return False
 
-def get_cpu_usage():
-    try:
-        usage = psutil.cpu_percent(interval=1)
-        logger.debug(f"Uso de CPU: {usage}%")
-        return usage
-    except Exception as e:
-        logger.error(f"Error obteniendo uso de CPU: {e}", exc_info=True)
-        print(f"Error obteniendo uso de CPU: {e}")
+def initialize_probes():
+    global probes
+    probes = system_probes.ProbeScheduler()
+    # cpu_percent(interval=None) mide desde la llamada anterior: la primera fija la referencia
+    system_probes.read_cpu_percent()
+    probes.register('cpu', system_probes.read_cpu_percent, PROBE_PERIODS['cpu'], delay=1)
+    probes.register('disco', system_probes.read_disk_usage, PROBE_PERIODS['disco'])
+    probes.register('temperatura', system_probes.read_temperature, PROBE_PERIODS['temperatura'])
+    probes.register('internet', system_probes.check_internet, PROBE_PERIODS['internet'])
+    probes.start()
+    print(f"Sondas del sistema iniciadas: {PROBE_PERIODS}")
+
+def get_probe_result(name):
+    """Ultimo ProbeResult en cache de la sonda, o None si aun no hay resultado o fallo."""
+    result = probes.latest(name)
+    if result is None or result.value is None:
+        logger.debug(f"Sin resultado de la sonda {name}")
         return None
+    return result
+
+def get_cpu_usage():
+    result = get_probe_result('cpu')
+    return result.value if result else None
 
 def get_disk_usage():
-    try:
-        usage = psutil.disk_usage('/')
-        percent = usage.percent
-        free_gb = usage.free / (1024**3)
-        logger.debug(f"Uso de disco: {percent}%, Espacio libre: {free_gb:.2f} GB")
-        return percent, free_gb
-    except Exception as e:
-        logger.error(f"Error obteniendo uso de disco: {e}", exc_info=True)
-        print(f"Error obteniendo uso de disco: {e}")
-        return None, None
+    result = get_probe_result('disco')
+    return result.value if result else (None, None)
 
 def get_temperature():
-    try:
-        result = subprocess.run(['vcgencmd', 'measure_temp'], capture_output=True, text=True, check=True)
-        temp_str = result.stdout.strip()
-        temp = float(temp_str.split('=')[1].replace("'C", ""))
-        logger.debug(f"Temperatura: {temp} C")
-        return temp
-    except Exception as e:
-        logger.error(f"Error al obtener la temperatura: {e}", exc_info=True)
-        print(f"Error al obtener la temperatura: {e}")
-        return None
+    result = get_probe_result('temperatura')
+    return result.value if result else None
 
 def check_internet():
-    try:
-        result = subprocess.run(['ping', '-c', '1', '8.8.8.8'], capture_output=True, text=True, timeout=5)
-        connected = result.returncode == 0
-        logger.debug(f"Internet conectado: {connected}")
-        return connected
-    except Exception as e:
-        logger.error(f"Error verificando Internet: {e}", exc_info=True)
-        print(f"Error verificando Internet: {e}")
-        return False
-        
+    """(conectado, momento de la medicion), o (None, None) si aun no hay resultado."""
+    result = get_probe_result('internet')
+    return (result.value, result.timestamp) if result else (None, None)
+
+
+def update_detectors(latest_data, config, active_alerts):
+    """Actualiza los detectores de cada variable con la muestra y abre o cierra sus alertas."""
+    timestamp_electric = latest_data['timestamp']
+    sample_time = timestamp_electric.timestamp()
+    timestamp = timestamp_electric.strftime("%Y-%m-%d %H:%M:%S")
+    for variable in VARIABLES:
+        detectors_config = config.get(variable, {}).get('detectores')
+        if not detectors_config or latest_data.get(variable) is None or pd.isna(latest_data[variable]):
+            continue
+        value = float(latest_data[variable])
+        for name, (anomalo, detalle) in detector_bank.update(variable, value, sample_time, detectors_config).items():
+            key = f"{variable}:{name}"
+            active = active_alerts.get(key)
+            if anomalo and not active:
+                alert = alert_store.open_alert(
+                    variable, timestamp, f"{PER_VARIABLE_NAME[variable]}: {DETECTOR_NAMES[name]} ({detalle})",
+                    value=value, clave=key
+                )
+                active_alerts[key] = alert
+                logger.info(f"Nueva alerta generada: {alert['message']}")
+                print(f"Nueva alerta generada: {alert['message']}")
+            elif anomalo:
+                alert_store.set_value(active['id'], value)
+            elif active:
+                alert_store.close_alert(active['id'], timestamp)
+                logger.info(f"Alerta finalizada: {active['message']}")
+                print(f"Alerta finalizada: {active['message']}")
+                active_alerts[key] = None
 
 def UPDATE_alerts():
     try:
         current_time = datetime.now()
         timestamp = current_time.strftime("%Y-%m-%d %H:%M:%S")
-        alerts = load_alerts_storage()
-        
-        # Inicializar alertas activas
+        # Indice en memoria de alertas activas (incluye eventos agregados por otros procesos)
+        alert_store.refresh()
         active_alerts = {var: None for var in VARIABLES + ['CPU', 'Disco_Uso', 'Disco_Libre', 'Temperatura', 'Internet', 'Sistema']}
-        for alert in alerts:
-            if not alert.get('end_time') and alert['variable'] in active_alerts:
-                active_alerts[alert['variable']] = alert
+        for variable, alert in alert_store.active_by_variable().items():
+            # Las alertas de detectores usan la clave "variable:detector"
+            if variable in active_alerts or variable.split(':')[0] in VARIABLES:
+                active_alerts[variable] = alert
 
         # Verificar estado de Raspberry Pi
         if not check_raspberry_status() and not active_alerts["Sistema"]:
@@ -240,79 +245,71 @@ def UPDATE_alerts():
                 "message": "Raspberry Pi inactiva",
                 "value": None
             }
-            alerts.insert(0, alert)
+            alert = alert_store.open_alert(**alert)
             active_alerts["Sistema"] = alert
             logger.info(f"Nueva alerta generada: {alert['message']}")
             print(f"Nueva alerta generada: {alert['message']}")
         elif check_raspberry_status() and active_alerts["Sistema"]:
-            active_alerts["Sistema"]["end_time"] = timestamp
-            active_alerts["Sistema"]["message"] = "Raspberry Pi inactiva"
-            logger.info(f"Alerta finalizada: {active_alerts['Sistema']['message']}")
-            print(f"Alerta finalizada: {active_alerts['Sistema']['message']}")
+            message = "Raspberry Pi inactiva"
+            alert_store.close_alert(active_alerts["Sistema"]["id"], timestamp, message)
+            logger.info(f"Alerta finalizada: {message}")
+            print(f"Alerta finalizada: {message}")
             active_alerts["Sistema"] = None
 
-        # Monitoreo de variables electricas
-        if os.path.exists(DATA_BUFFER_HOME):
-            if not os.access(DATA_BUFFER_HOME, os.R_OK):
-                logger.error(f"No hay permisos de lectura para {DATA_BUFFER_HOME}")
-                print(f"Error: No hay permisos de lectura para {DATA_BUFFER_HOME}")
-                return
+        # Monitoreo de variables electricas (solo la ultima muestra del colector)
+        latest_data = latest_sample.read_latest_sample()
+        if latest_data is None:
+            logger.warning("No hay una muestra reciente del medidor")
+        else:
             try:
-                df = pd.read_csv(DATA_BUFFER_HOME, dtype_backend='numpy_nullable')
-                logger.debug(f"Datos leidos: {len(df)} filas, columnas: {list(df.columns)}")
-                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                df = df.dropna(subset=['timestamp'])
-                if df.empty:
-                    logger.warning("No hay datos validos en data_buffer.csv")
-                else:
-                    latest_data = df.iloc[-1]
-                    timestamp_electric = latest_data['timestamp']
-                    config = load_alerts_config()
-                    
-                    for variable in VARIABLES:
-                        if variable not in latest_data or pd.isna(latest_data[variable]):
-                            logger.debug(f"No hay datos validos para {variable}")
-                            continue
-                        try:
-                            value = float(latest_data[variable])
-                        except (ValueError, TypeError) as e:
-                            logger.error(f"Error convirtiendo {variable} a float: {latest_data[variable]}, error: {e}")
-                            continue
-                        min_val = config.get(variable, {}).get('min')
-                        max_val = config.get(variable, {}).get('max')
-                        logger.debug(f"Verificando {variable}: valor={value}, min={min_val}, max={max_val}")
-                        if min_val is None or max_val is None:
-                            logger.debug(f"No hay rangos definidos para {variable}")
-                            continue
-                        if value < min_val or value > max_val:
-                            if not active_alerts[variable]:
-                                alert = {
-                                    'variable': variable,
-                                    'start_time': timestamp_electric.strftime("%Y-%m-%d %H:%M:%S"),
-                                    'end_time': None,
-                                    'message': f"Valor de la {PER_VARIABLE_NAME[variable]} fuera de rango",
-                                    'value': value
-                                }
-                                alerts.insert(0, alert)
-                                active_alerts[variable] = alert
-                                logger.info(f"Nueva alerta generada: {alert['message']}")
-                                print(f"Nueva alerta generada: {alert['message']}")
-                            else:
-                                active_alerts[variable]['value'] = value
-                                active_alerts[variable]['message'] = f"Valor de la {PER_VARIABLE_NAME[variable]} fuera de rango"
-                                logger.debug(f"Alerta activa actualizada para {variable}: {active_alerts[variable]['message']}")
+                timestamp_electric = latest_data['timestamp']
+                config = load_alerts_config()
+                
+                for variable in VARIABLES:
+                    if variable not in latest_data or pd.isna(latest_data[variable]):
+                        logger.debug(f"No hay datos validos para {variable}")
+                        continue
+                    try:
+                        value = float(latest_data[variable])
+                    except (ValueError, TypeError) as e:
+                        logger.error(f"Error convirtiendo {variable} a float: {latest_data[variable]}, error: {e}")
+                        continue
+                    min_val = config.get(variable, {}).get('min')
+                    max_val = config.get(variable, {}).get('max')
+                    logger.debug(f"Verificando {variable}: valor={value}, min={min_val}, max={max_val}")
+                    if min_val is None or max_val is None:
+                        logger.debug(f"No hay rangos definidos para {variable}")
+                        continue
+                    if value < min_val or value > max_val:
+                        if not active_alerts[variable]:
+                            alert = {
+                                'variable': variable,
+                                'start_time': timestamp_electric.strftime("%Y-%m-%d %H:%M:%S"),
+                                'end_time': None,
+                                'message': f"Valor de la {PER_VARIABLE_NAME[variable]} fuera de rango",
+                                'value': value
+                            }
+                            alert = alert_store.open_alert(**alert)
+                            active_alerts[variable] = alert
+                            logger.info(f"Nueva alerta generada: {alert['message']}")
+                            print(f"Nueva alerta generada: {alert['message']}")
                         else:
-                            if active_alerts[variable]:
-                                active_alerts[variable]['end_time'] = timestamp_electric.strftime("%Y-%m-%d %H:%M:%S")
-                                active_alerts[variable]['message'] = f"Valor de la {PER_VARIABLE_NAME[variable]} fuera de rango"
-                                logger.info(f"Alerta finalizada: {active_alerts[variable]['message']}")
-                                print(f"Alerta finalizada: {active_alerts[variable]['message']}")
-                                active_alerts[variable] = None
-            except pd.errors.EmptyDataError:
-                logger.warning("data_buffer.csv esta vacio")
-            except pd.errors.ParserError as e:
-                logger.error(f"Error parseando data_buffer.csv: {e}", exc_info=True)
-                print(f"Error parseando data_buffer.csv: {e}")
+                            # El ultimo valor se guarda al cerrar la alerta, no en cada lectura
+                            alert_store.set_value(active_alerts[variable]['id'], value)
+                            logger.debug(f"Alerta activa actualizada para {variable}: {active_alerts[variable]['message']}")
+                    else:
+                        if active_alerts[variable]:
+                            message = f"Valor de la {PER_VARIABLE_NAME[variable]} fuera de rango"
+                            alert_store.close_alert(active_alerts[variable]["id"], timestamp_electric.strftime("%Y-%m-%d %H:%M:%S"), message)
+                            logger.info(f"Alerta finalizada: {message}")
+                            print(f"Alerta finalizada: {message}")
+                            active_alerts[variable] = None
+
+                # Detectores de anomalias: solo con muestras nuevas
+                global last_detector_sample
+                if timestamp_electric != last_detector_sample:
+                    last_detector_sample = timestamp_electric
+                    update_detectors(latest_data, config, active_alerts)
             except Exception as e:
                 logger.error(f"Error procesando datos electricos: {e}", exc_info=True)
                 print(f"Error procesando datos electricos: {e}")
@@ -322,11 +319,11 @@ def UPDATE_alerts():
         if last_check_time is None or (current_time - last_check_time).total_seconds() >= VERIFICACION:
             logger.debug("Ejecutando monitoreo del sistema")
             # Internet
-            internet_connected = check_internet()
-            if not internet_connected:
+            internet_connected, internet_checked_time = check_internet()
+            if internet_connected is False:
                 if internet_disconnected_time is None:
-                    internet_disconnected_time = current_time
-            else:
+                    internet_disconnected_time = internet_checked_time
+            elif internet_connected:
                 if internet_disconnected_time is not None and not active_alerts["Internet"]:
                     alert = {
                         "variable": "Internet",
@@ -335,7 +332,7 @@ def UPDATE_alerts():
                         "message": "Conexion a Internet restablecida",
                         "value": None
                     }
-                    alerts.insert(0, alert)
+                    alert = alert_store.open_alert(**alert)
                     active_alerts["Internet"] = None
                     logger.info(f"Alerta finalizada: {alert['message']}")
                     print(f"Alerta finalizada: {alert['message']}")
@@ -352,15 +349,15 @@ def UPDATE_alerts():
                         "message": "Uso elevado del CPU",
                         "value": uso_cpu
                     }
-                    alerts.insert(0, alert)
+                    alert = alert_store.open_alert(**alert)
                     active_alerts["CPU"] = alert
                     logger.info(f"Nueva alerta generada: {alert['message']}")
                     print(f"Nueva alerta generada: {alert['message']}")
                 elif uso_cpu <= CPU_LIMITE and active_alerts["CPU"]:
-                    active_alerts["CPU"]["end_time"] = timestamp
-                    active_alerts["CPU"]["message"] = "Uso elevado del CPU"
-                    logger.info(f"Alerta finalizada: {active_alerts['CPU']['message']}")
-                    print(f"Alerta finalizada: {active_alerts['CPU']['message']}")
+                    message = "Uso elevado del CPU"
+                    alert_store.close_alert(active_alerts["CPU"]["id"], timestamp, message)
+                    logger.info(f"Alerta finalizada: {message}")
+                    print(f"Alerta finalizada: {message}")
                     active_alerts["CPU"] = None
 
             # Disco
@@ -374,15 +371,15 @@ def UPDATE_alerts():
                         "message": f"Alerta: Uso de disco elevado ({porcentaje_uso:.2f}%)",
                         "value": porcentaje_uso
                     }
-                    alerts.insert(0, alert)
+                    alert = alert_store.open_alert(**alert)
                     active_alerts["Disco_Uso"] = alert
                     logger.info(f"Nueva alerta generada: {alert['message']}")
                     print(f"Nueva alerta generada: {alert['message']}")
                 elif porcentaje_uso <= MEMORIA_RAM_LIMITE and active_alerts["Disco_Uso"]:
-                    active_alerts["Disco_Uso"]["end_time"] = timestamp
-                    active_alerts["Disco_Uso"]["message"] = f"Alerta finalizada: Uso de disco ({porcentaje_uso:.2f}%)"
-                    logger.info(f"Alerta finalizada: {active_alerts['Disco_Uso']['message']}")
-                    print(f"Alerta finalizada: {active_alerts['Disco_Uso']['message']}")
+                    message = f"Alerta finalizada: Uso de disco ({porcentaje_uso:.2f}%)"
+                    alert_store.close_alert(active_alerts["Disco_Uso"]["id"], timestamp, message)
+                    logger.info(f"Alerta finalizada: {message}")
+                    print(f"Alerta finalizada: {message}")
                     active_alerts["Disco_Uso"] = None
 
             if espacio_libre is not None:
@@ -396,15 +393,15 @@ def UPDATE_alerts():
                             "message": f"Alerta: Espacio libre en disco bajo ({espacio_libre:.2f} GB)",
                             "value": espacio_libre
                         }
-                        alerts.insert(0, alert)
+                        alert = alert_store.open_alert(**alert)
                         active_alerts["Disco_Libre"] = alert
                         logger.info(f"Nueva alerta generada: {alert['message']}")
                         print(f"Nueva alerta generada: {alert['message']}")
                     elif espacio_libre >= MEMORIA_LIBRE_LIMITE and active_alerts["Disco_Libre"]:
-                        active_alerts["Disco_Libre"]["end_time"] = timestamp
-                        active_alerts["Disco_Libre"]["message"] = f"Alerta finalizada: Espacio libre en disco ({espacio_libre:.2f} GB)"
-                        logger.info(f"Alerta finalizada: {active_alerts['Disco_Libre']['message']}")
-                        print(f"Alerta finalizada: {active_alerts['Disco_Libre']['message']}")
+                        message = f"Alerta finalizada: Espacio libre en disco ({espacio_libre:.2f} GB)"
+                        alert_store.close_alert(active_alerts["Disco_Libre"]["id"], timestamp, message)
+                        logger.info(f"Alerta finalizada: {message}")
+                        print(f"Alerta finalizada: {message}")
                         active_alerts["Disco_Libre"] = None
                     last_disk_free_check = current_time
 
@@ -419,21 +416,19 @@ def UPDATE_alerts():
                         "message": f"Alerta: Temperatura elevada ({temperatura:.2f} C)",
                         "value": temperatura
                     }
-                    alerts.insert(0, alert)
+                    alert = alert_store.open_alert(**alert)
                     active_alerts["Temperatura"] = alert
                     logger.info(f"Nueva alerta generada: {alert['message']}")
                     print(f"Nueva alerta generada: {alert['message']}")
                 elif temperatura <= TEMPERATURA_LIMITE and active_alerts["Temperatura"]:
-                    active_alerts["Temperatura"]["end_time"] = timestamp
-                    active_alerts["Temperatura"]["message"] = f"Alerta finalizada: Temperatura ({temperatura:.2f} C)"
-                    logger.info(f"Alerta finalizada: {active_alerts['Temperatura']['message']}")
-                    print(f"Alerta finalizada: {active_alerts['Temperatura']['message']}")
+                    message = f"Alerta finalizada: Temperatura ({temperatura:.2f} C)"
+                    alert_store.close_alert(active_alerts["Temperatura"]["id"], timestamp, message)
+                    logger.info(f"Alerta finalizada: {message}")
+                    print(f"Alerta finalizada: {message}")
                     active_alerts["Temperatura"] = None
 
             last_check_time = current_time
             logger.debug("Monitoreo del sistema completado")
-
-        save_alerts_storage(alerts)
     except Exception as e:
         logger.error(f"Error en UPDATE_alerts: {e}", exc_info=True)
         print(f"Error en UPDATE_alerts: {e}")
@@ -442,6 +437,7 @@ def main():
     check_dependencies()
     initialize_alerts_config()
     initialize_alerts_storage()
+    initialize_probes()
     global last_check_time, last_heartbeat_time, internet_disconnected_time, last_disk_free_check
     last_check_time = None
     last_heartbeat_time = None
@@ -452,15 +448,16 @@ def main():
         while True:
             current_time = datetime.now()
             UPDATE_alerts()
-            if os.path.exists(DATA_BUFFER_HOME):
-                current_mtime = os.path.getmtime(DATA_BUFFER_HOME)
+            latest_segment = buffer_segments.segment_path(current_time.date())
+            if os.path.exists(latest_segment):
+                current_mtime = os.path.getmtime(latest_segment)
                 if last_checked is None or current_mtime > last_checked:
-                    logger.debug(f"Detectado cambio en {DATA_BUFFER_HOME}, procesando...")
+                    logger.debug(f"Detectado cambio en {latest_segment}, procesando...")
                     last_checked = current_mtime
                 else:
-                    logger.debug(f"No hay cambios en {DATA_BUFFER_HOME}")
+                    logger.debug(f"No hay cambios en {latest_segment}")
             else:
-                logger.warning(f"No existe {DATA_BUFFER_HOME}")
+                logger.warning(f"No existe {latest_segment}")
             if last_heartbeat_time is None or (current_time - last_heartbeat_time).total_seconds() >= HEARTBEAT_INTERVAL:
                 update_heartbeat()
                 last_heartbeat_time = current_time
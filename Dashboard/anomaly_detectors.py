@@ -0,0 +1,177 @@
+# anomaly_detectors.py
+"""
+Detectores de anomalias por variable que se actualizan con cada muestra nueva,
+con memoria constante (no releen el historico).
+
+Se configuran en alerts_config.json junto a min/max, por ejemplo:
+  "Voltaje_fase_1": {
+      "min": 110, "max": 135,
+      "detectores": {
+          "zscore": {"umbral": 4, "ventana": 3600, "min_muestras": 60},
+          "ewma": {"alfa": 0.05, "umbral": 3, "min_muestras": 30},
+          "cambio": {"max_por_segundo": 5},
+          "sostenido": {"menor_que": 115, "segundos": 3}
+      }
+  }
+- zscore: media y desviacion estandar moviles (Welford con ventana aproximada).
+- ewma: media y varianza con promedio exponencial, responde mas rapido a cambios de nivel.
+- cambio: limite de la tasa de cambio entre muestras consecutivas (unidades por segundo).
+- sostenido: la condicion (mayor_que y/o menor_que) se cumple durante al menos 'segundos'.
+Cada detector devuelve (anomalo, detalle) en cada muestra.
+"""
+import json
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+class RollingStats:
+    """
+    Welford con ventana aproximada: al llegar a 'ventana' muestras el conteo deja de
+    crecer y las muestras anteriores pierden peso, con memoria constante.
+    """
+
+    def __init__(self, ventana=None):
+        self.ventana = ventana
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        if self.ventana and self.n >= self.ventana:
+            self.m2 *= (self.ventana - 1) / self.ventana
+        else:
+            self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+class ZScoreDetector:
+    def __init__(self, umbral=4.0, ventana=3600, min_muestras=60):
+        self.umbral = float(umbral)
+        self.min_muestras = int(min_muestras)
+        self.stats = RollingStats(int(ventana) if ventana else None)
+
+    def update(self, value, t):
+        anomalo = False
+        detalle = None
+        std = self.stats.std
+        if self.stats.n >= self.min_muestras and std > 0:
+            z = (value - self.stats.mean) / std
+            if abs(z) > self.umbral:
+                anomalo = True
+                detalle = f"z={z:.1f}, media {self.stats.mean:.2f}, desviacion {std:.2f}"
+        self.stats.add(value)
+        return anomalo, detalle
+
+class EwmaDetector:
+    def __init__(self, alfa=0.05, umbral=3.0, min_muestras=30):
+        self.alfa = float(alfa)
+        self.umbral = float(umbral)
+        self.min_muestras = int(min_muestras)
+        self.n = 0
+        self.mean = None
+        self.var = 0.0
+
+    def update(self, value, t):
+        self.n += 1
+        if self.mean is None:
+            self.mean = value
+            return False, None
+        diff = value - self.mean
+        anomalo = False
+        detalle = None
+        if self.n > self.min_muestras and self.var > 0:
+            z = diff / math.sqrt(self.var)
+            if abs(z) > self.umbral:
+                anomalo = True
+                detalle = f"z={z:.1f} sobre la media exponencial {self.mean:.2f}"
+        self.mean += self.alfa * diff
+        self.var = (1 - self.alfa) * (self.var + self.alfa * diff * diff)
+        return anomalo, detalle
+
+class RateOfChangeDetector:
+    def __init__(self, max_por_segundo):
+        self.max_por_segundo = float(max_por_segundo)
+        self.last = None
+
+    def update(self, value, t):
+        last, self.last = self.last, (value, t)
+        if last is None or t <= last[1]:
+            return False, None
+        rate = (value - last[0]) / (t - last[1])
+        if abs(rate) > self.max_por_segundo:
+            return True, f"cambio de {rate:+.2f} por segundo"
+        return False, None
+
+class SustainedDetector:
+    def __init__(self, segundos, mayor_que=None, menor_que=None):
+        if mayor_que is None and menor_que is None:
+            raise ValueError("sostenido requiere mayor_que o menor_que")
+        self.segundos = float(segundos)
+        self.mayor_que = mayor_que
+        self.menor_que = menor_que
+        self.since = None
+
+    def update(self, value, t):
+        condition = (self.mayor_que is not None and value > self.mayor_que) or \
+                    (self.menor_que is not None and value < self.menor_que)
+        if not condition:
+            self.since = None
+            return False, None
+        if self.since is None:
+            self.since = t
+        duration = t - self.since
+        if duration >= self.segundos:
+            limit = f"mayor que {self.mayor_que}" if self.mayor_que is not None and value > self.mayor_que else f"menor que {self.menor_que}"
+            return True, f"{limit} durante {duration:.0f} s"
+        return False, None
+
+DETECTOR_TYPES = {
+    'zscore': ZScoreDetector,
+    'ewma': EwmaDetector,
+    'cambio': RateOfChangeDetector,
+    'sostenido': SustainedDetector
+}
+
+DETECTOR_NAMES = {
+    'zscore': 'Desviacion respecto a la media movil',
+    'ewma': 'Desviacion respecto a la media exponencial',
+    'cambio': 'Cambio brusco',
+    'sostenido': 'Condicion sostenida'
+}
+
+def build_detectors(config):
+    """{nombre: detector} a partir de la seccion 'detectores' de una variable."""
+    detectors = {}
+    for name, params in (config or {}).items():
+        detector_type = DETECTOR_TYPES.get(name)
+        if detector_type is None:
+            logger.warning(f"Detector desconocido: {name}")
+            continue
+        try:
+            detectors[name] = detector_type(**(params or {}))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Configuracion invalida para el detector {name}: {params}, error: {e}")
+    return detectors
+
+class DetectorBank:
+    """Detectores por variable; se recrean (perdiendo su estado) solo si cambia su configuracion."""
+
+    def __init__(self):
+        self._detectors = {}
+
+    def update(self, variable, value, t, config):
+        """Actualiza los detectores de la variable con la muestra (t en segundos) y devuelve {nombre: (anomalo, detalle)}."""
+        key = json.dumps(config, sort_keys=True)
+        entry = self._detectors.get(variable)
+        if entry is None or entry[0] != key:
+            entry = (key, build_detectors(config))
+            self._detectors[variable] = entry
+            if entry[1]:
+                logger.info(f"Detectores para {variable}: {', '.join(entry[1])}")
+        return {name: detector.update(value, t) for name, detector in entry[1].items()}
@@ -0,0 +1,175 @@
+# buffer_cache.py
+"""
+Cache del buffer de datos compartido por todas las sesiones de Streamlit del proceso.
+
+Cada segmento diario se parsea una sola vez y se valida por tamano y mtime. Cuando
+el segmento activo crece solo se leen los bytes nuevos (lineas completas) y se
+agregan al DataFrame en cache, en lugar de volver a leer todo el buffer. Los
+segmentos cerrados (todos menos el del dia) se mantienen ya concatenados: al
+cambiar de dia se agrega el segmento que se cerro y al podar se recorta el inicio,
+asi cada actualizacion solo une ese bloque con el segmento activo. Los DataFrames
+devueltos son compartidos: quien los use no debe modificarlos en sitio.
+"""
+import io
+import os
+import threading
+import logging
+import pandas as pd
+import buffer_segments
+
+logger = logging.getLogger(__name__)
+
+class _SegmentEntry:
+    def __init__(self, columns, frame, offset, size, mtime):
+        self.columns = columns
+        self.frame = frame
+        self.offset = offset
+        self.size = size
+        self.mtime = mtime
+
+def _parse(data, columns=None):
+    """Parsea bytes CSV del buffer; con columns los datos no traen encabezado."""
+    if columns is None:
+        df = pd.read_csv(io.BytesIO(data))
+    else:
+        df = pd.read_csv(io.BytesIO(data), header=None, names=columns)
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce', format='ISO8601')
+        df = df.dropna(subset=['timestamp'])
+    return df
+
+class BufferCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._segments = {}
+        # Segmentos cerrados ya concatenados: claves (ruta, offset) en orden y filas de cada uno
+        self._closed_key = ()
+        self._closed_rows = []
+        self._closed_frame = pd.DataFrame()
+        self._combined = None
+        self._combined_key = None
+
+    def _load_segment(self, path, stat):
+        """Lee un segmento completo; solo se consumen las lineas terminadas en salto de linea."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        header_end = data.find(b'\n') + 1
+        if header_end == 0:
+            return None
+        columns = pd.read_csv(io.BytesIO(data[:header_end]), nrows=0).columns.tolist()
+        frame = _parse(data[header_end:end], columns) if end > header_end else pd.DataFrame(columns=columns)
+        return _SegmentEntry(columns, frame, end, stat.st_size, stat.st_mtime)
+
+    def _tail_segment(self, path, entry, stat):
+        """Agrega al segmento en cache solo las lineas nuevas desde el ultimo offset."""
+        with open(path, 'rb') as f:
+            f.seek(entry.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end > 0:
+            new_rows = _parse(data[:end], entry.columns)
+            if not new_rows.empty:
+                entry.frame = pd.concat([entry.frame, new_rows], ignore_index=True) if not entry.frame.empty else new_rows
+            entry.offset += end
+        entry.size = stat.st_size
+        entry.mtime = stat.st_mtime
+        return entry
+
+    def _refresh(self, paths):
+        for path in list(self._segments):
+            if path not in paths:
+                del self._segments[path]
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._segments.pop(path, None)
+                continue
+            entry = self._segments.get(path)
+            if entry is not None and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+                continue
+            try:
+                if entry is not None and stat.st_size > entry.offset:
+                    self._tail_segment(path, entry, stat)
+                else:
+                    # Segmento nuevo, truncado o reescrito: se vuelve a leer completo
+                    entry = self._load_segment(path, stat)
+                    if entry is None:
+                        self._segments.pop(path, None)
+                        continue
+                    self._segments[path] = entry
+            except (OSError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+                logger.error(f"Error leyendo segmento {path}: {e}")
+                self._segments.pop(path, None)
+
+    def _update_closed(self, key):
+        """Ajusta el bloque de segmentos cerrados a key agregando o recortando solo lo que cambio."""
+        if key == self._closed_key:
+            return
+        # Poda: los primeros segmentos del bloque ya no estan
+        dropped = 0
+        while dropped < len(self._closed_key) and self._closed_key[dropped:] != key[:len(self._closed_key) - dropped]:
+            dropped += 1
+        kept = len(self._closed_key) - dropped
+        if kept == 0 and self._closed_key:
+            # Ningun segmento se conserva igual (p. ej. uno cerrado se reescribio): se une todo de nuevo
+            frames = [self._segments[path].frame for path, _ in key]
+            self._closed_rows = [len(frame) for frame in frames]
+            frames = [frame for frame in frames if not frame.empty]
+            self._closed_frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            self._closed_key = key
+            return
+        frame = self._closed_frame.iloc[sum(self._closed_rows[:dropped]):]
+        rows = self._closed_rows[dropped:]
+        # Cambio de dia: se agregan los segmentos que se cerraron
+        new_frames = [self._segments[path].frame for path, _ in key[kept:]]
+        rows += [len(new_frame) for new_frame in new_frames]
+        frames = [f for f in [frame] + new_frames if not f.empty]
+        if len(frames) > 1:
+            frame = pd.concat(frames, ignore_index=True)
+        elif frames:
+            frame = frames[0]
+        else:
+            frame = pd.DataFrame()
+        self._closed_frame = frame
+        self._closed_rows = rows
+        self._closed_key = key
+
+    def get_buffer(self, since=None):
+        """DataFrame del buffer (desde la fecha del segmento de since, opcional) con timestamp ya convertido."""
+        with self._lock:
+            paths = buffer_segments.list_segments()
+            self._refresh(paths)
+            paths = [path for path in paths if path in self._segments]
+            if not paths:
+                return pd.DataFrame()
+            active = self._segments[paths[-1]]
+            self._update_closed(tuple((path, self._segments[path].offset) for path in paths[:-1]))
+            key = (self._closed_key, paths[-1], active.offset)
+            if since is None and key == self._combined_key:
+                return self._combined
+            if since is None:
+                closed = self._closed_frame
+            else:
+                # Solo los segmentos desde la fecha de since: se recorta el inicio del bloque cerrado
+                selected = set(buffer_segments.list_segments(since))
+                skipped = 0
+                for (path, _), rows in zip(self._closed_key, self._closed_rows):
+                    if path in selected:
+                        break
+                    skipped += rows
+                closed = self._closed_frame.iloc[skipped:]
+                if paths[-1] not in selected:
+                    return closed.reset_index(drop=True)
+            frames = [frame for frame in (closed, active.frame) if not frame.empty]
+            combined = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            if since is None:
+                self._combined = combined
+                self._combined_key = key
+            return combined
+
+_cache = BufferCache()
+
+def get_buffer(since=None):
+    return _cache.get_buffer(since)
@@ -0,0 +1,196 @@
+# buffer_segments.py
+"""
+Buffer de datos en segmentos diarios.
+
+Cada muestra se agrega al final del segmento del dia (data_buffer_YYYY-MM-DD.csv)
+y la retencion de 30 dias se aplica borrando segmentos completos, en lugar de
+leer, filtrar y reescribir todo el buffer en cada muestra.
+"""
+import os
+import csv
+import json
+import glob
+import getpass
+import pwd
+import logging
+from datetime import datetime, timedelta
+import pandas as pd
+from config import BUFFER_SEGMENTS_DIR, BUFFER_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "data_buffer_"
+SEGMENT_DATE_FORMAT = "%Y-%m-%d"
+
+def set_file_owner(path, mode=0o664):
+    os.chmod(path, mode)
+    user = pwd.getpwnam(getpass.getuser())
+    os.chown(path, user.pw_uid, user.pw_gid)
+
+def read_last_line(path, block_size=4096):
+    """Ultima linea completa (terminada en salto de linea) de un archivo de texto, o None."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        block = min(size, block_size)
+        f.seek(size - block)
+        tail = f.read(block)
+    lines = [line for line in tail.split(b'\n')[:-1] if line.strip()]
+    return lines[-1].decode('utf-8', errors='ignore').strip() if lines else None
+
+def segment_path(date):
+    return os.path.join(BUFFER_SEGMENTS_DIR, f"{SEGMENT_PREFIX}{date.strftime(SEGMENT_DATE_FORMAT)}.csv")
+
+def segment_date(path):
+    name = os.path.basename(path)
+    try:
+        return datetime.strptime(name[len(SEGMENT_PREFIX):-len('.csv')], SEGMENT_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+def list_segments(since=None):
+    """Devuelve los segmentos existentes ordenados por fecha, opcionalmente desde una fecha."""
+    since_date = since.date() if isinstance(since, datetime) else since
+    segments = []
+    for path in glob.glob(os.path.join(BUFFER_SEGMENTS_DIR, f"{SEGMENT_PREFIX}*.csv")):
+        date = segment_date(path)
+        if date is None:
+            logger.warning(f"Segmento con nombre invalido: {path}")
+            continue
+        if since_date is not None and date < since_date:
+            continue
+        segments.append((date, path))
+    return [path for _, path in sorted(segments)]
+
+def initialize_segments():
+    os.makedirs(BUFFER_SEGMENTS_DIR, exist_ok=True)
+    set_file_owner(BUFFER_SEGMENTS_DIR, 0o775)
+
+def append_row(timestamp, row, columns):
+    """Agrega una fila al segmento del dia; solo al crear un segmento nuevo se rotan los antiguos."""
+    path = segment_path(timestamp.date())
+    new_segment = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new_segment:
+            writer.writerow(columns)
+        writer.writerow([row.get(col) for col in columns])
+    if new_segment:
+        set_file_owner(path)
+        logger.info(f"Segmento {path} creado")
+        rotate_segments(timestamp)
+    return path
+
+def rotate_segments(now=None):
+    """Borra los segmentos que quedaron fuera de la ventana de retencion."""
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=BUFFER_RETENTION_DAYS)).date()
+    removed = 0
+    for path in list_segments():
+        if segment_date(path) < cutoff:
+            try:
+                os.remove(path)
+                removed += 1
+                logger.info(f"Segmento {path} eliminado por retencion")
+            except OSError as e:
+                logger.error(f"Error eliminando segmento {path}: {e}")
+    return removed
+
+def read_buffer(since=None, **read_csv_kwargs):
+    """Lee los segmentos (desde una fecha opcional) como un solo DataFrame con el formato de data_buffer.csv."""
+    frames = []
+    for path in list_segments(since):
+        try:
+            frames.append(pd.read_csv(path, **read_csv_kwargs))
+        except pd.errors.EmptyDataError:
+            logger.warning(f"Segmento vacio: {path}")
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def _copy_complete_lines(out, path, offset, write_header):
+    """Copia a out las lineas completas de un segmento desde offset; devuelve el nuevo offset."""
+    with open(path, 'rb') as f:
+        if offset == 0:
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                return 0
+            if write_header:
+                out.write(header)
+            offset = f.tell()
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    out.write(data[:end])
+    return offset + end
+
+def _rebuild_snapshot(destination, segments):
+    """Reescribe destination con todos los segmentos y devuelve los offsets copiados de cada uno."""
+    offsets = {}
+    temp_file = destination + '.tmp'
+    with open(temp_file, 'wb') as out:
+        for path in segments:
+            offsets[os.path.basename(path)] = _copy_complete_lines(out, path, 0, out.tell() == 0)
+    os.replace(temp_file, destination)
+    set_file_owner(destination)
+    logger.info(f"Segmentos exportados a {destination}")
+    return offsets
+
+def snapshot_csv(destination):
+    """
+    Mantiene destination como un CSV compatible con data_buffer.csv agregando solo
+    las lineas nuevas de cada segmento desde la copia anterior. Los offsets copiados
+    se guardan en destination + '.estado'; solo se reescribe completo si falta algun
+    segmento ya copiado (rotacion), un segmento se acorto o destination no coincide.
+    """
+    segments = list_segments()
+    if not segments:
+        logger.warning("No hay segmentos para exportar")
+        return False
+    state_file = destination + '.estado'
+    state = {}
+    if os.path.exists(state_file):
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Estado de copia invalido en {state_file}: {e}")
+    offsets = state.get('segmentos', {})
+    sizes = {os.path.basename(path): os.path.getsize(path) for path in segments}
+    incremental = (
+        offsets
+        and os.path.exists(destination)
+        and os.path.getsize(destination) == state.get('tamano')
+        and all(name in sizes and sizes[name] >= offset for name, offset in offsets.items())
+    )
+    if incremental:
+        with open(destination, 'ab') as out:
+            for path in segments:
+                name = os.path.basename(path)
+                offset = offsets.get(name, 0)
+                if offset < sizes[name]:
+                    offsets[name] = _copy_complete_lines(out, path, offset, out.tell() == 0)
+        logger.debug(f"Copia incremental de {destination}")
+    else:
+        offsets = _rebuild_snapshot(destination, segments)
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump({'segmentos': offsets, 'tamano': os.path.getsize(destination)}, f)
+    os.replace(temp_file, state_file)
+    return True
+
+def migrate_legacy_buffer(legacy_file, columns):
+    """Divide un data_buffer.csv anterior en segmentos diarios, solo si aun no hay segmentos."""
+    if not os.path.exists(legacy_file) or list_segments():
+        return False
+    df = pd.read_csv(legacy_file)
+    fechas = pd.to_datetime(df['timestamp'], errors='coerce')
+    df = df[fechas.notna()]
+    fechas = fechas[fechas.notna()]
+    for date, group in df.groupby(fechas.dt.date):
+        path = segment_path(date)
+        group.reindex(columns=columns).to_csv(path, index=False)
+        set_file_owner(path)
+    os.replace(legacy_file, legacy_file + '.migrado')
+    logger.info(f"{legacy_file} migrado a segmentos diarios ({len(df)} filas)")
+    return True
@@ -0,0 +1,63 @@
+# calendar_binning.py
+"""
+Agregacion por calendario con indices enteros.
+
+Los indices de dia, intervalo del dia, hora y dia de la semana se calculan con
+aritmetica entera sobre segundos desde 1970 (hora local, como en
+columnar_storage) y las sumas y conteos se acumulan con np.bincount en una
+matriz densa. No se generan cadenas por fila: las etiquetas (fechas, horas) se
+ponen solo al mostrar el resultado.
+"""
+import numpy as np
+
+DAY_SECONDS = 86400
+# 1970-01-01 fue jueves (lunes = 0)
+EPOCH_WEEKDAY = 3
+
+def epoch_seconds(fechas):
+    """Segundos enteros desde 1970 de una serie o arreglo de fechas (sin zona horaria)."""
+    return np.asarray(fechas, dtype='datetime64[s]').astype(np.int64)
+
+def day_index(t, first_day):
+    """Dias transcurridos desde first_day (segundos de su medianoche)."""
+    return (t - first_day) // DAY_SECONDS
+
+def slot_index(t, slot_seconds=900):
+    """Intervalo del dia (0 .. 86400 / slot_seconds - 1)."""
+    return (t % DAY_SECONDS) // slot_seconds
+
+def hour_index(t):
+    return slot_index(t, 3600)
+
+def weekday_index(t):
+    """Dia de la semana, lunes = 0."""
+    return (t // DAY_SECONDS + EPOCH_WEEKDAY) % 7
+
+def bin_2d(rows, cols, values, shape):
+    """(sumas, conteos) de values por celda (fila, columna) en una matriz shape; se ignoran NaN e indices fuera de rango."""
+    n_rows, n_cols = shape
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    mask = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols) & ~np.isnan(values)
+    index = rows[mask] * n_cols + cols[mask]
+    sums = np.bincount(index, weights=values[mask], minlength=n_rows * n_cols)
+    counts = np.bincount(index, minlength=n_rows * n_cols)
+    return sums.reshape(shape), counts.reshape(shape)
+
+def mean_grid(sums, counts):
+    """Media por celda; NaN donde no hay muestras."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+def day_slot_grid(t, values, first_day, days, slot_seconds=900):
+    """(sumas, conteos) de 'days' dias desde first_day por intervalo de slot_seconds."""
+    return bin_2d(day_index(t, first_day), slot_index(t, slot_seconds), values, (days, DAY_SECONDS // slot_seconds))
+
+def weekday_slot_grid(t, values, slot_seconds=900):
+    """(sumas, conteos) por dia de la semana (lunes primero) e intervalo de slot_seconds."""
+    return bin_2d(weekday_index(t), slot_index(t, slot_seconds), values, (7, DAY_SECONDS // slot_seconds))
+
+def weekday_hour_grid(t, values):
+    """(sumas, conteos) por dia de la semana y hora del dia."""
+    return bin_2d(weekday_index(t), hour_index(t), values, (7, 24))
@@ -0,0 +1,155 @@
+# columnar_storage.py
+"""
+Almacenamiento binario por columnas para las muestras del medidor.
+
+Cada variable guarda un archivo por dia en BINARY_DATA_DIR/YYYY-MM-DD/<variable>.bin
+con registros de ancho fijo: segundos desde 1970 (int64, hora local sin zona) y el
+valor (float32, NaN si no hubo lectura valida). Los archivos se pueden mapear en
+memoria directamente como arreglos de NumPy.
+
+Los .txt por hora en BASE_DIR siguen disponibles como exportacion opcional
+(TXT_EXPORT_ENABLED en config.py o "python columnar_storage.py exportar YYYY-MM-DD").
+"""
+import os
+import sys
+import struct
+import getpass
+import pwd
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from config import BASE_DIR, BINARY_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+RECORD_DTYPE = np.dtype([('t', '<i8'), ('v', '<f4')])
+RECORD_STRUCT = struct.Struct('<qf')
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(timestamp):
+    return int((timestamp - EPOCH).total_seconds())
+
+def day_file_path(variable, date):
+    return os.path.join(BINARY_DATA_DIR, date.strftime('%Y-%m-%d'), f"{variable.lower()}.bin")
+
+def has_day(variable, date):
+    return os.path.exists(day_file_path(variable, date))
+
+def _ensure_directory(directory):
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+        os.chmod(directory, 0o775)
+        user = pwd.getpwnam(getpass.getuser())
+        os.chown(directory, user.pw_uid, user.pw_gid)
+
+def append_samples(timestamp, values, fsync=True):
+    """Agrega un registro por variable al archivo del dia. Los valores None se guardan como NaN."""
+    directory = os.path.join(BINARY_DATA_DIR, timestamp.strftime('%Y-%m-%d'))
+    _ensure_directory(directory)
+    epoch = to_epoch(timestamp)
+    for variable, value in values.items():
+        file_path = day_file_path(variable, timestamp)
+        new_file = not os.path.exists(file_path)
+        with open(file_path, 'ab') as f:
+            f.write(RECORD_STRUCT.pack(epoch, float('nan') if value is None else value))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if new_file:
+            os.chmod(file_path, 0o664)
+            user = pwd.getpwnam(getpass.getuser())
+            os.chown(file_path, user.pw_uid, user.pw_gid)
+
+def truncate_partial_record(variable, date):
+    """Quita un registro a medias al final del archivo del dia (escritura interrumpida); devuelve True si recorto."""
+    file_path = day_file_path(variable, date)
+    if not os.path.exists(file_path):
+        return False
+    size = os.path.getsize(file_path)
+    if size % RECORD_STRUCT.size == 0:
+        return False
+    os.truncate(file_path, size - size % RECORD_STRUCT.size)
+    logger.warning(f"Registro incompleto eliminado al final de {file_path}")
+    return True
+
+def last_timestamp(variable, date):
+    """Segundos desde 1970 del ultimo registro completo del archivo del dia, o None."""
+    file_path = day_file_path(variable, date)
+    if not os.path.exists(file_path):
+        return None
+    size = os.path.getsize(file_path) // RECORD_STRUCT.size * RECORD_STRUCT.size
+    if size == 0:
+        return None
+    with open(file_path, 'rb') as f:
+        f.seek(size - RECORD_STRUCT.size)
+        return RECORD_STRUCT.unpack(f.read(RECORD_STRUCT.size))[0]
+
+def load_day(variable, date):
+    """Mapea en memoria los registros de un dia; un registro incompleto al final se ignora."""
+    file_path = day_file_path(variable, date)
+    if not os.path.exists(file_path):
+        return np.empty(0, dtype=RECORD_DTYPE)
+    count = os.path.getsize(file_path) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(file_path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+def read_range(variable, start, end):
+    """Devuelve un DataFrame fecha/valor con las muestras validas entre start y end (inclusivos)."""
+    start = pd.Timestamp(start).to_pydatetime()
+    end = pd.Timestamp(end).to_pydatetime()
+    start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+    chunks = []
+    date = start.date()
+    while date <= end.date():
+        records = load_day(variable, date)
+        if records.size:
+            t = records['t']
+            mask = (t >= start_epoch) & (t <= end_epoch) & ~np.isnan(records['v'])
+            if mask.any():
+                chunks.append(np.array(records[mask]))
+        date += timedelta(days=1)
+    if not chunks:
+        return pd.DataFrame(columns=['fecha', 'valor'])
+    records = np.concatenate(chunks)
+    records = records[np.argsort(records['t'], kind='stable')]
+    return pd.DataFrame({
+        'fecha': pd.to_datetime(records['t'], unit='s'),
+        'valor': records['v'].astype('float64')
+    })
+
+def read_hour(variable, hour):
+    hour = hour.replace(minute=0, second=0, microsecond=0)
+    return read_range(variable, hour, hour + timedelta(hours=1) - timedelta(seconds=1))
+
+def export_day_to_txt(date, variables, base_dir=BASE_DIR):
+    """Regenera los .txt por hora de un dia (BASE_DIR/YYYY-MM-DD/<variable>/YYYY-MM-DD HH.txt)."""
+    exported = 0
+    date_str = date.strftime('%Y-%m-%d')
+    for variable in variables:
+        records = load_day(variable, date)
+        if not records.size:
+            continue
+        directory = os.path.join(base_dir, date_str, variable.lower())
+        _ensure_directory(directory)
+        fechas = pd.to_datetime(records['t'], unit='s')
+        lines = {}
+        for fecha, value in zip(fechas, records['v']):
+            text_value = 'None' if np.isnan(value) else repr(float(value))
+            lines.setdefault(fecha.strftime('%Y-%m-%d %H'), []).append(f"{fecha:%Y-%m-%d %H:%M:%S},{text_value}\n")
+        for hour_str, hour_lines in lines.items():
+            file_path = os.path.join(directory, f"{hour_str}.txt")
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.writelines(hour_lines)
+            os.chmod(file_path, 0o664)
+            exported += 1
+    logger.info(f"Exportados {exported} archivos .txt para {date_str}")
+    return exported
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != 'exportar':
+        print("Uso: python columnar_storage.py exportar YYYY-MM-DD")
+        sys.exit(1)
+    from data_collector import VARIABLES
+    print(f"Archivos exportados: {export_day_to_txt(datetime.strptime(sys.argv[2], '%Y-%m-%d').date(), VARIABLES)}")
@@ -4,7 +4,44 @@ BASE_DIR = "/home/pi/Desktop/Medidor/Rasp_Greco"
 # Archivos de configuracion y datos
 CONSUMO_CONFIG_FILE = "/home/pi/Desktop/Medidor/Dashboard/consumo_config.pkl"
 CONSUMO_CSV_FILE = "/home/pi/Desktop/Medidor/Dashboard/consumo_metrics.csv"
-HEATMAP_DATA_FILE = "/home/pi/Desktop/Medidor/Dashboard/heatmap_data.pkl"
-STATISTICS_CONFIG_FILE = "/home/pi/Desktop/Medidor/Dashboard/statistics_config.pkl"
+# Mapa de calor guardado como matriz y etiquetas (.npz), no como figura
+HEATMAP_DATA_FILE = "/home/pi/Desktop/Medidor/Dashboard/heatmap_data.npz"
+# Mapas de calor precalculados de cada variable (ultimos 8 dias y perfil semanal)
+HEATMAP_GRIDS_DIR = "/home/pi/Desktop/Medidor/Dashboard/heatmaps"
+HEATMAP_PROFILE_WEEKS = 8
 STATISTICS_OUTPUT_DIR = "/home/pi/Desktop/Medidor/Dashboard/statistics_outputs"
+# Resultados de estadisticas por (variables, rango, diezmado), un JSON por consulta
+STATISTICS_CACHE_DIR = "/home/pi/Desktop/Medidor/Dashboard/statistics_outputs/cache"
 LOG_DIR = "/home/pi/logs"
+# Buffer de datos en segmentos diarios
+BUFFER_SEGMENTS_DIR = "/home/pi/Desktop/Medidor/Dashboard/buffer_segments"
+BUFFER_RETENTION_DAYS = 30
+# Almacenamiento binario por columnas (un archivo por variable por dia)
+BINARY_DATA_DIR = "/home/pi/Desktop/Medidor/Rasp_Greco_bin"
+# Seguir escribiendo los .txt por hora en BASE_DIR (los usa el correo con el zip diario)
+TXT_EXPORT_ENABLED = True
+# Registro de escritura anticipada (WAL) de las muestras crudas del colector
+SAMPLE_WAL_DIR = "/home/pi/Desktop/Medidor/Dashboard/wal"
+# Catalogo de archivos por hora (variable, fecha, hora) para no recorrer BASE_DIR en cada consulta
+DATA_CATALOG_FILE = "/home/pi/Desktop/Medidor/Dashboard/data_catalog.db"
+# Maximos de demanda por hora y por dia (se actualiza al cerrar cada hora)
+DEMAND_SUMMARY_FILE = "/home/pi/Desktop/Medidor/Dashboard/demanda_maxima.json"
+# Agregados por minuto, 15 minutos, hora y dia para las graficas
+ROLLUPS_FILE = "/home/pi/Desktop/Medidor/Dashboard/rollups.db"
+# Metodo de reduccion de puntos por grafica: 'm4' (conserva picos) o 'lttb' (conserva la forma)
+DOWNSAMPLING_METHODS = {
+    "tiempo_real": "m4",
+    "historico": "lttb"
+}
+# Estado del enlace Modbus (lo publica el colector, unico proceso que abre el puerto serie)
+MODBUS_STATUS_FILE = "/home/pi/Desktop/Medidor/Dashboard/modbus_status.json"
+# Ultima muestra valida del buffer (la escribe el colector de forma atomica)
+LATEST_SAMPLE_FILE = "/home/pi/Desktop/Medidor/Dashboard/latest.json"
+# Alertas: registro de eventos (abrir/cerrar/borrar), indice para consultas paginadas y resumen por variable
+ALERTS_STORAGE_FILE = "/home/pi/Desktop/Medidor/Dashboard/alerts_storage.json"
+ALERTS_EVENTS_FILE = "/home/pi/Desktop/Medidor/Dashboard/alerts_events.jsonl"
+ALERTS_INDEX_FILE = "/home/pi/Desktop/Medidor/Dashboard/alerts_index.db"
+ALERTS_SUMMARY_FILE = "/home/pi/Desktop/Medidor/Dashboard/alerts_summary.json"
+# Retencion del historial de alertas (las alertas activas nunca se eliminan)
+ALERTS_RETENTION_DAYS = 180
+ALERTS_MAX_COUNT = 5000
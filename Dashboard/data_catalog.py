@@ -0,0 +1,229 @@
+# data_catalog.py
+"""
+Catalogo persistente de los archivos de datos por hora.
+
+Guarda en SQLite una fila por (variable, fecha, hora, formato) con la ruta, el tamano
+y el mtime del archivo, para que el dashboard responda consultas por rango sin
+recorrer BASE_DIR con os.walk. El colector registra cada hora nueva al abrirla y
+actualiza la hora anterior al cerrarla. Formatos: 'txt' (BASE_DIR/YYYY-MM-DD/<variable>/
+YYYY-MM-DD HH.txt) y 'bin' (archivo diario de columnar_storage).
+
+La primera consulta o registro sobre un catalogo sin construir (nuevo, o de una version
+anterior del esquema) recorre las carpetas una vez con rebuild(); la tabla estado guarda
+la version con la que se construyo.
+
+Si el catalogo se pierde o queda desfasado: "python data_catalog.py reconstruir".
+"""
+import os
+import re
+import sys
+import sqlite3
+import logging
+from contextlib import closing
+from datetime import datetime, timedelta
+import numpy as np
+import columnar_storage
+from buffer_segments import set_file_owner
+from config import BASE_DIR, BINARY_DATA_DIR, DATA_CATALOG_FILE
+
+logger = logging.getLogger(__name__)
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+HOUR_FILE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2}) (\d{2})\.txt$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archivos (
+    variable TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    hora INTEGER NOT NULL,
+    formato TEXT NOT NULL,
+    ruta TEXT NOT NULL,
+    tamano INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (variable, fecha, hora, formato)
+)
+"""
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS estado (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+)
+"""
+
+# Se incrementa si cambia lo que se cataloga; un catalogo construido con otra version se reconstruye
+CATALOG_VERSION = '2'
+FORMATS = ('txt', 'bin')
+
+# True cuando ya se verifico en este proceso que el catalogo esta construido
+_built = False
+
+def _connect():
+    new_file = not os.path.exists(DATA_CATALOG_FILE)
+    conn = sqlite3.connect(DATA_CATALOG_FILE, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    conn.execute(STATE_SCHEMA)
+    if new_file:
+        try:
+            set_file_owner(DATA_CATALOG_FILE)
+        except OSError as e:
+            logger.warning(f"No se pudo ajustar permisos de {DATA_CATALOG_FILE}: {e}")
+    return conn
+
+def catalog_exists():
+    return os.path.exists(DATA_CATALOG_FILE)
+
+def _entry(variable, fecha, hora, formato, ruta):
+    """Fila del catalogo para un archivo existente, o None si el archivo no existe."""
+    try:
+        stat = os.stat(ruta)
+    except OSError:
+        return None
+    return (variable.lower(), fecha, hora, formato, ruta, stat.st_size, stat.st_mtime)
+
+def _hour_entries(variable, hour, formats=FORMATS):
+    fecha = hour.strftime('%Y-%m-%d')
+    entries = []
+    if 'txt' in formats:
+        entries.append(_entry(variable, fecha, hour.hour, 'txt',
+                              os.path.join(BASE_DIR, fecha, variable.lower(), f"{hour.strftime('%Y-%m-%d %H')}.txt")))
+    if 'bin' in formats:
+        entries.append(_entry(variable, fecha, hour.hour, 'bin', columnar_storage.day_file_path(variable, hour)))
+    return [entry for entry in entries if entry is not None]
+
+def _upsert(conn, entries):
+    conn.executemany(
+        "INSERT OR REPLACE INTO archivos (variable, fecha, hora, formato, ruta, tamano, mtime) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", entries)
+
+def register_hour(hour, variables, previous_hour=None, formats=FORMATS):
+    """Registra los archivos de la hora que se abre y refresca tamano/mtime de la hora que se cierra."""
+    # Un catalogo nuevo se construye antes con el historial que ya esta en disco
+    ensure_catalog()
+    hour = hour.replace(minute=0, second=0, microsecond=0)
+    entries = []
+    for variable in variables:
+        entries.extend(_hour_entries(variable, hour, formats))
+        if previous_hour is not None:
+            entries.extend(_hour_entries(variable, previous_hour.replace(minute=0, second=0, microsecond=0), formats))
+    with closing(_connect()) as conn, conn:
+        _upsert(conn, entries)
+    logger.info(f"Catalogo actualizado para {hour:%Y-%m-%d %H} ({len(entries)} archivos)")
+    return len(entries)
+
+def _scan_text_files():
+    if not os.path.isdir(BASE_DIR):
+        return
+    for date_dir in os.listdir(BASE_DIR):
+        date_path = os.path.join(BASE_DIR, date_dir)
+        if not DATE_PATTERN.match(date_dir) or not os.path.isdir(date_path):
+            continue
+        for variable_dir in os.listdir(date_path):
+            variable_path = os.path.join(date_path, variable_dir)
+            if not os.path.isdir(variable_path):
+                continue
+            for file_name in os.listdir(variable_path):
+                match = HOUR_FILE_PATTERN.match(file_name)
+                if not match or match.group(1) != date_dir:
+                    continue
+                entry = _entry(variable_dir, date_dir, int(match.group(2)), 'txt', os.path.join(variable_path, file_name))
+                if entry:
+                    yield entry
+
+def _scan_binary_files():
+    if not os.path.isdir(BINARY_DATA_DIR):
+        return
+    for date_dir in os.listdir(BINARY_DATA_DIR):
+        date_path = os.path.join(BINARY_DATA_DIR, date_dir)
+        if not DATE_PATTERN.match(date_dir) or not os.path.isdir(date_path):
+            continue
+        date = datetime.strptime(date_dir, '%Y-%m-%d').date()
+        for file_name in os.listdir(date_path):
+            if not file_name.endswith('.bin'):
+                continue
+            variable = file_name[:-len('.bin')]
+            records = columnar_storage.load_day(variable, date)
+            if not records.size:
+                continue
+            # Horas con al menos un registro en el archivo del dia
+            day_start = columnar_storage.to_epoch(datetime.combine(date, datetime.min.time()))
+            hours = np.unique((records['t'] - day_start) // 3600)
+            for hora in hours[(hours >= 0) & (hours < 24)]:
+                entry = _entry(variable, date_dir, int(hora), 'bin', os.path.join(date_path, file_name))
+                if entry:
+                    yield entry
+
+def rebuild():
+    """Reconstruye el catalogo completo recorriendo BASE_DIR y BINARY_DATA_DIR una sola vez."""
+    entries = list(_scan_text_files()) + list(_scan_binary_files())
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM archivos")
+        _upsert(conn, entries)
+        conn.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('construido', ?)", (CATALOG_VERSION,))
+    logger.info(f"Catalogo reconstruido: {len(entries)} archivos")
+    return len(entries)
+
+def is_built():
+    """True si el catalogo se construyo completo con la version actual."""
+    if not catalog_exists():
+        return False
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT valor FROM estado WHERE clave = 'construido'").fetchone()
+    return row is not None and row[0] == CATALOG_VERSION
+
+def ensure_catalog():
+    """Construye el catalogo una vez si no existe o no se construyo con la version actual."""
+    global _built
+    if _built:
+        return
+    if not is_built():
+        logger.warning(f"Catalogo {DATA_CATALOG_FILE} sin construir o de otra version, reconstruyendo")
+        rebuild()
+    _built = True
+
+def _query(sql, params=()):
+    ensure_catalog()
+    with closing(_connect()) as conn:
+        return conn.execute(sql, params).fetchall()
+
+def list_files(variable, start=None, end=None, formato='txt'):
+    """Devuelve [(hora, ruta)] ordenados de los archivos de una variable cuyas horas caen en [start, end]."""
+    sql = "SELECT fecha, hora, ruta FROM archivos WHERE variable = ? AND formato = ?"
+    params = [variable.lower(), formato]
+    if start is not None:
+        start = start.replace(minute=0, second=0, microsecond=0)
+        sql += " AND (fecha > ? OR (fecha = ? AND hora >= ?))"
+        params += [start.strftime('%Y-%m-%d'), start.strftime('%Y-%m-%d'), start.hour]
+    if end is not None:
+        sql += " AND (fecha < ? OR (fecha = ? AND hora <= ?))"
+        params += [end.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), end.hour]
+    sql += " ORDER BY fecha, hora"
+    return [(datetime.strptime(fecha, '%Y-%m-%d') + timedelta(hours=hora), ruta)
+            for fecha, hora, ruta in _query(sql, params)]
+
+def list_dates(variable, exclude_hour=None):
+    """Fechas con datos de una variable (cualquier formato), opcionalmente sin contar una hora (la actual)."""
+    sql = "SELECT DISTINCT fecha FROM archivos WHERE variable = ?"
+    params = [variable.lower()]
+    if exclude_hour is not None:
+        sql += " AND NOT (fecha = ? AND hora = ?)"
+        params += [exclude_hour.strftime('%Y-%m-%d'), exclude_hour.hour]
+    sql += " ORDER BY fecha"
+    return [datetime.strptime(fecha, '%Y-%m-%d').date() for (fecha,) in _query(sql, params)]
+
+def list_variables():
+    """Variables (en minusculas) con al menos un archivo catalogado."""
+    return [variable for (variable,) in _query("SELECT DISTINCT variable FROM archivos ORDER BY variable")]
+
+def has_data(variable, start_date, end_date):
+    rows = _query(
+        "SELECT 1 FROM archivos WHERE variable = ? AND fecha BETWEEN ? AND ? LIMIT 1",
+        (variable.lower(), start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+    return bool(rows)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != 'reconstruir':
+        print("Uso: python data_catalog.py reconstruir")
+        sys.exit(1)
+    print(f"Archivos catalogados: {rebuild()}")
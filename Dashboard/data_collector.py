@@ -1,13 +1,22 @@
 from pymodbus.client.sync import ModbusSerialClient
-import time
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import datetime
 import os
 import logging
 import csv
 import struct
 import getpass
 import pwd
+import buffer_segments
+import columnar_storage
+import data_catalog
+import rollups
+import latest_sample
+from acquisition import Sink, SampleBus
+from sampling_scheduler import SamplingScheduler
+from hourly_files import HourlyFileWriter
+from sample_wal import SampleWAL
+from modbus_manager import ModbusLink
+from config import TXT_EXPORT_ENABLED, SAMPLE_WAL_DIR
 
 VARIABLES = [
     'Corriente_linea1', 'Voltaje_fase_1', 'Potencia_activa_f1', 'Potencia_activa_Total',
@@ -52,6 +61,37 @@ REGISTERS = {
     'Energia_importada_activa_total': 45099,
     'Energia_importada_reactiva_total': 45103
 }
+MODBUS_MAX_REGISTERS = 125  # Maximo de registros por lectura que caben en una PDU de Modbus
+MODBUS_MAX_GAP = 32  # Registros sin usar que conviene leer de mas para unir dos lecturas
+REGISTER_WIDTH = 2  # Cada variable es un float de 32 bits (2 registros)
+SAMPLE_PERIOD = 5  # Segundos entre lecturas de las variables electricas
+# Grupos de registros con su periodo de lectura (segundos enteros, alineados al reloj).
+# Las variables de un grupo que no toca conservan su ultima lectura en el buffer.
+SAMPLING_GROUPS = {
+    'electricas': {
+        'periodo': SAMPLE_PERIOD,
+        'variables': ['Corriente_linea1', 'Voltaje_fase_1', 'Potencia_activa_f1', 'Potencia_activa_Total',
+                      'Potencia_aparente_total', 'Factor_Potencia', 'frecuencia']
+    },
+    'energia': {
+        'periodo': 60,
+        'variables': ['Energia_importada_activa_total', 'Energia_importada_reactiva_total']
+    }
+}
+PERSISTENT_BUFFER_INTERVAL = 60  # Segundos entre copias incrementales del buffer persistente
+# Sincronizacion agrupada de los .txt por hora (las muestras quedan confirmadas antes en el WAL)
+TXT_COMMIT_INTERVAL = 30  # Segundos
+TXT_COMMIT_SAMPLES = 12  # Escrituras
+WAL_FSYNC_SAMPLES = 1  # Muestras entre fsync del WAL (una muestra esta confirmada al sincronizarse)
+# Cola, lote y espera maxima (segundos) de cada consumidor de muestras
+SINK_SETTINGS = {
+    'wal': {'max_queue': 720, 'batch_size': 1, 'max_wait': 0},
+    'alertas': {'max_queue': 10, 'batch_size': 10, 'max_wait': 0},
+    'buffer': {'max_queue': 720, 'batch_size': 1, 'max_wait': 0},
+    'binario': {'max_queue': 720, 'batch_size': 12, 'max_wait': 60},
+    'texto': {'max_queue': 720, 'batch_size': 6, 'max_wait': 30},
+    'agregados': {'max_queue': 720, 'batch_size': 12, 'max_wait': 60}
+}
 
 os.makedirs("/home/pi/logs", exist_ok=True)
 logging.basicConfig(
@@ -61,12 +101,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def read_registers(client, address, unit=4):
+def read_registers(client, address, unit=4, variable=None):
     try:
         request = client.read_holding_registers(address, 2, unit=unit)
         if request.isError():
             raise ValueError(f"Error de lectura: {request}")
-        variable = next((var for var, reg in REGISTERS.items() if reg == address), None)
         value = struct.unpack('>f', struct.pack('>HH', request.registers[0], request.registers[1]))[0]
         logger.debug(f"Lectura exitosa en {address} ({variable}): {value}")
         print(f"Lectura en {address} ({variable}): {value}")
@@ -76,6 +115,52 @@ def read_registers(client, address, unit=4):
         print(f"Error en {address}: {e}")
         return None
 
+def plan_register_blocks(registers, max_count=MODBUS_MAX_REGISTERS, max_gap=MODBUS_MAX_GAP):
+    """Agrupa los registros en el menor numero de lecturas contiguas que caben en una PDU."""
+    blocks = []
+    for variable, address in sorted(registers.items(), key=lambda item: item[1]):
+        if blocks:
+            block = blocks[-1]
+            block_end = block['start'] + block['count']
+            new_count = address + REGISTER_WIDTH - block['start']
+            if address - block_end <= max_gap and new_count <= max_count:
+                block['count'] = max(block['count'], new_count)
+                block['variables'].append((variable, address - block['start']))
+                continue
+        blocks.append({'start': address, 'count': REGISTER_WIDTH, 'variables': [(variable, 0)]})
+    for block in blocks:
+        # Un solo formato por bloque para decodificar todos los floats con una llamada
+        fmt = '>'
+        position = 0
+        for _, offset in block['variables']:
+            fmt += f"{(offset - position) * 2}x" if offset > position else ''
+            fmt += 'f'
+            position = offset + REGISTER_WIDTH
+        block['struct'] = struct.Struct(fmt)
+        logger.debug(f"Bloque Modbus {block['start']}+{block['count']}: {[var for var, _ in block['variables']]}")
+    return blocks
+
+def read_register_blocks(client, blocks, unit=4):
+    """Lee cada bloque en una sola transaccion y devuelve {variable: valor}; None si no se pudo leer."""
+    values = {}
+    for block in blocks:
+        variables = [var for var, _ in block['variables']]
+        try:
+            request = client.read_holding_registers(block['start'], block['count'], unit=unit)
+            if request.isError():
+                raise ValueError(f"Error de lectura: {request}")
+            raw = struct.pack(f">{block['count']}H", *request.registers[:block['count']])
+            decoded = block['struct'].unpack_from(raw)
+            values.update(zip(variables, decoded))
+            logger.debug(f"Lectura exitosa del bloque {block['start']}+{block['count']}: {dict(zip(variables, decoded))}")
+        except Exception as e:
+            # Algunos medidores rechazan leer direcciones sin mapear: leer variable por variable
+            logger.error(f"Error leyendo bloque {block['start']}+{block['count']}, se leera por variable: {e}")
+            print(f"Error en bloque {block['start']}+{block['count']}: {e}")
+            for variable, offset in block['variables']:
+                values[variable] = read_registers(client, block['start'] + offset, unit=unit, variable=variable)
+    return values
+
 def convert_factor_potencia(fpr):
     try:
         if 0 <= fpr <= 1:
@@ -123,15 +208,11 @@ def initialize_csv_buffer():
         current_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
         for variable in VARIABLES:
             get_file_path(variable, current_date, current_hour)
-        if not os.path.exists(DATA_BUFFER_FILE):
-            with open(DATA_BUFFER_FILE, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp'] + VARIABLES)
-            os.chmod(DATA_BUFFER_FILE, 0o664)
-            user = pwd.getpwnam(getpass.getuser())
-            os.chown(DATA_BUFFER_FILE, user.pw_uid, user.pw_gid)
-            logger.info(f"Archivo {DATA_BUFFER_FILE} creado")
-            print(f"Archivo {DATA_BUFFER_FILE} creado")
+        buffer_segments.initialize_segments()
+        if buffer_segments.migrate_legacy_buffer(DATA_BUFFER_FILE, ['timestamp'] + VARIABLES):
+            logger.info(f"Archivo {DATA_BUFFER_FILE} migrado a segmentos diarios")
+            print(f"Archivo {DATA_BUFFER_FILE} migrado a segmentos diarios")
+        buffer_segments.rotate_segments()
         if not os.path.exists(PERSISTENT_BUFFER_FILE):
             with open(PERSISTENT_BUFFER_FILE, 'w', newline='') as f:
                 writer = csv.writer(f)
@@ -146,53 +227,248 @@ def initialize_csv_buffer():
         print(f"Error inicializando CSV o carpetas: {e}")
         raise
 
+def build_buffer_row(data, timestamp):
+    row = {'timestamp': timestamp.strftime("%Y-%m-%d %H:%M:%S")}
+    for var in VARIABLES:
+        row[var] = data.get(var, None)
+    return row
+
 def save_to_csv_buffer(data, timestamp):
     try:
-        temp_file = DATA_BUFFER_FILE + '.tmp'
-        row = {'timestamp': timestamp.strftime("%Y-%m-%d %H:%M:%S")}
-        for var in VARIABLES:
-            row[var] = data.get(var, None)
+        row = build_buffer_row(data, timestamp)
         logger.debug(f"Datos a guardar en CSV: {row}")
         print(f"Datos a guardar en CSV: {row}")
-        df = pd.DataFrame([row], columns=['timestamp'] + VARIABLES)
-        if os.path.exists(DATA_BUFFER_FILE):
-            existing_df = pd.read_csv(DATA_BUFFER_FILE)
-            existing_df['timestamp'] = pd.to_datetime(existing_df['timestamp'], errors='coerce')
-            one_month_ago = timestamp - timedelta(days=30)
-            existing_df = existing_df[existing_df['timestamp'] >= one_month_ago].dropna(subset=['timestamp'])
-            df = pd.concat([existing_df, df], ignore_index=True)
-            logger.debug(f"Datos existentes en CSV: {len(existing_df)} filas")
-            print(f"Datos existentes en CSV: {len(existing_df)} filas")
-        else:
-            logger.info(f"Creando nuevo archivo {DATA_BUFFER_FILE}")
-            print(f"Creando nuevo archivo {DATA_BUFFER_FILE}")
-        df.to_csv(temp_file, index=False)
-        os.rename(temp_file, DATA_BUFFER_FILE)
-        os.chmod(DATA_BUFFER_FILE, 0o664)
-        user = pwd.getpwnam(getpass.getuser())
-        os.chown(DATA_BUFFER_FILE, user.pw_uid, user.pw_gid)
-        logger.info(f"Datos guardados en {DATA_BUFFER_FILE}: {row}")
-        print(f"Datos guardados en {DATA_BUFFER_FILE}: {row}")
+        segment = buffer_segments.append_row(timestamp, row, ['timestamp'] + VARIABLES)
+        logger.info(f"Datos guardados en {segment}: {row}")
+        print(f"Datos guardados en {segment}: {row}")
     except Exception as e:
-        logger.error(f"Error guardando en {DATA_BUFFER_FILE}: {e}", exc_info=True)
-        print(f"Error guardando en {DATA_BUFFER_FILE}: {e}")
+        logger.error(f"Error guardando en el buffer de segmentos: {e}", exc_info=True)
+        print(f"Error guardando en el buffer de segmentos: {e}")
         raise
 
 def update_persistent_buffer():
     try:
-        if os.path.exists(DATA_BUFFER_FILE):
-            df = pd.read_csv(DATA_BUFFER_FILE)
-            df.to_csv(PERSISTENT_BUFFER_FILE, index=False)
-            os.chmod(PERSISTENT_BUFFER_FILE, 0o664)
-            user = pwd.getpwnam(getpass.getuser())
-            os.chown(PERSISTENT_BUFFER_FILE, user.pw_uid, user.pw_gid)
+        if buffer_segments.snapshot_csv(PERSISTENT_BUFFER_FILE):
             logger.info(f"Buffer persistente actualizado en {PERSISTENT_BUFFER_FILE}")
             print(f"Buffer persistente actualizado en {PERSISTENT_BUFFER_FILE}")
     except Exception as e:
         logger.error(f"Error actualizando buffer persistente: {e}", exc_info=True)
         print(f"Error actualizando buffer persistente: {e}")
 
-def connect_modbus():
+# Consumidores de muestras. Cada muestra es un dict con 'timestamp', 'data' (todas las variables),
+# 'values' (las que se leyeron, para almacenamiento y agregados) y 'valid' (se leyeron todas).
+
+class AlertFeedWriter:
+    """Ultima muestra valida para alertas_manager; de cada lote solo se escribe la mas reciente."""
+
+    def write_batch(self, batch):
+        valid = [sample for sample in batch if sample['valid']]
+        if valid:
+            latest_sample.write_latest_sample(build_buffer_row(valid[-1]['data'], valid[-1]['timestamp']))
+
+class BufferWriter:
+    """Segmentos diarios del buffer (solo muestras validas) y copia periodica del buffer persistente."""
+
+    def __init__(self):
+        self.last_persistent_update = datetime.now()
+
+    def write_batch(self, batch):
+        for sample in batch:
+            if sample['valid']:
+                save_to_csv_buffer(sample['data'], sample['timestamp'])
+            else:
+                logger.warning("No se guardaron datos en el buffer debido a valores no validos")
+                print("No se guardaron datos en el buffer debido a valores no validos")
+        timestamp = batch[-1]['timestamp']
+        if (timestamp - self.last_persistent_update).total_seconds() >= PERSISTENT_BUFFER_INTERVAL:
+            update_persistent_buffer()
+            self.last_persistent_update = timestamp
+
+    def recover(self, samples):
+        """Agrega al segmento de cada dia las muestras validas posteriores a su ultima fila."""
+        last_rows = {}
+        recovered = 0
+        for sample in samples:
+            if not sample['valid']:
+                continue
+            date = sample['timestamp'].date()
+            if date not in last_rows:
+                last_rows[date] = read_last_timestamp(buffer_segments.segment_path(date))
+            if last_rows[date] is None or sample['timestamp'] > last_rows[date]:
+                save_to_csv_buffer(sample['data'], sample['timestamp'])
+                last_rows[date] = sample['timestamp']
+                recovered += 1
+        return recovered
+
+class BinaryWriter:
+    """Almacenamiento binario por columnas con un solo fsync por lote; registra cada hora nueva en el catalogo."""
+
+    def __init__(self):
+        self.cataloged_hour = None
+
+    def write_batch(self, batch):
+        for i, sample in enumerate(batch):
+            columnar_storage.append_samples(sample['timestamp'], sample['values'], fsync=i == len(batch) - 1)
+        # El binario siempre se escribe (con o sin .txt): sus horas se catalogan aqui
+        hour = batch[-1]['timestamp'].replace(minute=0, second=0, microsecond=0)
+        if hour != self.cataloged_hour:
+            data_catalog.register_hour(hour, VARIABLES, self.cataloged_hour, formats=('bin',))
+            self.cataloged_hour = hour
+
+    def recover(self, samples):
+        """Agrega a cada archivo binario los valores posteriores a su ultimo registro."""
+        last_records = {}
+        pending = []
+        for sample in samples:
+            epoch = columnar_storage.to_epoch(sample['timestamp'])
+            values = {}
+            for variable, value in sample['values'].items():
+                key = (variable, sample['timestamp'].date())
+                if key not in last_records:
+                    columnar_storage.truncate_partial_record(variable, key[1])
+                    last_records[key] = columnar_storage.last_timestamp(variable, key[1])
+                if last_records[key] is None or epoch > last_records[key]:
+                    values[variable] = value
+                    last_records[key] = epoch
+            if values:
+                pending.append(dict(sample, values=values))
+        if pending:
+            self.write_batch(pending)
+        return len(pending)
+
+class TextWriter:
+    """
+    Archivos .txt por hora con los archivos de la hora abiertos y fsync agrupado
+    (hourly_files); registra cada hora nueva en el catalogo.
+    """
+
+    def __init__(self):
+        self.files = HourlyFileWriter(TXT_COMMIT_INTERVAL, TXT_COMMIT_SAMPLES)
+        self.paths = {}
+        self.current_hour = None
+        self.cataloged_hour = None
+
+    def _path(self, variable, hour):
+        path = self.paths.get(variable)
+        if path is None:
+            path = self.paths[variable] = get_file_path(variable, hour.date(), hour)
+        return path
+
+    def write_batch(self, batch):
+        for sample in batch:
+            hour = sample['timestamp'].replace(minute=0, second=0, microsecond=0)
+            if hour != self.current_hour:
+                # Cerrar los archivos de la hora anterior antes de abrir los de la nueva
+                self.files.close_files()
+                self.paths = {}
+                self.current_hour = hour
+            entries = []
+            for variable, value in sample['values'].items():
+                text_value = value if value is not None else 'None'
+                entries.append((self._path(variable, hour), f"{sample['timestamp']:%Y-%m-%d %H:%M:%S},{text_value}\n"))
+            if entries:
+                self.files.write(entries)
+            logger.debug(f"Datos escritos para {len(entries)} variables: {sample['timestamp']}")
+            if hour != self.cataloged_hour:
+                # Registrar los archivos de la hora nueva y cerrar los de la anterior en el catalogo
+                data_catalog.register_hour(hour, VARIABLES, self.cataloged_hour, formats=('txt',))
+                self.cataloged_hour = hour
+
+    def recover(self, samples):
+        """Agrega a cada archivo por hora las lineas posteriores a su ultima linea."""
+        last_lines = {}
+        pending = []
+        for sample in samples:
+            hour = sample['timestamp'].replace(minute=0, second=0, microsecond=0)
+            values = {}
+            for variable, value in sample['values'].items():
+                path = get_file_path(variable, hour.date(), hour)
+                if path not in last_lines:
+                    last_lines[path] = read_last_timestamp(path)
+                if last_lines[path] is None or sample['timestamp'] > last_lines[path]:
+                    values[variable] = value
+                    last_lines[path] = sample['timestamp']
+            if values:
+                pending.append(dict(sample, values=values))
+        if pending:
+            self.write_batch(pending)
+            self.files.close_files()
+        return len(pending)
+
+    def close(self):
+        self.files.close()
+
+class RollupFeed:
+    """Agregados por minuto/15 minutos/hora/dia; el minuto pendiente se guarda al cerrar."""
+
+    def __init__(self):
+        self.writer = rollups.RollupWriter()
+
+    def write_batch(self, batch):
+        for sample in batch:
+            self.writer.add(sample['timestamp'], sample['values'])
+
+    def recover(self, samples):
+        """Reaplica las muestras de los minutos que no se alcanzaron a guardar (el minuto queda pendiente en memoria)."""
+        last_minutes = rollups.last_minutes()
+        recovered = 0
+        for sample in samples:
+            minute = columnar_storage.to_epoch(sample['timestamp']) // 60 * 60
+            values = {variable: value for variable, value in sample['values'].items()
+                      if minute > last_minutes.get(variable.lower(), -1)}
+            if values:
+                self.writer.add(sample['timestamp'], values)
+                recovered += 1
+        return recovered
+
+    def close(self):
+        self.writer.flush()
+
+def read_last_timestamp(path):
+    """Timestamp de la ultima linea completa de un .txt por hora o de un segmento del buffer, o None."""
+    if not os.path.exists(path):
+        return None
+    last = buffer_segments.read_last_line(path)
+    try:
+        return datetime.strptime(last.split(',', 1)[0], "%Y-%m-%d %H:%M:%S") if last else None
+    except ValueError:
+        # Encabezado del segmento sin filas
+        return None
+
+def recover_from_wal(wal, writers):
+    """Reaplica en cada consumidor las muestras del WAL que no alcanzo a guardar antes de un corte."""
+    samples = wal.read_samples()
+    if not samples:
+        return
+    for name, writer in writers.items():
+        recover = getattr(writer, 'recover', None)
+        if recover is None:
+            continue
+        try:
+            recovered = recover(samples)
+            logger.info(f"Consumidor {name}: {recovered} muestras recuperadas del WAL")
+            print(f"Consumidor {name}: {recovered} muestras recuperadas del WAL")
+        except Exception as e:
+            logger.error(f"Error recuperando el consumidor {name} desde el WAL: {e}", exc_info=True)
+            print(f"Error recuperando el consumidor {name} desde el WAL: {e}")
+
+def create_sample_bus():
+    wal = SampleWAL(SAMPLE_WAL_DIR, VARIABLES, WAL_FSYNC_SAMPLES)
+    writers = {
+        'wal': wal,
+        'alertas': AlertFeedWriter(),
+        'buffer': BufferWriter(),
+        'binario': BinaryWriter(),
+        'agregados': RollupFeed()
+    }
+    if TXT_EXPORT_ENABLED:
+        writers['texto'] = TextWriter()
+    # Antes de aceptar muestras nuevas: el WAL tiene todo lo confirmado antes del ultimo corte
+    recover_from_wal(wal, writers)
+    return SampleBus([Sink(name, writer, **SINK_SETTINGS[name]) for name, writer in writers.items()])
+
+def create_modbus_link():
+    """Enlace con el medidor; se conecta (y reconecta) desde el bucle principal."""
     client = ModbusSerialClient(
         method="rtu",
         port="/dev/ttyUSB0",
@@ -202,99 +478,90 @@ def connect_modbus():
         baudrate=38400,
         timeout=3
     )
-    max_attempts = 3
-    for attempt in range(max_attempts):
-        try:
-            if client.connect():
-                logger.info("Conexion Modbus establecida correctamente")
-                return client
-            else:
-                logger.error(f"Intento de conexion {attempt + 1} fallido")
-        except Exception as e:
-            logger.error(f"Intento de conexion {attempt + 1} fallido: {e}")
-        if attempt < max_attempts - 1:
-            time.sleep(2)
-    logger.error("No se pudo conectar al medidor despues de %d intentos", max_attempts)
-    return None
-    
+    return ModbusLink(client)
+
+def plan_sampling_groups():
+    """{grupo: (periodo, registros, bloques Modbus)}; los registros sin grupo se leen con el primero."""
+    assigned = {variable for group in SAMPLING_GROUPS.values() for variable in group['variables']}
+    missing = [variable for variable in REGISTERS if variable not in assigned]
+    if missing:
+        logger.warning(f"Registros sin grupo de lectura, se leeran con el primer grupo: {missing}")
+    groups = {}
+    for i, (name, group) in enumerate(SAMPLING_GROUPS.items()):
+        variables = group['variables'] + (missing if i == 0 else [])
+        registers = {variable: REGISTERS[variable] for variable in variables if variable in REGISTERS}
+        groups[name] = (group['periodo'], registers, plan_register_blocks(registers))
+        logger.info(f"Grupo {name}: {len(registers)} registros cada {group['periodo']} s en {len(groups[name][2])} lecturas Modbus")
+    return groups
+
+def read_sample(client, register_blocks, registers, timestamp, last_values):
+    """Lee los registros que tocan y arma la muestra que se publica a los consumidores."""
+    data = {'timestamp': timestamp}
+    readings = read_register_blocks(client, register_blocks)
+    for variable, register in registers.items():
+        value = readings.get(variable)
+        logger.debug(f"{variable}: {value}")
+        print(f"{variable}: {value}")
+        if value is None:
+            logger.warning(f"No se pudo leer {variable} desde el registro {register}")
+            print(f"No se pudo leer {variable} desde el registro {register}")
+        else:
+            last_values[variable] = value
+    samples = {variable: readings[variable] for variable in registers if readings.get(variable) is not None}
+    if 'Factor_Potencia' in registers:
+        # Procesar Factor_Potencia_Conversion
+        fpc = convert_factor_potencia(readings['Factor_Potencia']) if readings.get('Factor_Potencia') is not None else None
+        samples['Factor_Potencia_Conversion'] = fpc
+        if fpc is not None:
+            last_values['Factor_Potencia_Conversion'] = fpc
+    # Las variables de grupos que no tocan en este tick conservan su ultima lectura
+    for variable in VARIABLES:
+        if variable in registers:
+            data[variable] = readings.get(variable)
+        elif variable == 'Factor_Potencia_Conversion' and 'Factor_Potencia' in registers:
+            data[variable] = samples['Factor_Potencia_Conversion']
+        else:
+            data[variable] = last_values.get(variable)
+    valid_data = all(data[variable] is not None for variable in REGISTERS)
+    return {'timestamp': timestamp, 'data': data, 'values': samples, 'valid': valid_data}
 
 def main():
-    client = connect_modbus()
-    if not client:
-        logger.error("No se pudo conectar al medidor. Terminando programa.")
-        print("No se pudo conectar al medidor. Terminando programa.")
-        return
+    # Si el medidor no responde el colector sigue corriendo y reintenta con espera exponencial
+    link = create_modbus_link()
+    link.ensure_connected()
     initialize_csv_buffer()
-    current_date = datetime.now().date()
+    groups = plan_sampling_groups()
+    scheduler = SamplingScheduler({name: period for name, (period, _, _) in groups.items()})
     current_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
-    last_persistent_update = datetime.now()
+    last_values = {}
+    bus = create_sample_bus()
+    bus.start()
+    # El productor solo lee el medidor y publica; las escrituras a disco ocurren en los consumidores
     try:
         while True:
-            timestamp = datetime.now()
-            new_date = timestamp.date()
+            # La hora de la muestra es la del tick programado (multiplo exacto del periodo)
+            timestamp, due, missed = scheduler.wait_next()
+            if missed:
+                print(f"{missed} lecturas perdidas antes de {timestamp}")
             new_hour = timestamp.replace(minute=0, second=0, microsecond=0)
-            if new_date != current_date or new_hour != current_hour:
-                current_date = new_date
+            if new_hour != current_hour:
                 current_hour = new_hour
-                logger.info(f"Nueva fecha/hora: {current_date}, {current_hour}")
-                print(f"Nueva fecha/hora: {current_date}, {current_hour}")
-            data = {'timestamp': timestamp}
-            valid_data = True
-            # Leer variables del medidor
-            for variable, register in REGISTERS.items():
-                value = read_registers(client, register)
-                logger.debug(f"{variable}: {value}")
-                print(f"{variable}: {value}")
-                if value is not None:
-                    data[variable] = value
-                    file_path = get_file_path(variable, current_date, current_hour)
-                    try:
-                        with open(file_path, 'a', encoding='utf-8') as f:
-                            f.write(f"{timestamp:%Y-%m-%d %H:%M:%S},{value}\n")
-                            f.flush()
-                            os.fsync(f.fileno())
-                        os.chmod(file_path, 0o664)
-                        user = pwd.getpwnam(getpass.getuser())
-                        os.chown(file_path, user.pw_uid, user.pw_gid)
-                        logger.debug(f"Datos escritos para {variable} en {file_path}: {timestamp}, {value}")
-                        print(f"Datos escritos para {variable} en {file_path}: {timestamp}, {value}")
-                    except Exception as e:
-                        logger.error(f"Error escribiendo datos para {variable} en {file_path}: {e}")
-                        print(f"Error escribiendo datos para {variable} en {file_path}: {e}")
-                        valid_data = False
-                else:
-                    data[variable] = None
-                    valid_data = False
-                    logger.warning(f"No se pudo leer {variable} desde el registro {register}")
-                    print(f"No se pudo leer {variable} desde el registro {register}")
-            # Procesar Factor_Potencia_Conversion
-            variable = 'Factor_Potencia_Conversion'
-            file_path = get_file_path(variable, current_date, current_hour)
-            fpc = convert_factor_potencia(data.get('Factor_Potencia')) if data.get('Factor_Potencia') is not None else None
-            data[variable] = fpc
-            try:
-                with open(file_path, 'a', encoding='utf-8') as f:
-                    f.write(f"{timestamp:%Y-%m-%d %H:%M:%S},{fpc if fpc is not None else 'None'}\n")
-                    f.flush()
-                    os.fsync(f.fileno())
-                os.chmod(file_path, 0o664)
-                user = pwd.getpwnam(getpass.getuser())
-                os.chown(file_path, user.pw_uid, user.pw_gid)
-                logger.debug(f"Datos escritos para {variable} en {file_path}: {timestamp}, {fpc if fpc is not None else 'None'}")
-                print(f"Datos escritos para {variable} en {file_path}: {timestamp}, {fpc if fpc is not None else 'None'}")
-            except Exception as e:
-                logger.error(f"Error escribiendo datos para {variable} en {file_path}: {e}")
-                print(f"Error escribiendo datos para {variable} en {file_path}: {e}")
-                valid_data = False
-            if valid_data:
-                save_to_csv_buffer(data, timestamp)
-            else:
-                logger.warning("No se guardaron datos en el buffer debido a valores no validos")
-                print("No se guardaron datos en el buffer debido a valores no validos")
-            if (timestamp - last_persistent_update).total_seconds() >= 300:
-                update_persistent_buffer()
-                last_persistent_update = timestamp
-            time.sleep(5)
+                logger.info(f"Nueva fecha/hora: {current_hour.date()}, {current_hour}")
+                print(f"Nueva fecha/hora: {current_hour.date()}, {current_hour}")
+                logger.info(f"Estado de los consumidores: {bus.stats()}, lecturas: {scheduler.stats()}, enlace: {link.status()['registros']}")
+            if any(variable not in last_values for variable in REGISTERS):
+                # Hasta leer cada registro al menos una vez se leen todos los grupos, para que el
+                # buffer tenga todas las variables desde el inicio (aunque fallen las primeras lecturas)
+                due = list(groups)
+            registers = {}
+            register_blocks = []
+            for name in due:
+                registers.update(groups[name][1])
+                register_blocks.extend(groups[name][2])
+            if link.ensure_connected():
+                bus.publish(read_sample(link, register_blocks, registers, timestamp, last_values))
+            # Sin enlace no se toca el puerto ni se publica la muestra (queda un hueco, como con el colector detenido)
+            link.write_status()
     except KeyboardInterrupt:
         logger.info("Programa terminado por el usuario")
         print("Programa terminado por el usuario")
@@ -302,8 +569,10 @@ def main():
         logger.error(f"Error en el bucle principal: {e}", exc_info=True)
         print(f"Error en el bucle principal: {e}")
     finally:
-        if client:
-            client.close()
+        # Vaciar las colas y guardar los agregados pendientes
+        bus.stop()
+        logger.info(f"Estado final de los consumidores: {bus.stats()}, lecturas: {scheduler.stats()}")
+        link.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+# demand_summary.py
+"""
+Resumen persistente de maximos de demanda (Potencia_activa_Total).
+
+Guarda en DEMAND_SUMMARY_FILE el maximo y su fecha/hora por cada hora cerrada y por
+cada dia. Una hora se cierra CLOSE_GRACE despues de terminar, cuando los sinks del
+colector (que escriben por lotes) ya la bajaron a disco; las horas cerradas sin
+datos quedan pendientes y se vuelven a leer mientras esten en HOUR_RETENTION_DAYS
+(p. ej. si la recuperacion desde el WAL las completa). La demanda maxima de un
+periodo de facturacion se obtiene de los maximos diarios mas las horas sin cerrar.
+"""
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+import pandas as pd
+import columnar_storage
+import data_catalog
+import txt_reader
+from buffer_segments import set_file_owner
+from config import DEMAND_SUMMARY_FILE
+
+logger = logging.getLogger(__name__)
+
+DEMANDA_VARIABLE = 'Potencia_activa_Total'
+HOUR_FORMAT = '%Y-%m-%d %H'
+DAY_FORMAT = '%Y-%m-%d'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Los maximos por hora solo hacen falta para el dia en curso; se guardan unos dias para consulta
+HOUR_RETENTION_DAYS = 7
+# Espera tras el fin de una hora antes de cerrarla; mayor que el max_wait mas largo de los
+# sinks del colector (60 s) mas el commit por grupos de los .txt
+CLOSE_GRACE = timedelta(minutes=5)
+
+def _empty_summary():
+    return {'variable': DEMANDA_VARIABLE, 'ultima_hora': None, 'horas': {}, 'dias': {}, 'pendientes': []}
+
+def load_summary():
+    try:
+        if os.path.exists(DEMAND_SUMMARY_FILE):
+            with open(DEMAND_SUMMARY_FILE, 'r') as f:
+                summary = json.load(f)
+            if summary.get('variable') == DEMANDA_VARIABLE:
+                return summary
+            logger.warning(f"Resumen de demanda de otra variable en {DEMAND_SUMMARY_FILE}, se reinicia")
+    except (OSError, ValueError) as e:
+        logger.error(f"Error al cargar {DEMAND_SUMMARY_FILE}: {e}")
+    return _empty_summary()
+
+def save_summary(summary):
+    os.makedirs(os.path.dirname(DEMAND_SUMMARY_FILE), exist_ok=True)
+    temp_file = DEMAND_SUMMARY_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(summary, f)
+    os.replace(temp_file, DEMAND_SUMMARY_FILE)
+    set_file_owner(DEMAND_SUMMARY_FILE)
+
+def read_hour(hour):
+    """Muestras de una hora desde el almacenamiento binario o, si no hay, desde el .txt catalogado."""
+    if columnar_storage.has_day(DEMANDA_VARIABLE, hour.date()):
+        return columnar_storage.read_hour(DEMANDA_VARIABLE, hour)
+    paths = [path for _, path in data_catalog.list_files(DEMANDA_VARIABLE, hour, hour)]
+    if not paths:
+        return pd.DataFrame(columns=['fecha', 'valor'])
+    return txt_reader.read_txt_files(paths)
+
+def hour_peak(hour):
+    """(maximo, fecha) de una hora, o None si no hay datos."""
+    df = read_hour(hour)
+    if df.empty:
+        return None
+    idx = df['valor'].idxmax()
+    return float(df.at[idx, 'valor']), df.at[idx, 'fecha'].strftime(TIMESTAMP_FORMAT)
+
+def _first_hour():
+    dates = data_catalog.list_dates(DEMANDA_VARIABLE)
+    if not dates:
+        return None
+    return datetime.combine(dates[0], datetime.min.time())
+
+def _add_peak(summary, hour, peak):
+    summary['horas'][hour.strftime(HOUR_FORMAT)] = peak
+    day_key = hour.strftime(DAY_FORMAT)
+    day_peak = summary['dias'].get(day_key)
+    if day_peak is None or peak[0] > day_peak[0]:
+        summary['dias'][day_key] = peak
+
+def _open_hours(summary, now):
+    """Horas que todavia no se cierran, desde la siguiente a ultima_hora hasta la hora en curso."""
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    if not summary['ultima_hora']:
+        return [current_hour - timedelta(hours=1), current_hour]
+    hour = datetime.strptime(summary['ultima_hora'], HOUR_FORMAT) + timedelta(hours=1)
+    hours = []
+    while hour <= current_hour:
+        hours.append(hour)
+        hour += timedelta(hours=1)
+    return hours
+
+def update_summary(now=None):
+    """Procesa las horas cerradas (y las pendientes sin datos) desde la ultima actualizacion y guarda el resumen."""
+    now = now or datetime.now()
+    summary = load_summary()
+    summary.setdefault('pendientes', [])
+    if summary['ultima_hora']:
+        hour = datetime.strptime(summary['ultima_hora'], HOUR_FORMAT) + timedelta(hours=1)
+    else:
+        hour = _first_hour()
+        if hour is None:
+            logger.warning(f"No hay datos de {DEMANDA_VARIABLE} para el resumen de demanda")
+            return summary
+    cutoff = (now - timedelta(days=HOUR_RETENTION_DAYS)).strftime(HOUR_FORMAT)
+    changed = False
+    pending = []
+    for key in summary['pendientes']:
+        if key < cutoff:
+            changed = True
+            continue
+        peak = hour_peak(datetime.strptime(key, HOUR_FORMAT))
+        if peak is None:
+            pending.append(key)
+        else:
+            _add_peak(summary, datetime.strptime(key, HOUR_FORMAT), peak)
+            changed = True
+    processed = 0
+    while hour + timedelta(hours=1) + CLOSE_GRACE <= now:
+        peak = hour_peak(hour)
+        if peak is not None:
+            _add_peak(summary, hour, peak)
+        elif hour.strftime(HOUR_FORMAT) >= cutoff:
+            pending.append(hour.strftime(HOUR_FORMAT))
+        summary['ultima_hora'] = hour.strftime(HOUR_FORMAT)
+        hour += timedelta(hours=1)
+        processed += 1
+    summary['pendientes'] = pending
+    if processed or changed:
+        summary['horas'] = {key: value for key, value in summary['horas'].items() if key >= cutoff}
+        save_summary(summary)
+        logger.info(f"Resumen de demanda actualizado: {processed} horas procesadas hasta {summary['ultima_hora']}, "
+                    f"{len(pending)} horas sin datos pendientes")
+    return summary
+
+def peak_demand(start, end=None, now=None):
+    """
+    Demanda maxima entre start y end (por defecto hasta ahora) como (valor, fecha).
+    Usa los maximos diarios precalculados y lee solo las horas sin cerrar (la anterior
+    durante CLOSE_GRACE y la hora en curso).
+    Devuelve (0.0, None) si no hay datos.
+    """
+    now = now or datetime.now()
+    end = end or now
+    summary = update_summary(now)
+    start_day = start.strftime(DAY_FORMAT)
+    end_day = end.strftime(DAY_FORMAT)
+    # El maximo de cada dia ya incluye sus horas cerradas; solo faltan las abiertas
+    candidates = [peak for day_key, peak in summary['dias'].items() if start_day <= day_key <= end_day]
+    for hour in _open_hours(summary, now):
+        if start_day <= hour.strftime(DAY_FORMAT) <= end_day:
+            open_peak = hour_peak(hour)
+            if open_peak is not None:
+                candidates.append(open_peak)
+    if not candidates:
+        return 0.0, None
+    value, timestamp = max(candidates, key=lambda peak: peak[0])
+    return value, timestamp
@@ -0,0 +1,119 @@
+# downsampling.py
+"""
+Reduccion de puntos para las graficas de series de tiempo.
+
+- 'lttb': Largest-Triangle-Three-Buckets, conserva la forma visual de la serie con
+  exactamente n_out puntos.
+- 'm4': por cada intervalo de tiempo (pixel) conserva el primero, el minimo, el maximo
+  y el ultimo, asi los picos cortos de potencia no se pierden. Como esos puntos se
+  repiten en muchos intervalos, el numero de intervalos se ajusta para acercarse a
+  n_out y el resto se completa con puntos equiespaciados: da exactamente n_out.
+
+Las funciones devuelven los indices de los puntos elegidos (ordenados) para poder
+tomar las filas del DataFrame original.
+"""
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('lttb', 'm4')
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype('int64').astype('float64')
+    return x.astype('float64')
+
+def lttb_indices(x, y, n_out):
+    """Indices elegidos por LTTB; x debe estar ordenado y sin NaN en y."""
+    x = _as_float(x)
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # Limites de los n_out - 2 intervalos intermedios (el primero y el ultimo punto se conservan)
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    indices = np.empty(n_out, dtype='int64')
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Promedio del intervalo siguiente (o el ultimo punto para el ultimo intervalo)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+def _m4_select(x, y, n_buckets):
+    """Indices del primero, minimo, maximo y ultimo de cada uno de n_buckets intervalos de tiempo."""
+    n = len(x)
+    bucket = np.minimum(((x - x[0]) / (x[-1] - x[0]) * n_buckets).astype('int64'), n_buckets - 1)
+    _, first = np.unique(bucket, return_index=True)
+    last = np.append(first[1:], n) - 1
+    # Con x ordenado cada intervalo es contiguo: reduceat da el minimo/maximo por intervalo
+    # y la primera posicion que lo alcanza es su indice
+    bucket_min = np.minimum.reduceat(y, first)
+    bucket_max = np.maximum.reduceat(y, first)
+    group = np.repeat(np.arange(len(first)), np.diff(np.append(first, n)))
+    argmin = np.flatnonzero(y == bucket_min[group])
+    argmin = argmin[np.unique(group[argmin], return_index=True)[1]]
+    argmax = np.flatnonzero(y == bucket_max[group])
+    argmax = argmax[np.unique(group[argmax], return_index=True)[1]]
+    return np.unique(np.concatenate([first, last, argmin, argmax]))
+
+def m4_indices(x, y, n_out):
+    """Exactamente n_out indices (o todos si hay menos): M4 con el mayor numero de intervalos que no pasa de n_out."""
+    x = _as_float(x)
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    if x[-1] - x[0] <= 0:
+        return np.linspace(0, n - 1, n_out).astype('int64')
+    # Los puntos repetidos (primero = minimo, etc.) dejan menos de 4 por intervalo:
+    # busqueda binaria del numero de intervalos entre n_out // 4 y n_out
+    low, high = 1, n_out
+    indices = _m4_select(x, y, n_out // 4)
+    if len(indices) <= n_out:
+        low = n_out // 4
+    while low < high:
+        middle = (low + high + 1) // 2
+        candidate = _m4_select(x, y, middle)
+        if len(candidate) <= n_out:
+            low, indices = middle, candidate
+        else:
+            high = middle - 1
+    if len(indices) > n_out:
+        indices = _m4_select(x, y, low)
+    missing = n_out - len(indices)
+    if missing > 0:
+        # Completar con puntos equiespaciados que no se eligieron
+        rest = np.setdiff1d(np.arange(n), indices, assume_unique=True)
+        fill = rest[np.linspace(0, len(rest) - 1, missing).astype('int64')]
+        indices = np.union1d(indices, fill)
+        logger.debug(f"M4 con {low} intervalos: {n_out - missing} puntos, {missing} equiespaciados para llegar a {n_out}")
+    return indices
+
+def downsample(df, x_col, y_col, n_out, method='m4'):
+    """Devuelve n_out filas de df (ordenado por x_col) elegidas con el metodo indicado, o todas si hay menos."""
+    if method not in METHODS:
+        logger.warning(f"Metodo de reduccion desconocido: {method}, usando m4")
+        method = 'm4'
+    df = df.dropna(subset=[y_col])
+    if len(df) <= n_out:
+        return df.reset_index(drop=True)
+    if method == 'lttb':
+        indices = lttb_indices(df[x_col].to_numpy(), df[y_col].to_numpy(), n_out)
+    else:
+        indices = m4_indices(df[x_col].to_numpy(), df[y_col].to_numpy(), n_out)
+    return df.iloc[indices].reset_index(drop=True)
@@ -0,0 +1,142 @@
+# heatmap_store.py
+"""
+Cache del mapa de calor como datos, no como figura.
+
+Se guarda la matriz de medias (dias x intervalos de 15 minutos, float32), las
+etiquetas de los ejes y los metadatos (variable, rango, escala de colores) en un
+.npz de pocos KB, escrito con archivo temporal + os.replace. La figura de Plotly
+se arma al mostrarla, asi el archivo no depende de la version de Plotly.
+
+El mismo formato se usa para los mapas de cada variable que mantiene
+heatmap_worker en HEATMAP_GRIDS_DIR: los ultimos 8 dias (grid_path) y el perfil
+por dia de la semana e intervalo del dia (profile_path). Para no releer los 8
+dias cada hora, el worker guarda ademas las sumas y conteos del mapa de 8 dias
+(state_path) y solo les agrega la hora que acaba de cerrar.
+"""
+import os
+import json
+import logging
+import numpy as np
+import calendar_binning
+from buffer_segments import set_file_owner
+from config import HEATMAP_DATA_FILE, HEATMAP_GRIDS_DIR
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEYS = ('variable', 'fecha_inicio', 'fecha_final', 'zmin', 'zmax', 'last_update', 'manual_config', 'titulo')
+# Intervalos de 15 minutos del dia (columnas del mapa)
+HORAS = [f"{h:02d}:{m:02d}" for h in range(24) for m in (0, 15, 30, 45)]
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miercoles', 'Jueves', 'Viernes', 'Sabado', 'Domingo']
+# Escala de colores fija por variable; las demas van de 0 al maximo
+COLOR_RANGES = {
+    'Voltaje_fase_1': (105, 135),
+    'frecuencia': (59, 61)
+}
+
+def grid_path(variable):
+    return os.path.join(HEATMAP_GRIDS_DIR, f"heatmap_{variable.lower()}.npz")
+
+def profile_path(variable):
+    return os.path.join(HEATMAP_GRIDS_DIR, f"perfil_{variable.lower()}.npz")
+
+def state_path(variable):
+    return os.path.join(HEATMAP_GRIDS_DIR, f"estado_{variable.lower()}.npz")
+
+def day_labels(dias):
+    return [d.strftime('%b-%d') for d in dias]
+
+def day_grid(df, dias):
+    """Media de 'valor' por dia (lista consecutiva de date) e intervalo de 15 minutos: matriz len(dias) x 96 con NaN sin datos."""
+    t = calendar_binning.epoch_seconds(df["fecha"])
+    first_day = calendar_binning.epoch_seconds([np.datetime64(dias[0], 'D')])[0]
+    sums, counts = calendar_binning.day_slot_grid(t, df["valor"].to_numpy(dtype=float), first_day, len(dias))
+    return calendar_binning.mean_grid(sums, counts)
+
+def weekday_profile(df):
+    """Media de 'valor' por dia de la semana (lunes primero) e intervalo de 15 minutos: matriz 7 x 96."""
+    t = calendar_binning.epoch_seconds(df["fecha"])
+    sums, counts = calendar_binning.weekday_slot_grid(t, df["valor"].to_numpy(dtype=float))
+    return calendar_binning.mean_grid(sums, counts)
+
+def color_scale(variable, z):
+    """(zmin, zmax) de la escala de colores, o None si no hay valores validos para la variable."""
+    valid_data = z[~np.isnan(z)]
+    if variable in COLOR_RANGES:
+        zmin, zmax = COLOR_RANGES[variable]
+        valid_data = valid_data[(valid_data >= zmin) & (valid_data <= zmax)]
+    else:
+        valid_data = valid_data[valid_data >= 0]
+        zmin, zmax = 0, (valid_data.max() if valid_data.size else 0)
+    if valid_data.size == 0:
+        return None
+    if zmin == zmax:
+        zmin = zmin - 0.1
+        zmax = zmax + 0.1
+    return float(zmin), float(zmax)
+
+def save_heatmap(heatmap, path=HEATMAP_DATA_FILE):
+    """heatmap: dict con 'z' (matriz dias x intervalos), 'dias', 'horas' y los METADATA_KEYS."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    metadata = {key: heatmap.get(key) for key in METADATA_KEYS}
+    temp_file = path + '.tmp'
+    with open(temp_file, 'wb') as f:
+        np.savez(
+            f,
+            z=np.asarray(heatmap['z'], dtype=np.float32),
+            dias=np.asarray(heatmap['dias'], dtype=str),
+            horas=np.asarray(heatmap['horas'], dtype=str),
+            metadata=np.asarray(json.dumps(metadata))
+        )
+    new_file = not os.path.exists(path)
+    os.replace(temp_file, path)
+    if new_file:
+        set_file_owner(path)
+    logger.info(f"Mapa de calor de {metadata['variable']} guardado en {path} ({os.path.getsize(path)} bytes)")
+
+def load_heatmap(path=HEATMAP_DATA_FILE):
+    """Devuelve el dict guardado por save_heatmap, o None si no existe o esta danado."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            heatmap = json.loads(str(data['metadata']))
+            heatmap['z'] = data['z']
+            heatmap['dias'] = data['dias'].tolist()
+            heatmap['horas'] = data['horas'].tolist()
+        return heatmap
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Error al cargar {path}: {e}")
+        return None
+
+def save_grid_state(path, sums, counts, first_day, until):
+    """Sumas y conteos (dias x intervalos) del mapa desde first_day, con las muestras anteriores a until (segundos desde 1970)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_file = path + '.tmp'
+    with open(temp_file, 'wb') as f:
+        np.savez(
+            f,
+            sumas=np.asarray(sums, dtype=np.float64),
+            conteos=np.asarray(counts, dtype=np.int64),
+            primer_dia=np.int64(first_day),
+            hasta=np.int64(until)
+        )
+    new_file = not os.path.exists(path)
+    os.replace(temp_file, path)
+    if new_file:
+        set_file_owner(path)
+
+def load_grid_state(path):
+    """Devuelve el dict guardado por save_grid_state, o None si no existe o esta danado."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {
+                'sumas': data['sumas'],
+                'conteos': data['conteos'],
+                'primer_dia': int(data['primer_dia']),
+                'hasta': int(data['hasta'])
+            }
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Error al cargar {path}: {e}")
+        return None
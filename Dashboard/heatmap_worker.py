@@ -0,0 +1,172 @@
+# heatmap_worker.py
+"""
+Mapas de calor precalculados de todas las variables.
+
+Cada hora (a los 5 minutos, desde update_heatmap_cron) se actualiza para cada
+variable de VARIABLES el mapa de los ultimos 8 dias hasta la ultima hora
+completa y, una vez al dia, el perfil por dia de la semana e intervalo de 15
+minutos de las ultimas HEATMAP_PROFILE_WEEKS semanas. Se guardan con
+heatmap_store en HEATMAP_GRIDS_DIR, asi cambiar de variable en el dashboard
+solo carga un archivo de pocos KB.
+
+El mapa de 8 dias es incremental: se guardan sus sumas y conteos (8 x 96) y en
+cada ejecucion solo se agregan las horas cerradas desde la anterior (normalmente
+una); al cambiar de dia la ventana se desplaza una fila. Si el estado falta, es
+de otra ventana o el reloj retrocedio, se recalcula desde los 8 dias completos.
+
+Los datos salen de los agregados de 15 minutos cuando cubren el rango; si no,
+del almacenamiento binario o de los .txt por hora.
+
+Uso: python heatmap_worker.py
+"""
+import os
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import calendar_binning
+import columnar_storage
+import data_catalog
+import heatmap_store
+import rollups
+import txt_reader
+from config import HEATMAP_PROFILE_WEEKS, LOG_DIR
+from data_collector import VARIABLES, VARIABLES_DISPLAY, UNITS
+
+logger = logging.getLogger(__name__)
+
+# Dias del mapa (el de la ultima hora completa y los 7 anteriores)
+GRID_DAYS = 8
+
+def load_values(variable, start, end):
+    """DataFrame fecha/valor entre start y end: medias de 15 minutos o, sin agregados, las muestras crudas."""
+    try:
+        if rollups.covers(variable, '15m', start):
+            df = rollups.read_rollup(variable, '15m', start, end)
+            if not df.empty:
+                return df[['fecha', 'media']].rename(columns={'media': 'valor'})
+    except Exception as e:
+        logger.error(f"Error leyendo agregados de 15 minutos para {variable}: {e}")
+    frames = []
+    dia = start.date()
+    while dia <= end.date():
+        day_start = max(start, datetime.combine(dia, datetime.min.time()))
+        day_end = min(end, datetime.combine(dia, datetime.max.time()).replace(microsecond=0))
+        if columnar_storage.has_day(variable, dia):
+            frames.append(columnar_storage.read_range(variable, day_start, day_end))
+        else:
+            files = [path for _, path in data_catalog.list_files(variable, day_start, day_end)]
+            if files:
+                df = txt_reader.read_txt_files(files)
+                frames.append(df[(df['fecha'] >= day_start) & (df['fecha'] <= day_end)])
+        dia += timedelta(days=1)
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return txt_reader.empty_frame()
+    return pd.concat(frames, ignore_index=True)
+
+def _save(path, variable, z, dias, fecha_inicio, fecha_final, titulo=None):
+    scale = heatmap_store.color_scale(variable, z)
+    if scale is None:
+        logger.warning(f"Sin valores validos para el mapa de {variable} ({fecha_inicio} a {fecha_final})")
+        return False
+    heatmap_store.save_heatmap({
+        'z': z,
+        'dias': dias,
+        'horas': heatmap_store.HORAS,
+        'variable': variable,
+        'fecha_inicio': fecha_inicio.strftime('%Y-%m-%d'),
+        'fecha_final': fecha_final.strftime('%Y-%m-%d'),
+        'zmin': scale[0],
+        'zmax': scale[1],
+        'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'manual_config': False,
+        'titulo': titulo
+    }, path)
+    return True
+
+def _fold(variable, sums, counts, first_day, start, end):
+    """Agrega a sums/counts las muestras de variable entre start y end (segundos desde 1970, end excluido)."""
+    fecha_inicio = columnar_storage.EPOCH + timedelta(seconds=start)
+    fecha_final = columnar_storage.EPOCH + timedelta(seconds=end - 1)
+    df = load_values(variable, fecha_inicio, fecha_final)
+    if df.empty:
+        logger.warning(f"No hay datos para el mapa de {variable} entre {fecha_inicio} y {fecha_final}")
+        return
+    t = calendar_binning.epoch_seconds(df["fecha"])
+    new_sums, new_counts = calendar_binning.day_slot_grid(t, df["valor"].to_numpy(dtype=float), first_day, GRID_DAYS)
+    sums += new_sums
+    counts += new_counts
+
+def update_grid(variable, now):
+    """Mapa de los 8 dias que terminan en la ultima hora completa, agregando solo las horas nuevas."""
+    until = columnar_storage.to_epoch(now.replace(minute=0, second=0, microsecond=0))
+    fecha_final = columnar_storage.EPOCH + timedelta(seconds=until - 1)
+    dias = [fecha_final.date() - timedelta(days=x) for x in range(GRID_DAYS - 1, -1, -1)]
+    first_day = columnar_storage.to_epoch(datetime.combine(dias[0], datetime.min.time()))
+    state_file = heatmap_store.state_path(variable)
+    state = heatmap_store.load_grid_state(state_file)
+    shape = (GRID_DAYS, len(heatmap_store.HORAS))
+    if (state is None or state['sumas'].shape != shape or state['hasta'] > until
+            or state['primer_dia'] > first_day or state['hasta'] <= first_day):
+        # Sin estado utilizable: se recalculan los 8 dias completos
+        sums, counts = np.zeros(shape), np.zeros(shape, dtype=np.int64)
+        start = first_day
+    else:
+        sums, counts = state['sumas'], state['conteos']
+        shift = (first_day - state['primer_dia']) // calendar_binning.DAY_SECONDS
+        if shift:
+            # Cambio de dia: sale el dia mas antiguo y entra una fila vacia
+            sums = np.vstack([sums[shift:], np.zeros((shift, shape[1]))])
+            counts = np.vstack([counts[shift:], np.zeros((shift, shape[1]), dtype=np.int64)])
+        start = state['hasta']
+    if start < until:
+        _fold(variable, sums, counts, first_day, start, until)
+    heatmap_store.save_grid_state(state_file, sums, counts, first_day, until)
+    if not counts.any():
+        logger.warning(f"No hay datos para el mapa de {variable} desde {dias[0]}")
+        return False
+    z = calendar_binning.mean_grid(sums, counts)
+    fecha_inicio = datetime.combine(dias[0], datetime.min.time())
+    return _save(heatmap_store.grid_path(variable), variable, z, heatmap_store.day_labels(dias), fecha_inicio, fecha_final)
+
+def update_profile(variable, now):
+    """Perfil semanal de las ultimas HEATMAP_PROFILE_WEEKS semanas hasta el final del dia anterior."""
+    fecha_final = datetime.combine(now.date(), datetime.min.time()) - timedelta(seconds=1)
+    fecha_inicio = fecha_final - timedelta(weeks=HEATMAP_PROFILE_WEEKS) + timedelta(seconds=1)
+    df = load_values(variable, fecha_inicio, fecha_final)
+    if df.empty:
+        logger.warning(f"No hay datos para el perfil de {variable} desde {fecha_inicio}")
+        return False
+    z = heatmap_store.weekday_profile(df)
+    titulo = (f"Perfil semanal de {VARIABLES_DISPLAY[variable]} ({UNITS[variable]}), "
+              f"desde {fecha_inicio.strftime('%Y-%m-%d')} hasta {fecha_final.strftime('%Y-%m-%d')}")
+    return _save(heatmap_store.profile_path(variable), variable, z, heatmap_store.DIAS_SEMANA, fecha_inicio, fecha_final, titulo)
+
+def profile_is_current(variable, now):
+    """True si el perfil ya se calculo hoy (solo cambia al cerrar cada dia)."""
+    profile = heatmap_store.load_heatmap(heatmap_store.profile_path(variable))
+    return profile is not None and (profile.get('last_update') or '')[:10] == now.strftime('%Y-%m-%d')
+
+def update_all(now=None):
+    """Actualiza los mapas (y los perfiles pendientes) de todas las variables; devuelve cuantos archivos se escribieron."""
+    now = now or datetime.now()
+    written = 0
+    for variable in VARIABLES:
+        try:
+            written += update_grid(variable, now)
+            if not profile_is_current(variable, now):
+                written += update_profile(variable, now)
+        except Exception as e:
+            logger.error(f"Error actualizando los mapas de calor de {variable}: {e}", exc_info=True)
+    logger.info(f"Mapas de calor actualizados: {written} archivos")
+    return written
+
+if __name__ == "__main__":
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logging.basicConfig(
+        filename=os.path.join(LOG_DIR, 'heatmap_worker.log'),
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    print(f"Mapas de calor actualizados: {update_all()} archivos")
@@ -0,0 +1,61 @@
+# hourly_files.py
+"""
+Escritura agrupada de los archivos .txt por hora.
+
+Los archivos de la hora en curso se mantienen abiertos; los permisos se ajustan
+una sola vez al crearlos. Los archivos se sincronizan juntos (commit) cada
+commit_interval segundos o commit_samples escrituras. La durabilidad de las
+muestras entre commits la da el WAL del colector (sample_wal), que al arrancar
+reescribe lo que falte en los .txt.
+"""
+import os
+import time
+import logging
+from buffer_segments import set_file_owner
+
+logger = logging.getLogger(__name__)
+
+class HourlyFileWriter:
+    def __init__(self, commit_interval=30, commit_samples=12):
+        self.commit_interval = commit_interval
+        self.commit_samples = commit_samples
+        self._files = {}
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def _file(self, path):
+        f = self._files.get(path)
+        if f is None:
+            new_file = not os.path.exists(path)
+            f = open(path, 'ab')
+            if new_file:
+                set_file_owner(path)
+            self._files[path] = f
+        return f
+
+    def write(self, entries):
+        """Escribe [(ruta, texto)]; se sincronizan en el siguiente commit."""
+        for path, text in entries:
+            self._file(path).write(text.encode('utf-8'))
+        self._pending += 1
+        if self._pending >= self.commit_samples or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """Sincroniza todos los archivos abiertos."""
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        logger.debug(f"Commit de {len(self._files)} archivos ({self._pending} escrituras)")
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close_files(self):
+        """Hace commit y cierra todos los archivos abiertos (p. ej. al cambiar de hora)."""
+        self.commit()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def close(self):
+        self.close_files()
@@ -0,0 +1,88 @@
+# latest_sample.py
+"""
+Ultima muestra valida del medidor sin leer el buffer completo.
+
+El colector escribe la misma fila que agrega al buffer en LATEST_SAMPLE_FILE
+(archivo temporal + os.replace, asi los lectores nunca ven un JSON a medias).
+Si el archivo no existe o esta danado, se lee la ultima linea del segmento mas
+reciente del buffer buscando desde el final del archivo.
+"""
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+import buffer_segments
+from config import LATEST_SAMPLE_FILE
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TAIL_BLOCK_SIZE = 4096
+
+def write_latest_sample(row):
+    """Guarda la fila (timestamp como texto y valores por variable) de forma atomica."""
+    temp_file = LATEST_SAMPLE_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(row, f)
+    new_file = not os.path.exists(LATEST_SAMPLE_FILE)
+    os.replace(temp_file, LATEST_SAMPLE_FILE)
+    if new_file:
+        buffer_segments.set_file_owner(LATEST_SAMPLE_FILE)
+
+def _parse_row(row):
+    sample = {'timestamp': datetime.strptime(row['timestamp'], TIMESTAMP_FORMAT)}
+    for key, value in row.items():
+        if key == 'timestamp':
+            continue
+        try:
+            sample[key] = float(value) if value not in (None, '') else None
+        except (ValueError, TypeError):
+            sample[key] = None
+    return sample
+
+def _read_last_line(path):
+    """Devuelve (encabezado, ultima linea completa) de un CSV leyendo solo el inicio y el final."""
+    with open(path, 'rb') as f:
+        header = f.readline().decode('utf-8', errors='ignore').strip()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        block = min(size, TAIL_BLOCK_SIZE)
+        f.seek(size - block)
+        tail = f.read(block)
+    # Lo que sigue al ultimo salto de linea es una fila que aun se esta escribiendo
+    lines = [line for line in tail.split(b'\n')[:-1] if line.strip()]
+    if not lines:
+        return header, None
+    last = lines[-1].decode('utf-8', errors='ignore').strip()
+    return header, None if last == header else last
+
+def read_latest_from_buffer():
+    """Ultima fila del segmento mas reciente, o None."""
+    segments = buffer_segments.list_segments()
+    if not segments:
+        return None
+    header, last = _read_last_line(segments[-1])
+    if not last:
+        return None
+    columns = next(csv.reader([header]))
+    values = next(csv.reader([last]))
+    if len(values) != len(columns):
+        logger.warning(f"Ultima linea incompleta en {segments[-1]}")
+        return None
+    return _parse_row(dict(zip(columns, values)))
+
+def read_latest_sample():
+    """Ultima muestra como dict {'timestamp': datetime, variable: float o None}, o None si no hay datos."""
+    try:
+        with open(LATEST_SAMPLE_FILE, 'r') as f:
+            return _parse_row(json.load(f))
+    except FileNotFoundError:
+        logger.debug(f"{LATEST_SAMPLE_FILE} no existe, leyendo el final del buffer")
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Error leyendo {LATEST_SAMPLE_FILE}: {e}, leyendo el final del buffer")
+    try:
+        return read_latest_from_buffer()
+    except (OSError, ValueError) as e:
+        logger.error(f"Error leyendo la ultima muestra del buffer: {e}")
+        return None
@@ -6,12 +6,15 @@ import numpy as np
 from datetime import datetime, timedelta
 import logging
 import os
-import pickle
 from streamlit_autorefresh import st_autorefresh
 from data_collector import VARIABLES, VARIABLES_DISPLAY, UNITS
-import json
-from config import BASE_DIR, CONSUMO_CSV_FILE, HEATMAP_DATA_FILE, LOG_DIR
-from pages.personalizar_graficas import generate_heatmap
+from config import BASE_DIR, BUFFER_SEGMENTS_DIR, CONSUMO_CSV_FILE, DOWNSAMPLING_METHODS, HEATMAP_DATA_FILE, LOG_DIR
+import buffer_segments
+import buffer_cache
+import rollups
+import downsampling
+import alert_store
+from pages.personalizar_graficas import generate_heatmap, load_heatmap_figure
 
 # Configurar logging
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -22,7 +25,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-ALERTS_STORAGE_FILE = "/home/pi/Desktop/Medidor/Dashboard/alerts_storage.json"
 
 st.set_page_config(page_title="Tablero Medidor CCP", layout="wide", initial_sidebar_state="expanded")
 
@@ -34,9 +36,10 @@ def generate_gauge_power(data_buffer):
                 "timestamp": [datetime.now()],
                 "Potencia_activa_Total": [0]
             })
-        data_buffer['Potencia_activa_Total'] = pd.to_numeric(data_buffer['Potencia_activa_Total'], errors='coerce').fillna(0)
-        last_value = data_buffer['Potencia_activa_Total'].iloc[-1]
-        max_value = data_buffer['Potencia_activa_Total'].max()
+        # data_buffer puede ser el DataFrame compartido de buffer_cache, no se modifica en sitio
+        potencia = pd.to_numeric(data_buffer['Potencia_activa_Total'], errors='coerce').fillna(0)
+        last_value = potencia.iloc[-1]
+        max_value = potencia.max()
         gauge_range = max(max_value * 1.2, 10)
         fig = go.Figure(go.Indicator(
             mode="gauge+number",
@@ -387,56 +390,19 @@ def load_heatmap_fig():
             if now >= next_update_hour:
                 logger.info("Mapa de calor personalizado ha expirado, inicializando mapa por defecto")
                 initialize_default_heatmap()
-        # Cargar configuracion existente
+        # Cargar el mapa guardado (solo la matriz y etiquetas; la figura se arma una vez por version del archivo)
         if os.path.exists(HEATMAP_DATA_FILE):
-            with open(HEATMAP_DATA_FILE, 'rb') as f:
-                data = pickle.load(f)
-                fig = data.get('fig')
-                variable = data.get('variable', 'Potencia_aparente_total')
-                fecha_final = data.get('fecha_final', (datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)).strftime('%Y-%m-%d'))
-                manual_config = data.get('manual_config', False)
-                if fig is None:
-                    logger.error(f"No se encontro figura valida en {HEATMAP_DATA_FILE}")
-                    initialize_default_heatmap()
-                    return st.session_state.heatmap_fig
-                fecha_final_dt = datetime.strptime(fecha_final, '%Y-%m-%d')
-                fecha_inicio_dt = fecha_final_dt - timedelta(days=7)
-                fig.update_layout(
-                    xaxis_title='',
-                    yaxis_title='',
-                    title=f"{VARIABLES_DISPLAY[variable]} ({UNITS[variable]}), desde {fecha_inicio_dt.strftime('%Y-%m-%d')} hasta {fecha_final_dt.strftime('%Y-%m-%d')}",
-                    title_font=dict(size=14, color="white", family="Arial", weight="normal"),
-                    plot_bgcolor="#000000",
-                    paper_bgcolor="#000000",
-                    margin=dict(l=0, r=0, t=40, b=0),
-                    xaxis=dict(
-                        tickangle=-45,
-                        tickmode="array",
-                        tickfont=dict(size=12, color="white"),
-                        showgrid=False,
-                        zeroline=False,
-                        showline=False
-                    ),
-                    yaxis=dict(
-                        tickmode="array",
-                        tickfont=dict(size=12, color="white", family="Segoe UI"),
-                        automargin=True,
-                        ticklabelposition="outside",
-                        ticklabeloverflow="allow",
-                        autorange="reversed",
-                        showgrid=False,
-                        zeroline=False,
-                        showline=False
-                    ),
-                    height=300,
-                    showlegend=False
-                )
-                st.session_state.heatmap_fig = fig
-                st.session_state.heatmap_variable = variable
-                st.session_state.fecha_final = fecha_final
-                st.session_state.heatmap_manual_config = manual_config
-                logger.info(f"Mapa de calor cargado desde {HEATMAP_DATA_FILE}")
-                return fig
+            fig, heatmap = load_heatmap_figure(os.path.getmtime(HEATMAP_DATA_FILE))
+            if fig is None:
+                logger.error(f"No se encontro un mapa de calor valido en {HEATMAP_DATA_FILE}")
+                initialize_default_heatmap()
+                return st.session_state.heatmap_fig
+            st.session_state.heatmap_fig = fig
+            st.session_state.heatmap_variable = heatmap['variable']
+            st.session_state.fecha_final = heatmap['fecha_final']
+            st.session_state.heatmap_manual_config = heatmap.get('manual_config', False)
+            logger.info(f"Mapa de calor cargado desde {HEATMAP_DATA_FILE}")
+            return fig
         else:
             logger.warning(f"Archivo {HEATMAP_DATA_FILE} no existe, inicializando mapa por defecto")
             initialize_default_heatmap()
@@ -448,17 +414,29 @@ def load_heatmap_fig():
 
 def load_data_buffer():
     try:
-        data_buffer_file = "/home/pi/Desktop/Medidor/Dashboard/data_buffer.csv"
         persistent_buffer_file = "/home/pi/Desktop/Medidor/Dashboard/persistent_buffer.csv"
         df = None
-        if os.path.exists(data_buffer_file):
-            df = pd.read_csv(data_buffer_file)
-            logger.info(f"Cargado {data_buffer_file} con {len(df)} filas")
+        if buffer_segments.list_segments():
+            # Cache compartido por todas las sesiones; no modificar df en sitio
+            df = buffer_cache.get_buffer()
+            logger.info(f"Cargados segmentos de {BUFFER_SEGMENTS_DIR} con {len(df)} filas")
+            if df.empty:
+                logger.warning("No hay datos validos, retornando datos por defecto")
+                return pd.DataFrame({
+                    "timestamp": [datetime.now()],
+                    "Potencia_activa_Total": [0]
+                })
+            if 'Potencia_activa_Total' not in df.columns:
+                logger.warning("Columna Potencia_activa_Total no encontrada, agregando con ceros")
+                return df.assign(Potencia_activa_Total=0)
+            if df['Potencia_activa_Total'].isna().any():
+                return df.assign(Potencia_activa_Total=df['Potencia_activa_Total'].fillna(0))
+            return df
         elif os.path.exists(persistent_buffer_file):
             df = pd.read_csv(persistent_buffer_file)
             logger.info(f"Cargado {persistent_buffer_file} con {len(df)} filas")
         else:
-            logger.warning(f"No existe {data_buffer_file} ni {persistent_buffer_file}")
+            logger.warning(f"No existen segmentos en {BUFFER_SEGMENTS_DIR} ni {persistent_buffer_file}")
             return pd.DataFrame({
                 "timestamp": [datetime.now()],
                 "Potencia_activa_Total": [0]
@@ -494,16 +472,18 @@ def load_consumo_metrics():
         'consumo_hoy': 0.0,
         'costo_hoy': 0.0,
         'demanda_maxima': 0.0,
+        'demanda_maxima_fecha': None,
         'consumo_acumulado': 0.0,
         'costo_acumulado': 0.0,
         'estimacion_factura': 0.0
     }
     try:
         if os.path.exists(CONSUMO_CSV_FILE):
-            df = pd.read_csv(CONSUMO_CSV_FILE, usecols=[
+            # demanda_maxima_fecha puede faltar en archivos generados por versiones anteriores
+            df = pd.read_csv(CONSUMO_CSV_FILE, usecols=lambda col: col in [
                 'fecha_inicio', 'fecha_fin', 'dias_transcurridos', 'consumo_hoy',
-                'costo_hoy', 'demanda_maxima', 'consumo_acumulado', 'costo_acumulado',
-                'estimacion_factura'
+                'costo_hoy', 'demanda_maxima', 'demanda_maxima_fecha', 'consumo_acumulado',
+                'costo_acumulado', 'estimacion_factura'
             ])
             if not df.empty:
                 data = df.iloc[0].to_dict()
@@ -520,9 +500,8 @@ def load_consumo_metrics():
 
 def load_alerts_count():
     try:
-        with open(ALERTS_STORAGE_FILE, 'r') as f:
-            alerts = json.load(f)
-        return len(alerts)
+        # Resumen que alert_store escribe en cada transicion, sin leer la lista de alertas
+        return int(alert_store.load_summary().get('total', 0))
     except Exception as e:
         logger.error(f"Error cargando conteo de alertas: {e}")
         return 0
@@ -540,6 +519,29 @@ def initialize_default_historical_graph():
         logger.warning("No se pudo generar grafica historica por defecto")
         st.session_state.historicos_fig = None
 
+def load_rollup_plot_data(variable, start_time, end_time, target_points):
+    """Lee el nivel de agregados mas grueso que alcanza target_points; None si hay que usar el buffer."""
+    tier = rollups.choose_tier(start_time, end_time, target_points)
+    if tier is None:
+        return None
+    try:
+        if not rollups.covers(variable, tier, start_time):
+            logger.info(f"Agregados {tier} de {variable} no cubren desde {start_time}, usando buffer")
+            return None
+        df_rollup = rollups.read_rollup(variable, tier, start_time, end_time)
+    except Exception as e:
+        logger.error(f"Error leyendo agregados {tier} de {variable}: {e}")
+        return None
+    logger.info(f"Usando agregados {tier} para {variable}: {len(df_rollup)} filas")
+    # Minimo y maximo de cada intervalo (no la media) para que los picos cortos se vean;
+    # el maximo va a la mitad del intervalo para que la linea trace la envolvente
+    half = pd.Timedelta(seconds=rollups.TIERS[tier] // 2)
+    fechas = df_rollup["fecha"].to_numpy()
+    return pd.DataFrame({
+        "timestamp": np.column_stack([fechas, fechas + half.to_timedelta64()]).ravel(),
+        variable: np.column_stack([df_rollup["minimo"].to_numpy(), df_rollup["maximo"].to_numpy()]).ravel()
+    })
+
 def generate_time_series_plot(data_buffer, variable, time_range):
     try:
         if data_buffer.empty or variable not in data_buffer.columns:
@@ -562,13 +564,16 @@ def generate_time_series_plot(data_buffer, variable, time_range):
             time_delta = timedelta(days=30)
             target_points = 720
         start_time = datetime.now() - time_delta
-        df_plot = df_plot[df_plot["timestamp"] >= start_time]
+        df_rollup = load_rollup_plot_data(variable, start_time, datetime.now(), target_points)
+        if df_rollup is not None:
+            df_plot = df_rollup
+        else:
+            df_plot = df_plot[df_plot["timestamp"] >= start_time]
         if df_plot.empty:
             logger.warning(f"No hay datos en rango {time_range} para {variable}")
             return None
         if time_range != "Hora" and len(df_plot) > target_points:
-            step = max(1, len(df_plot) // target_points)
-            df_plot = df_plot.iloc[::step].reset_index(drop=True)
+            df_plot = downsampling.downsample(df_plot, "timestamp", variable, target_points, DOWNSAMPLING_METHODS.get("tiempo_real", "m4"))
         valid_data = df_plot[variable][df_plot[variable].notnull()]
         y_min = 0
         y_max = valid_data.max() * 1.1 if valid_data.size > 0 else 10
@@ -686,6 +691,9 @@ def dashboard():
         consumo_hoy = consumo_data['consumo_hoy']
         costo_hoy = consumo_data['costo_hoy']
         demanda_maxima = consumo_data['demanda_maxima']
+        demanda_maxima_fecha = consumo_data['demanda_maxima_fecha']
+        if pd.isna(demanda_maxima_fecha) or not demanda_maxima_fecha:
+            demanda_maxima_fecha = 'Sin registro'
         consumo_acumulado = consumo_data['consumo_acumulado']
         costo_acumulado = consumo_data['costo_acumulado']
         estimacion_factura = consumo_data['estimacion_factura']
@@ -726,7 +734,7 @@ def dashboard():
                 <div class="metrics-column">
                     <div class="metric-card">
                         <h3>Demanda máxima en periodo:</h3>
-                        <p>{0:.2f} kW</p>
+                        <p>{0:.2f} kW ({4})</p>
                     </div>
                     <div class="metric-card">
                         <h3>Consumo acumulado:</h3>
@@ -745,7 +753,8 @@ def dashboard():
                     demanda_maxima,
                     consumo_acumulado,
                     costo_acumulado,
-                    estimacion_factura
+                    estimacion_factura,
+                    demanda_maxima_fecha
                 ),
                 unsafe_allow_html=True
             )
@@ -865,7 +874,7 @@ def dashboard():
             st.plotly_chart(heatmap_fig, use_container_width=True)
         else:
             st.error("No se pudo cargar el mapa de calor. Configuralo en la pagina Personalizar Graficas.")
-            logger.error("Mapa de calor no encontrado o archivo heatmap_data.pkl corrupto")
+            logger.error("Mapa de calor no encontrado o archivo heatmap_data.npz corrupto")
     with col2:
         if st.session_state.historicos_fig is not None:
             variable = "Potencia_activa_Total"
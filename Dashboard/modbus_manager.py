@@ -0,0 +1,218 @@
+# modbus_manager.py
+"""
+Conexion persistente con el medidor por Modbus RTU.
+
+El colector es el unico proceso que abre el puerto serie. ModbusLink mantiene la
+conexion abierta, la reintenta con espera exponencial (sin detener el colector)
+cuando falla y lleva estadisticas por bloque de registros: lecturas, errores,
+fallos de CRC y latencia. El estado del enlace se publica en MODBUS_STATUS_FILE
+(archivo temporal + os.replace); otros procesos, como el correo de estado, lo
+leen con read_status() en lugar de abrir el puerto.
+"""
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from buffer_segments import set_file_owner
+from config import MODBUS_STATUS_FILE
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Espera entre reconexiones: empieza en BACKOFF_INITIAL y se duplica hasta BACKOFF_MAX (segundos)
+BACKOFF_INITIAL = 2
+BACKOFF_MAX = 300
+# Errores seguidos antes de cerrar el puerto y reconectar
+MAX_CONSECUTIVE_ERRORS = 5
+# Segundos entre escrituras del estado del enlace
+STATUS_INTERVAL = 10
+
+def _is_crc_error(error):
+    return 'crc' in str(error).lower()
+
+class RegisterStats:
+    def __init__(self):
+        self.reads = 0
+        self.errors = 0
+        self.crc_errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, latency, error=None):
+        self.reads += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if error is not None:
+            self.errors += 1
+            if _is_crc_error(error):
+                self.crc_errors += 1
+
+    def to_dict(self):
+        return {
+            'lecturas': self.reads,
+            'errores': self.errors,
+            'errores_crc': self.crc_errors,
+            'tasa_error': round(self.errors / self.reads, 4) if self.reads else 0.0,
+            'latencia_media_ms': round(1000 * self.total_latency / self.reads, 1) if self.reads else None,
+            'latencia_max_ms': round(1000 * self.max_latency, 1)
+        }
+
+class ModbusLink:
+    def __init__(self, client, status_file=MODBUS_STATUS_FILE, monotonic=time.monotonic):
+        """client: cliente de pymodbus ya configurado (no se conecta hasta ensure_connected)."""
+        self.client = client
+        self.status_file = status_file
+        self._monotonic = monotonic
+        self.connected = False
+        self.connected_since = None
+        self.disconnected_since = datetime.now()
+        self.last_success = None
+        self.last_error = None
+        self.connections = 0
+        self.consecutive_errors = 0
+        self._backoff = BACKOFF_INITIAL
+        self._next_attempt = 0.0
+        self._last_status = None
+        self.stats = {}
+
+    # Conexion
+
+    def ensure_connected(self):
+        """Conecta si hace falta y ya paso la espera; devuelve True si el enlace esta abierto."""
+        if self.connected:
+            return True
+        now = self._monotonic()
+        if now < self._next_attempt:
+            return False
+        try:
+            connected = self.client.connect()
+        except Exception as e:
+            self.last_error = str(e)
+            connected = False
+        if connected:
+            # El puerto abre aunque el medidor este apagado o sin cable RS485: el enlace
+            # (y la espera de reconexion) solo se da por bueno con la primera lectura valida
+            self.connected = True
+            self.consecutive_errors = 0
+            logger.info("Puerto Modbus abierto, esperando la primera lectura valida")
+        else:
+            logger.error(f"No se pudo conectar al medidor, siguiente intento en {self._backoff} s: {self.last_error}")
+            print(f"No se pudo conectar al medidor, siguiente intento en {self._backoff} s")
+            self._next_attempt = now + self._backoff
+            self._backoff = min(self._backoff * 2, BACKOFF_MAX)
+        self.write_status(force=connected)
+        return connected
+
+    def _link_verified(self):
+        """Primera lectura valida tras abrir el puerto: el medidor responde."""
+        self.connected_since = self.last_success
+        self._backoff = BACKOFF_INITIAL
+        if self.connections:
+            logger.info(f"Conexion Modbus restablecida (desconectado desde {self.disconnected_since:%Y-%m-%d %H:%M:%S})")
+            print("Conexion Modbus restablecida")
+        else:
+            logger.info("Conexion Modbus establecida correctamente")
+        self.connections += 1
+        self.disconnected_since = None
+        self.write_status(force=True)
+
+    def _disconnect(self, reason):
+        logger.error(f"Enlace Modbus caido ({reason}), se reconectara")
+        print(f"Enlace Modbus caido ({reason}), se reconectara")
+        try:
+            self.client.close()
+        except Exception as e:
+            logger.error(f"Error cerrando el puerto: {e}")
+        self.connected = False
+        if self.connected_since is not None:
+            self.disconnected_since = datetime.now()
+        self.connected_since = None
+        self._next_attempt = self._monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, BACKOFF_MAX)
+        self.write_status(force=True)
+
+    def close(self):
+        try:
+            self.client.close()
+        finally:
+            self.connected = False
+            self.write_status(force=True)
+
+    # Lecturas
+
+    def read_holding_registers(self, address, count, unit):
+        """Misma interfaz que el cliente de pymodbus, midiendo latencia y errores por direccion."""
+        if not self.connected:
+            raise ConnectionError("Enlace Modbus desconectado")
+        stats = self.stats.setdefault(address, RegisterStats())
+        start = self._monotonic()
+        error = None
+        try:
+            response = self.client.read_holding_registers(address, count, unit=unit)
+            if response.isError():
+                error = response
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            stats.add(self._monotonic() - start, error)
+            if error is None:
+                self.consecutive_errors = 0
+                self.last_success = datetime.now()
+                if self.connected_since is None:
+                    self._link_verified()
+            else:
+                self.consecutive_errors += 1
+                self.last_error = str(error)
+                if self.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                    self._disconnect(f"{self.consecutive_errors} errores seguidos: {error}")
+
+    # Estado compartido
+
+    def status(self):
+        settings = {name: getattr(self.client, name, None) for name in ('method', 'port', 'stopbits', 'bytesize', 'parity', 'baudrate')}
+        return {
+            'actualizado': datetime.now().strftime(TIMESTAMP_FORMAT),
+            'conectado': self.connected_since is not None,
+            'puerto_abierto': self.connected,
+            'conectado_desde': self.connected_since.strftime(TIMESTAMP_FORMAT) if self.connected_since else None,
+            'desconectado_desde': self.disconnected_since.strftime(TIMESTAMP_FORMAT) if self.disconnected_since else None,
+            'ultima_lectura': self.last_success.strftime(TIMESTAMP_FORMAT) if self.last_success else None,
+            'ultimo_error': self.last_error,
+            'errores_seguidos': self.consecutive_errors,
+            'reconexiones': max(self.connections - 1, 0),
+            'puerto': settings,
+            'registros': {str(address): stats.to_dict() for address, stats in sorted(self.stats.items())}
+        }
+
+    def write_status(self, force=False):
+        """Publica el estado del enlace como mucho cada STATUS_INTERVAL segundos (o siempre con force)."""
+        now = self._monotonic()
+        if not force and self._last_status is not None and now - self._last_status < STATUS_INTERVAL:
+            return
+        self._last_status = now
+        try:
+            temp_file = self.status_file + '.tmp'
+            with open(temp_file, 'w') as f:
+                json.dump(self.status(), f)
+            new_file = not os.path.exists(self.status_file)
+            os.replace(temp_file, self.status_file)
+            if new_file:
+                set_file_owner(self.status_file)
+        except OSError as e:
+            logger.error(f"Error escribiendo el estado del enlace en {self.status_file}: {e}")
+
+def read_status(status_file=MODBUS_STATUS_FILE, max_age=120):
+    """Estado publicado por el colector, o None si no existe o tiene mas de max_age segundos (colector detenido)."""
+    try:
+        with open(status_file) as f:
+            status = json.load(f)
+        updated = datetime.strptime(status['actualizado'], TIMESTAMP_FORMAT)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"No se pudo leer el estado del enlace en {status_file}: {e}")
+        return None
+    if (datetime.now() - updated).total_seconds() > max_age:
+        return None
+    return status
@@ -3,10 +3,11 @@ import json
 import os
 from datetime import datetime
 import logging
+import alert_store
+from alert_store import AlertStore
 
 LOG_DIR = "/home/pi/logs"
 ALERTS_CONFIG_HOME = "/home/pi/Desktop/Medidor/Dashboard/alerts_config.json"
-ALERTS_STORAGE_HOME = "/home/pi/Desktop/Medidor/Dashboard/alerts_storage.json"
 
 CONFIG_VARIABLES = [
     'Corriente_linea1', 'Voltaje_fase_1', 'Potencia_activa_f1', 'Potencia_activa_Total',
@@ -75,51 +76,34 @@ def save_alerts_config(config):
         logger.error(f"Error guardando configuración de alertas: {e}", exc_info=True)
         st.error(f"Error guardando configuración de alertas: {e}")
 
-def load_alerts_storage():
+def load_alerts_storage(variable=None, start=None, end=None, page=0):
+    # Solo la pagina solicitada, desde el indice que actualiza alert_store en cada transicion
     try:
-        if os.path.exists(ALERTS_STORAGE_HOME):
-            with open(ALERTS_STORAGE_HOME, 'r') as f:
-                alerts = json.load(f)
-            logger.debug(f"Alertas cargadas: {len(alerts)} alertas")
-            return alerts
-        else:
-            logger.warning(f"No existe {ALERTS_STORAGE_HOME}")
-            return []
+        alerts, total = alert_store.query_alerts(variable, start, end, page, alert_store.PAGE_SIZE)
+        logger.debug(f"Alertas cargadas: {len(alerts)} de {total} (pagina {page})")
+        return alerts, total
     except Exception as e:
-        logger.error(f"Error cargando almacenamiento de alertas: {e}", exc_info=True)
-        return []
-        
+        logger.error(f"Error cargando alertas: {e}", exc_info=True)
+        st.error(f"Error cargando alertas: {e}")
+        return [], 0
 
-def save_alerts_storage(alerts):
-    try:
-        temp_file = ALERTS_STORAGE_HOME + '.tmp'
-        with open(temp_file, 'w') as f:
-            json.dump(alerts, f, indent=4)
-        os.replace(temp_file, ALERTS_STORAGE_HOME)
-        os.chmod(ALERTS_STORAGE_HOME, 0o664)
-        user = os.getlogin()
-        import pwd
-        user_info = pwd.getpwnam(user)
-        os.chown(ALERTS_STORAGE_HOME, user_info.pw_uid, user_info.pw_gid)
-        logger.debug(f"Alertas guardadas: {len(alerts)} alertas en {ALERTS_STORAGE_HOME}")
-    except Exception as e:
-        logger.error(f"Error guardando alertas en {ALERTS_STORAGE_HOME}: {e}", exc_info=True)
-        st.error(f"Error guardando alertas: {e}")
+@st.cache_resource
+def get_alert_store():
+    """Un almacen por proceso: el registro se lee completo una vez y cada escritura aplica solo los eventos nuevos."""
+    return AlertStore()
 
-def delete_alert(index):
-    alerts = load_alerts_storage()
-    if 0 <= index < len(alerts):
-        alerts.pop(index)
-        save_alerts_storage(alerts)
-        logger.info(f"Alerta en indice {index} eliminada")
+def delete_alert(alert_id):
+    try:
+        get_alert_store().delete_alert(alert_id)
+        logger.info(f"Alerta {alert_id} eliminada")
         st.success(f"Alerta eliminada correctamente")
-    else:
-        logger.error(f"Índice de alerta {index} no valido")
-        st.error("Error: Índice de alerta no válido")
+    except Exception as e:
+        logger.error(f"Error eliminando alerta {alert_id}: {e}", exc_info=True)
+        st.error(f"Error eliminando alerta: {e}")
 
 def delete_all_alerts():
     try:
-        save_alerts_storage([])
+        get_alert_store().delete_all()
         logger.info("Todas las alertas eliminadas")
         st.success("Todas las alertas eliminadas correctamente")
     except Exception as e:
@@ -270,8 +254,36 @@ def run():
     # FIN DEL BLOQUE DE CONFIGURACION DE COLORES
 
     st.header("Lista de Alertas")
-    alerts = load_alerts_storage()
-    
+
+    # Filtros por variable y rango de fechas (cambiar un filtro regresa a la primera pagina)
+    if 'alerts_page' not in st.session_state:
+        st.session_state.alerts_page = 0
+    summary = alert_store.load_summary()
+    filter_variables = sorted(summary.get('por_variable', {}))
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        filter_variable = st.selectbox(
+            "Variable",
+            ["Todas"] + filter_variables,
+            format_func=lambda var: var if var == "Todas" else f"{PER_VARIABLE_NAME.get(var, var)} ({summary['por_variable'][var]['total']})",
+            key="alerts_filter_variable",
+            on_change=lambda: st.session_state.update(alerts_page=0)
+        )
+    with col2:
+        filter_start = st.date_input("Desde", value=None, key="alerts_filter_start", on_change=lambda: st.session_state.update(alerts_page=0))
+    with col3:
+        filter_end = st.date_input("Hasta", value=None, key="alerts_filter_end", on_change=lambda: st.session_state.update(alerts_page=0))
+    alerts, total_alerts = load_alerts_storage(
+        None if filter_variable == "Todas" else filter_variable,
+        datetime.combine(filter_start, datetime.min.time()) if filter_start else None,
+        datetime.combine(filter_end, datetime.max.time()) if filter_end else None,
+        st.session_state.alerts_page
+    )
+    total_pages = max(1, -(-total_alerts // alert_store.PAGE_SIZE))
+    if st.session_state.alerts_page >= total_pages:
+        st.session_state.alerts_page = total_pages - 1
+        st.rerun()
+
     with st.container():
         col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
         with col1:
@@ -297,7 +309,7 @@ def run():
                 message = alert['message']
                 value = f"{alert['value']:.2f} {UNITS_PER_VARIABLE.get(alert['variable'], '')}" if alert['value'] is not None else ("--" if alert['variable'] in ["Sistema", "Internet"] else "N/A")
                 start_time = alert['start_time']
-                end_time = alert.get('end_time', 'Activa')
+                end_time = alert.get('end_time') or 'Activa'
                 if alert['variable'] in CONFIG_VARIABLES:
                     container_class = "alert-container-electrical"
                 elif alert['variable'] == "Sistema":
@@ -319,11 +331,26 @@ def run():
                 with col4:
                     st.markdown(f'<div class="{container_class}"><p>{end_time}</p></div>', unsafe_allow_html=True)
                 with col5:
-                    if st.button("Borrar", key=f"delete_alert_{i}"):
-                        delete_alert(i)
+                    if st.button("Borrar", key=f"delete_alert_{alert.get('id', i)}"):
+                        delete_alert(alert['id'])
                         st.rerun()
         # FIN DEL BLOQUE DE ASIGNACION DE COLORES PARA ALERTAS
 
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("Anterior", disabled=st.session_state.alerts_page == 0):
+                st.session_state.alerts_page -= 1
+                st.rerun()
+        with col2:
+            st.markdown(
+                f'<p style="text-align: center;">Pagina {st.session_state.alerts_page + 1} de {total_pages} ({total_alerts} alertas)</p>',
+                unsafe_allow_html=True
+            )
+        with col3:
+            if st.button("Siguiente", disabled=st.session_state.alerts_page >= total_pages - 1):
+                st.session_state.alerts_page += 1
+                st.rerun()
+
     with st.container():
         st.markdown('<div class="main-button">', unsafe_allow_html=True)
         if st.button("Borrar Todas las Alertas"):
@@ -367,7 +394,8 @@ def run():
                     key=f"max_{variable}",
                     format="%.2f"
                 )
-            config[variable] = {"min": min_val, "max": max_val}
+            # Se conservan los demas ajustes de la variable (p. ej. "detectores")
+            config[variable] = {**config.get(variable, {}), "min": min_val, "max": max_val}
         
         with st.container():
             st.markdown('<div class="main-button">', unsafe_allow_html=True)
@@ -402,7 +430,8 @@ def run():
                     key=f"max_{variable}",
                     format="%.2f"
                 )
-            config[variable] = {"min": min_val, "max": max_val}
+            # Se conservan los demas ajustes de la variable (p. ej. "detectores")
+            config[variable] = {**config.get(variable, {}), "min": min_val, "max": max_val}
         
         with st.container():
             st.markdown('<div class="main-button">', unsafe_allow_html=True)
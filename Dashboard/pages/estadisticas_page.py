@@ -2,22 +2,21 @@
 """
 estadisticas_page.py
 --------------------
-Proposito: Pagina de Streamlit para seleccionar variables y fechas, iniciar el procesamiento estadistico,
-y mostrar los resultados del archivo Excel mas reciente.
+Proposito: Pagina de Streamlit para seleccionar variables y fechas, iniciar el procesamiento estadistico
+como trabajo dentro del proceso del dashboard (statistics_jobs), mostrar su progreso y sus resultados,
+y exportarlos a Excel de forma opcional.
 """
 
 import streamlit as st
-import pandas as pd
 import os
-import subprocess
 import logging
-import re
-import glob
-import pickle
 from datetime import datetime, timedelta
 from streamlit_autorefresh import st_autorefresh
 from data_collector import VARIABLES, VARIABLES_DISPLAY
-from config import BASE_DIR, LOG_DIR, STATISTICS_CONFIG_FILE, STATISTICS_OUTPUT_DIR
+import data_catalog
+import procesar_estadisticas
+import statistics_jobs
+from config import BASE_DIR, LOG_DIR
 
 # Configurar logging
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -28,100 +27,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def save_statistics_config(variables, start_date, end_date, decimation_factor):
-    """Guarda la configuracion de estadisticas en un archivo pickle."""
-    try:
-        os.makedirs(os.path.dirname(STATISTICS_CONFIG_FILE), exist_ok=True)
-        data = {
-            'variables': variables,
-            'start_date': start_date,
-            'end_date': end_date,
-            'decimation_factor': decimation_factor,
-            'processing': True,
-            'error': None,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        with open(STATISTICS_CONFIG_FILE, 'wb') as f:
-            pickle.dump(data, f)
-        os.chmod(STATISTICS_CONFIG_FILE, 0o664)
-        logger.info(f"Configuracion guardada en {STATISTICS_CONFIG_FILE}: {data}")
-    except Exception as e:
-        logger.error(f"Error al guardar configuracion: {e}", exc_info=True)
-        raise
-
-def get_latest_excel_file():
-    """Obtiene el archivo statistics_results_*.xlsx mas reciente."""
-    try:
-        os.makedirs(STATISTICS_OUTPUT_DIR, exist_ok=True)
-        excel_files = glob.glob(os.path.join(STATISTICS_OUTPUT_DIR, "statistics_results_*.xlsx"))
-        if not excel_files:
-            logger.debug(f"No se encontraron archivos Excel en {STATISTICS_OUTPUT_DIR}")
-            return None
-        latest_file = max(excel_files, key=os.path.getctime)
-        logger.info(f"Archivo Excel mas reciente: {latest_file}")
-        return latest_file
-    except Exception as e:
-        logger.error(f"Error al buscar archivo Excel: {e}", exc_info=True)
-        return None
-
-def load_results_from_excel():
-    """Carga los resultados estadisticos desde el archivo Excel mas reciente."""
-    try:
-        latest_excel = get_latest_excel_file()
-        if not latest_excel or not os.path.exists(latest_excel):
-            logger.debug(f"No hay archivo Excel disponible: {latest_excel}")
-            return {}
-        df = pd.read_excel(latest_excel)
-        results = {}
-        for _, row in df.iterrows():
-            variable = row['Variable']
-            stats = {k: v for k, v in row.items() if k != 'Variable'}
-            results[variable] = stats
-        logger.info(f"Resultados cargados desde {latest_excel}")
-        return results
-    except Exception as e:
-        logger.error(f"Error al cargar resultados: {e}", exc_info=True)
-        return {}
-
-def load_statistics_config():
-    """Carga la configuracion de estadisticas desde un archivo pickle."""
-    try:
-        if os.path.exists(STATISTICS_CONFIG_FILE):
-            with open(STATISTICS_CONFIG_FILE, 'rb') as f:
-                data = pickle.load(f)
-                logger.debug(f"Configuracion cargada: {data}")
-                return data
-        return {'processing': False, 'error': None, 'timestamp': None}
-    except Exception as e:
-        logger.error(f"Error al cargar configuracion: {e}", exc_info=True)
-        return {'processing': False, 'error': None, 'timestamp': None}
-
 def get_available_variables(main_folder):
-    """Obtiene las variables disponibles verificando las carpetas de datos."""
+    """Obtiene las variables disponibles consultando el catalogo de archivos de datos."""
     try:
         if not os.path.exists(main_folder):
             logger.error(f"Directorio no existe: {main_folder}")
             return []
-        variables = []
-        date_folders = [f for f in os.listdir(main_folder) if re.match(r'\d{4}-\d{2}-\d{2}', f)]
-        if not date_folders:
-            logger.error(f"No se encontraron carpetas de fechas en {main_folder}")
+        cataloged = set(data_catalog.list_variables())
+        if not cataloged:
+            logger.error(f"No hay archivos catalogados para {main_folder}")
             return []
-        for var in VARIABLES:
-            var_lower = var.lower()
-            for date_folder in date_folders:
-                base_date_path = os.path.join(main_folder, date_folder)
-                for folder in os.listdir(base_date_path):
-                    if folder.lower() == var_lower:
-                        var_folder = os.path.join(base_date_path, folder)
-                        if not os.access(var_folder, os.R_OK):
-                            logger.warning(f"Sin permisos de lectura: {var_folder}")
-                            continue
-                        txt_files = [f for f in os.listdir(var_folder) if f.endswith('.txt')]
-                        if txt_files:
-                            variables.append(var)
-                            break
-        variables = sorted(list(set(variables)))
+        variables = sorted(var for var in VARIABLES if var.lower() in cataloged)
         logger.info(f"Variables disponibles: {variables}")
         return variables
     except Exception as e:
@@ -134,29 +50,14 @@ def check_data_availability(variables, start_date, end_date):
     try:
         start_date_dt = datetime.strptime(start_date, '%Y-%m-%d')
         end_date_dt = datetime.strptime(end_date, '%Y-%m-%d')
-        dates = pd.date_range(start=start_date_dt, end=end_date_dt, freq='D')
         variables_list = variables.split(',')
         found_data = False
         missing_vars = []
         for variable in variables_list:
-            variable_lower = variable.lower()
-            var_found = False
-            for date in dates:
-                date_str = date.strftime('%Y-%m-%d')
-                base_date_path = os.path.join(BASE_DIR, date_str)
-                if os.path.exists(base_date_path):
-                    for folder in os.listdir(base_date_path):
-                        if folder.lower() == variable_lower:
-                            date_folder = os.path.join(base_date_path, folder)
-                            txt_files = [f for f in os.listdir(date_folder) if f.endswith('.txt')]
-                            if txt_files:
-                                logger.debug(f"Datos encontrados para {variable} en {date_str}: {txt_files[:5]}")
-                                var_found = True
-                                found_data = True
-                                break
-                    if var_found:
-                        break
-            if not var_found:
+            if data_catalog.has_data(variable, start_date_dt, end_date_dt):
+                logger.debug(f"Datos encontrados para {variable} entre {start_date} y {end_date}")
+                found_data = True
+            else:
                 missing_vars.append(variable)
         if not found_data:
             error_msg = f"No se encontraron datos para {variables} en {start_date} a {end_date}. Variables sin datos: {missing_vars}. Directorio: {BASE_DIR}"
@@ -172,9 +73,6 @@ def check_data_availability(variables, start_date, end_date):
 
 def main():
     """Funcion principal para la pagina de Estadisticas."""
-    # Actualizar cada 10 segundos para reflejar resultados o errores
-    st_autorefresh(interval=10000, key="refresh_estadisticas")
-
     # Estilos CSS
     st.markdown("""
     <style>
@@ -211,13 +109,6 @@ def main():
 
     st.title("Estadisticas")
 
-    # Verificar errores en la configuracion
-    config = load_statistics_config()
-    if config.get('error'):
-        st.error(f"Error en el procesamiento anterior ({config.get('timestamp', 'desconocido')}): {config['error']}")
-    if config.get('processing', False):
-        st.info(f"Procesamiento en curso iniciado en {config.get('timestamp', 'desconocido')}. Espera a que finalice.")
-
     # Obtener variables disponibles
     variables = get_available_variables(BASE_DIR)
     if not variables:
@@ -270,57 +161,14 @@ def main():
             if not check_data_availability(variables_str, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')):
                 st.error(f"No hay datos disponibles para {variables_str} en el rango {start_date} a {end_date}. Verifica que existan archivos .txt en /home/pi/Desktop/Medidor/Rasp_Greco/YYYY-MM-DD/variable/.")
                 return
-            with st.spinner("Calculando estadisticas, por favor espera..."):
-                try:
-                    # Guardar configuracion
-                    save_statistics_config(variables_str, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), decimation_factor)
-                    # Ejecutar procesar_estadisticas.py directamente
-                    cmd = [
-                        "/home/pi/Desktop/Medidor/venv/bin/python3",
-                        "/home/pi/Desktop/Medidor/procesar_estadisticas.py",
-                        variables_str,
-                        start_date.strftime('%Y-%m-%d'),
-                        end_date.strftime('%Y-%m-%d'),
-                        str(decimation_factor)
-                    ]
-                    logger.debug(f"Ejecutando comando: {' '.join(cmd)}")
-                    result = subprocess.run(
-                        cmd,
-                        capture_output=True,
-                        text=True,
-                        timeout=86400  # 24 horas para procesamientos largos
-                    )
-                    # Actualizar configuracion
-                    config = load_statistics_config()
-                    config['processing'] = False
-                    config['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    if result.returncode == 0:
-                        config['error'] = None
-                        st.success("Estadisticas calculadas exitosamente. Mostrando resultados...")
-                        logger.info(f"Procesamiento completado para {variables_str}. Salida: {result.stdout}")
-                    else:
-                        config['error'] = result.stderr.strip() or "Error desconocido. Revisa los logs en /home/pi/logs/procesar_estadisticas_error.log."
-                        st.error(f"Error al calcular estadisticas: {config['error']}")
-                        logger.error(f"Error en procesar_estadisticas.py: {config['error']}")
-                    save_statistics_config(config)
-                    # Forzar recarga de resultados
-                    st.experimental_rerun()
-                except subprocess.TimeoutExpired:
-                    config = load_statistics_config()
-                    config['processing'] = False
-                    config['error'] = "Procesamiento excedio el tiempo maximo (24 horas)."
-                    config['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    save_statistics_config(config)
-                    st.error("Error: Tiempo de procesamiento excedido (24 horas).")
-                    logger.error("Tiempo de espera excedido")
-                except Exception as e:
-                    config = load_statistics_config()
-                    config['processing'] = False
-                    config['error'] = f"Error: {str(e)}"
-                    config['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    save_statistics_config(config)
-                    st.error(f"Error al calcular estadisticas: {e}")
-                    logger.error(f"Error al ejecutar procesar_estadisticas.py: {e}", exc_info=True)
+            job = statistics_jobs.submit(
+                st.session_state.selected_variables,
+                start_date.strftime('%Y-%m-%d'),
+                end_date.strftime('%Y-%m-%d'),
+                int(decimation_factor)
+            )
+            st.session_state.statistics_job = job.id
+            logger.info(f"Trabajo de estadisticas {job.id} para {variables_str} ({job.state})")
         st.markdown('</div>', unsafe_allow_html=True)
 
     with col2:
@@ -338,24 +186,41 @@ def main():
             st.session_state.selected_variables.pop()
         st.markdown('</div>', unsafe_allow_html=True)
 
-    # Mostrar resultados
-    results = load_results_from_excel()
-    if results:
-        config = load_statistics_config()
-        config_vars = config.get('variables', '').split(',')
-        for variable in st.session_state.selected_variables:
-            if variable in results:
-                with st.container():
-                    st.markdown('<div class="results-container">', unsafe_allow_html=True)
-                    st.subheader(f"Estadisticas para {VARIABLES_DISPLAY.get(variable, variable)}")
-                    st.table(results[variable])
-                    if variable not in config_vars:
-                        st.warning(f"Los resultados mostrados para {VARIABLES_DISPLAY.get(variable, variable)} son de un procesamiento anterior. Inicia un nuevo analisis para actualizar.")
-                    st.markdown('</div>', unsafe_allow_html=True)
-            else:
-                st.warning(f"No se encontraron resultados para {VARIABLES_DISPLAY.get(variable, variable)}. Asegura que los datos existan y el procesamiento se haya completado. Revisa los logs en /home/pi/logs/ para mas detalles.")
-    else:
+    # Mostrar progreso y resultados del ultimo trabajo de esta sesion
+    job = statistics_jobs.get_job(st.session_state.get('statistics_job'))
+    if job is None:
         st.info("No hay resultados disponibles. Selecciona variables y fechas, luego presiona 'Calcular Estadisticas'.")
+        return
+    if job.running:
+        # Solo se refresca la pagina mientras el trabajo esta en curso
+        st_autorefresh(interval=2000, key="refresh_estadisticas")
+        ultima = f", ultima: {VARIABLES_DISPLAY.get(job.current, job.current)}" if job.current else ""
+        st.progress(job.progress, text=f"Calculando estadisticas ({job.done}/{job.total} variables{ultima})")
+        return
+    if job.state == statistics_jobs.FAILED:
+        st.error(f"Error al calcular estadisticas: {job.error}. Revisa los logs en /home/pi/logs/procesar_estadisticas_error.log.")
+        return
+    results = {row['Variable']: {k: v for k, v in row.items() if k != 'Variable'} for row in job.results}
+    origen = "cache" if job.from_cache else "calculado"
+    st.caption(f"Resultados de {job.start_date} a {job.end_date} ({origen}, {job.finished.strftime('%Y-%m-%d %H:%M:%S')})")
+    for variable in st.session_state.selected_variables:
+        if variable in results:
+            with st.container():
+                st.markdown('<div class="results-container">', unsafe_allow_html=True)
+                st.subheader(f"Estadisticas para {VARIABLES_DISPLAY.get(variable, variable)}")
+                st.table(results[variable])
+                st.markdown('</div>', unsafe_allow_html=True)
+        elif variable not in job.variables:
+            st.warning(f"{VARIABLES_DISPLAY.get(variable, variable)} no estaba en el ultimo analisis. Inicia un nuevo analisis para actualizar.")
+        else:
+            st.warning(f"No se encontraron resultados para {VARIABLES_DISPLAY.get(variable, variable)}: {job.errors.get(variable, 'sin datos')}. Revisa los logs en /home/pi/logs/ para mas detalles.")
+    if results and st.button("Exportar a Excel"):
+        try:
+            path = procesar_estadisticas.export_results_excel(job.results)
+            st.success(f"Resultados exportados a {path}")
+        except Exception as e:
+            st.error(f"Error al exportar a Excel: {e}")
+            logger.error(f"Error al exportar a Excel: {e}", exc_info=True)
 
 def run():
     """Punto de entrada para la pagina de Estadisticas."""
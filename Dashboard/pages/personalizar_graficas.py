@@ -8,9 +8,15 @@ import logging
 import csv
 import plotly.graph_objects as go
 import numpy as np
-import re
-from config import BASE_DIR, CONSUMO_CONFIG_FILE, CONSUMO_CSV_FILE, HEATMAP_DATA_FILE, LOG_DIR
+from config import BASE_DIR, CONSUMO_CONFIG_FILE, CONSUMO_CSV_FILE, DOWNSAMPLING_METHODS, HEATMAP_DATA_FILE, LOG_DIR
 from data_collector import VARIABLES, VARIABLES_DISPLAY, UNITS
+import buffer_cache
+import columnar_storage
+import txt_reader
+import data_catalog
+import rollups
+import downsampling
+import heatmap_store
 
 # Configurar logging
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -22,36 +28,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Funciones de consumo_energia_page.py
-def limpiar_valor(valor):
-    try:
-        return float(valor)
-    except (ValueError, TypeError):
-        logger.warning(f"Valor no númerico: {valor}")
-        return None
-
 @st.cache_data(ttl=3600)
 def read_single_txt_file(file_path):
     try:
-        contenido = []
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                parts = line.strip().split(',')
-                if len(parts) != 2:
-                    continue
-                fecha, valor = parts
-                fecha = fecha.strip().split('.')[0]
-                valor_limpio = limpiar_valor(valor)
-                if valor_limpio is None:
-                    continue
-                fecha_dt = pd.to_datetime(fecha, format='%Y-%m-%d %H:%M:%S', errors='coerce')
-                if pd.isna(fecha_dt):
-                    continue
-                contenido.append([fecha_dt, valor_limpio])
-        if not contenido:
+        df = txt_reader.read_txt_file(file_path)
+        if df.empty:
             logger.warning(f"No se encontraron datos válidos en {file_path}")
-            return pd.DataFrame(columns=['fecha', 'valor'])
-        df = pd.DataFrame(contenido, columns=['fecha', 'valor'])
-        df = df.sort_values('fecha').dropna().reset_index(drop=True)
+            return df
         logger.info(f"Datos leídos de {file_path}: {len(df)} filas")
         return df
     except Exception as e:
@@ -115,6 +98,7 @@ def load_consumo_data():
         'consumo_hoy': 0.0,
         'costo_hoy': 0.0,
         'demanda_maxima': 0.0,
+        'demanda_maxima_fecha': None,
         'estimacion_factura': 0.0,
         'fecha_fin': 'No disponible'
     }
@@ -132,7 +116,7 @@ def load_consumo_data():
         logger.error(f"Error al cargar {CONSUMO_CONFIG_FILE}: {e}")
     return default_data
 
-def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energia, consumo=0.0, costo=0.0, dias_transcurridos=0, consumo_hoy=0.0, costo_hoy=0.0, demanda_maxima=0.0, estimacion_factura=0.0, fecha_fin='No disponible'):
+def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energia, consumo=0.0, costo=0.0, dias_transcurridos=0, consumo_hoy=0.0, costo_hoy=0.0, demanda_maxima=0.0, estimacion_factura=0.0, fecha_fin='No disponible', demanda_maxima_fecha=None):
     try:
         os.makedirs(os.path.dirname(CONSUMO_CONFIG_FILE), exist_ok=True)
         data = {
@@ -146,6 +130,7 @@ def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energ
             'consumo_hoy': consumo_hoy,
             'costo_hoy': costo_hoy,
             'demanda_maxima': demanda_maxima,
+            'demanda_maxima_fecha': demanda_maxima_fecha,
             'estimacion_factura': estimacion_factura,
             'fecha_fin': fecha_fin
         }
@@ -159,6 +144,7 @@ def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energ
             'consumo_hoy': consumo_hoy,
             'costo_hoy': costo_hoy,
             'demanda_maxima': demanda_maxima,
+            'demanda_maxima_fecha': demanda_maxima_fecha or '',
             'consumo_acumulado': consumo,
             'costo_acumulado': costo,
             'estimacion_factura': estimacion_factura
@@ -176,14 +162,20 @@ def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energ
         return None
 
 # Funciones de historicos_page.py
+HISTORICAL_TARGET_POINTS = 2000
+
 def generate_historical_graph(variable, start_date, end_date, logger):
     try:
-        df = pd.read_csv("/home/pi/Desktop/Medidor/Dashboard/data_buffer.csv")
-        df['fecha'] = pd.to_datetime(df['timestamp'])
-        df = df[df['fecha'].between(start_date, end_date)]
+        df = buffer_cache.get_buffer(since=start_date)
+        if df.empty:
+            logger.warning(f"No hay datos en el buffer desde {start_date}")
+            return None
+        df = df[df['timestamp'].between(start_date, end_date)].rename(columns={'timestamp': 'fecha'})
         if df.empty:
             logger.warning(f"No hay datos disponibles para {variable} en el periodo {start_date} a {end_date}")
             return None
+        df = df.sort_values('fecha')
+        df = downsampling.downsample(df, 'fecha', variable, HISTORICAL_TARGET_POINTS, DOWNSAMPLING_METHODS.get('historico', 'lttb'))
         fig = go.Figure()
         fig.add_trace(
             go.Scatter(
@@ -240,80 +232,135 @@ def generate_historical_graph(variable, start_date, end_date, logger):
 # Funciones de mapa_calor.py
 def listar_fechas_disponibles(variable):
     logger.info(f"Listando fechas disponibles para {variable}")
-    variable_lower = variable.lower()
-    current_hour_file = datetime.now().strftime('%Y-%m-%d %H') + '.txt'
-    available_dates = []
-    found_directories = []
-    for root, dirs, files in os.walk(BASE_DIR):
-        date_dir = os.path.basename(os.path.dirname(root))
-        if os.path.basename(root).lower() == variable_lower and re.match(r'\d{4}-\d{2}-\d{2}', date_dir):
-            found_directories.append(root)
-            if any(f.endswith('.txt') and f != current_hour_file for f in files):
-                try:
-                    date = datetime.strptime(date_dir, '%Y-%m-%d').date()
-                    available_dates.append(date)
-                except ValueError:
-                    logger.warning(f"Directorio con formato inválido: {date_dir}")
-    if not found_directories:
-        logger.warning(f"No se encontraron directorios para {variable}")
-    else:
-        logger.info(f"Directorios encontrados para {variable}: {found_directories}")
+    current_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+    try:
+        available_dates = data_catalog.list_dates(variable, exclude_hour=current_hour)
+    except Exception as e:
+        logger.error(f"Error consultando el catalogo para {variable}: {e}")
+        available_dates = []
     if not available_dates:
         logger.warning(f"No se encontraron fechas con datos para {variable}")
         return None, None, []
-    available_dates = sorted(available_dates)
     fecha_min = available_dates[0]
     fecha_max = available_dates[-1]
     logger.info(f"Fechas disponibles para {variable}: {[d.strftime('%Y-%m-%d') for d in available_dates]}")
     return fecha_min, fecha_max, available_dates
 
 def load_heatmap_config():
-    try:
-        if os.path.exists(HEATMAP_DATA_FILE):
-            with open(HEATMAP_DATA_FILE, 'rb') as f:
-                data = pickle.load(f)
-                logger.debug(f"Datos cargados de {HEATMAP_DATA_FILE}: {data.keys()}")
-                return {
-                    'fig': data.get('fig'),
-                    'variable': data.get('variable', 'Potencia_aparente_total'),
-                    'fecha_final': data.get('fecha_final', (datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)).strftime('%Y-%m-%d')),
-                    'last_update': data.get('last_update'),
-                    'manual_config': data.get('manual_config', False)
-                }
-    except Exception as e:
-        logger.error(f"Error al cargar {HEATMAP_DATA_FILE}: {e}")
+    default_fecha_final = (datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)).strftime('%Y-%m-%d')
+    heatmap = heatmap_store.load_heatmap()
+    if heatmap is not None:
+        return {
+            'variable': heatmap.get('variable') or 'Potencia_aparente_total',
+            'fecha_final': heatmap.get('fecha_final') or default_fecha_final,
+            'last_update': heatmap.get('last_update'),
+            'manual_config': heatmap.get('manual_config', False)
+        }
     return {
-        'fig': None,
         'variable': 'Potencia_aparente_total',
-        'fecha_final': (datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)).strftime('%Y-%m-%d'),
+        'fecha_final': default_fecha_final,
         'last_update': None,
         'manual_config': False
     }
 
-def save_heatmap_data(fig, variable, fecha_final, manual_config=False):
+def save_heatmap_data(heatmap, manual_config=False):
     try:
-        os.makedirs(os.path.dirname(HEATMAP_DATA_FILE), exist_ok=True)
-        data = {
-            'fig': fig,
-            'variable': variable,
-            'fecha_final': fecha_final,
-            'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'manual_config': manual_config
-        }
-        with open(HEATMAP_DATA_FILE, 'wb') as f:
-            pickle.dump(data, f)
-        os.chmod(HEATMAP_DATA_FILE, 0o664)
+        heatmap['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        heatmap['manual_config'] = manual_config
+        heatmap_store.save_heatmap(heatmap)
         logger.info(f"Mapa de calor guardado en {HEATMAP_DATA_FILE}, manual_config={manual_config}")
     except Exception as e:
         logger.error(f"Error al guardar {HEATMAP_DATA_FILE}: {e}")
         raise
 
+def render_heatmap(heatmap):
+    """Arma la figura de Plotly a partir de la matriz y las etiquetas guardadas."""
+    variable = heatmap['variable']
+    horas = heatmap['horas']
+    horas_completas = [f"{h:02d}:00" for h in range(24)]
+    fig = go.Figure(data=go.Heatmap(
+        z=heatmap['z'],
+        x=horas,
+        y=heatmap['dias'],
+        colorscale=[
+            [0.0, "rgb(128, 128, 128)"],
+            [0.001, "rgb(246, 255, 80)"],
+            [0.25, "rgb(252, 206, 80)"],
+            [0.5, "rgb(252, 149, 0)"],
+            [0.75, "rgb(252, 95, 0)"],
+            [1.0, "rgb(252, 0, 0)"]
+        ],
+        colorbar=dict(title=f"Valor ({UNITS[variable]})", tickformat=".2f"),
+        hovertemplate='Dia: %{y}<br>Hora: %{x}<br>Valor: %{z:.2f} ' + UNITS[variable] + '<extra></extra>',
+        zmin=heatmap['zmin'],
+        zmax=heatmap['zmax'],
+        zauto=False,
+        connectgaps=False,
+        showscale=True
+    ))
+    fig.update_traces(
+        xgap=1,
+        ygap=1
+    )
+    fig.update_layout(
+        xaxis=dict(
+            tickmode="array",
+            tickvals=horas[::4],
+            ticktext=horas_completas,
+            tickangle=-45,
+            tickfont=dict(size=12, color="white"),
+            showgrid=False,
+            zeroline=False,
+            showline=False
+        ),
+        yaxis=dict(
+            tickfont=dict(size=12, color="white", family="Segoe UI"),
+            automargin=True,
+            ticklabelposition="outside",
+            ticklabeloverflow="allow",
+            autorange="reversed",
+            showgrid=False,
+            zeroline=False,
+            showline=False
+        ),
+        title=heatmap.get('titulo') or f"{VARIABLES_DISPLAY[variable]} ({UNITS[variable]}), desde {heatmap['fecha_inicio']} hasta {heatmap['fecha_final']}",
+        title_font=dict(size=14, color="white", family="Arial", weight="normal"),
+        plot_bgcolor="#000000",
+        paper_bgcolor="#000000",
+        margin=dict(l=0, r=0, t=40, b=0),
+        height=300,
+        showlegend=False
+    )
+    return fig
+
+def load_precomputed_heatmap(variable, fecha_final, perfil=False):
+    """Mapa de heatmap_worker para la variable (el perfil semanal, o el de 8 dias si termina en fecha_final); None si no hay."""
+    path = heatmap_store.profile_path(variable) if perfil else heatmap_store.grid_path(variable)
+    heatmap = heatmap_store.load_heatmap(path)
+    if heatmap is None:
+        return None
+    if not perfil and heatmap['fecha_final'] != fecha_final.strftime('%Y-%m-%d'):
+        return None
+    logger.info(f"Mapa de calor precalculado de {variable} cargado desde {path}")
+    return heatmap
+
+@st.cache_resource(ttl=3600)
+def load_heatmap_figure(mtime):
+    """
+    (figura, datos) del mapa guardado; mtime (del archivo) invalida el cache al reescribirse.
+    cache_resource devuelve el mismo objeto a todas las sesiones (cache_data lo copiaria con
+    pickle en cada recarga), asi que la figura no se debe modificar.
+    """
+    heatmap = heatmap_store.load_heatmap()
+    if heatmap is None:
+        return None, None
+    return render_heatmap(heatmap), heatmap
+
 @st.cache_data(ttl=3600)
 def leer_archivos_txt_por_variable(variable, fecha_inicio=None, fecha_fin=None, exclude_current_hour=True):
     logger.info(f"Leyendo archivos para {variable}")
     contenido_completo = []
-    variable_lower = variable.lower()
-    current_hour_file = datetime.now().strftime('%Y-%m-%d %H') + '.txt'
+    txt_files = []
     if not os.path.exists(BASE_DIR):
         logger.error(f"Directorio {BASE_DIR} no existe")
         return pd.DataFrame(columns=['fecha', 'valor'])
@@ -324,37 +371,45 @@ def leer_archivos_txt_por_variable(variable, fecha_inicio=None, fecha_fin=None,
         if fecha_fin.hour == 0 and fecha_fin.minute == 0 and fecha_fin.second == 0:
             fecha_fin = fecha_fin.replace(hour=23, minute=59, second=59)
     found_directories = []
-    for root, dirs, files in os.walk(BASE_DIR):
-        date_dir = os.path.basename(os.path.dirname(root))
-        if os.path.basename(root).lower() != variable_lower:
+    # Los dias con archivo binario se leen de columnar_storage; el resto desde los .txt
+    binary_days = set()
+    if fecha_inicio is not None and fecha_fin is not None:
+        dia = fecha_inicio.date()
+        while dia <= fecha_fin.date():
+            if columnar_storage.has_day(variable, dia):
+                binary_days.add(dia.strftime('%Y-%m-%d'))
+            dia += timedelta(days=1)
+        if binary_days:
+            fin_lectura = fecha_fin
+            if exclude_current_hour:
+                fin_lectura = min(fecha_fin, pd.Timestamp(datetime.now().replace(minute=0, second=0, microsecond=0)) - pd.Timedelta(seconds=1))
+            df_binario = columnar_storage.read_range(variable, fecha_inicio, fin_lectura)
+            if not df_binario.empty:
+                contenido_completo.append(df_binario)
+    # Los archivos del rango salen del catalogo, sin recorrer BASE_DIR
+    current_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+    catalog_files = data_catalog.list_files(
+        variable,
+        fecha_inicio if fecha_inicio is not None and fecha_fin is not None else None,
+        fecha_fin if fecha_inicio is not None and fecha_fin is not None else None
+    )
+    for file_hour, file_path in catalog_files:
+        found_directories.append(os.path.dirname(file_path))
+        if file_hour.strftime('%Y-%m-%d') in binary_days:
+            continue
+        if exclude_current_hour and file_hour == current_hour:
             continue
-        if re.match(r'\d{4}-\d{2}-\d{2}', date_dir):
-            found_directories.append(root)
-        for archivo in sorted(files):
-            if not archivo.endswith('.txt'):
-                continue
-            if exclude_current_hour and archivo == current_hour_file:
-                continue
-            try:
-                file_datetime = pd.to_datetime(archivo.replace('.txt', ''), format='%Y-%m-%d %H', errors='coerce')
-                if pd.isna(file_datetime):
-                    logger.warning(f"Nombre de archivo invalido: {archivo}")
-                    continue
-                if fecha_inicio and fecha_fin:
-                    file_end = file_datetime + pd.Timedelta(hours=1) - pd.Timedelta(seconds=1)
-                    if file_end < fecha_inicio or file_datetime > fecha_fin:
-                        continue
-                file_path = os.path.join(root, archivo)
-                if not os.access(file_path, os.R_OK):
-                    logger.warning(f"Permiso denegado para {file_path}")
-                    continue
-                df = read_single_txt_file(file_path)
-                if not df.empty:
-                    if fecha_inicio and fecha_fin:
-                        df = df[(df['fecha'] >= fecha_inicio) & (df['fecha'] <= fecha_fin)]
-                    contenido_completo.append(df)
-            except Exception as e:
-                logger.warning(f"Error procesando archivo {archivo} en {root}: {e}")
+        if not os.access(file_path, os.R_OK):
+            logger.warning(f"Permiso denegado para {file_path}")
+            continue
+        txt_files.append(file_path)
+    if txt_files:
+        # Todos los .txt del rango se parsean en un solo lote
+        df = txt_reader.read_txt_files(txt_files)
+        if not df.empty:
+            if fecha_inicio and fecha_fin:
+                df = df[(df['fecha'] >= fecha_inicio) & (df['fecha'] <= fecha_fin)]
+            contenido_completo.append(df)
     if not found_directories:
         logger.warning(f"No se encontraron directorios para {variable}")
     if not contenido_completo:
@@ -365,6 +420,20 @@ def leer_archivos_txt_por_variable(variable, fecha_inicio=None, fecha_fin=None,
     logger.info(f"Datos leí­dos para {variable}: {len(df)} filas")
     return df
 
+def load_heatmap_rollup(variable, fecha_inicio, fecha_fin):
+    """Medias de 15 minutos desde los agregados precalculados; None si no cubren el rango."""
+    try:
+        if not rollups.covers(variable, '15m', fecha_inicio):
+            return None
+        df = rollups.read_rollup(variable, '15m', fecha_inicio, fecha_fin)
+    except Exception as e:
+        logger.error(f"Error leyendo agregados de 15 minutos para {variable}: {e}")
+        return None
+    if df.empty:
+        return None
+    logger.info(f"Mapa de calor de {variable} desde agregados: {len(df)} intervalos")
+    return df[['fecha', 'media']].rename(columns={'media': 'valor'})
+
 def generate_heatmap(variable, fecha_final, manual_config=False):
     try:
         if isinstance(fecha_final, str):
@@ -385,117 +454,44 @@ def generate_heatmap(variable, fecha_final, manual_config=False):
             now = datetime.now()
             if fecha_final_dt.date() == now.date():
                 fecha_final_dt = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
-        df = leer_archivos_txt_por_variable(variable, fecha_inicio_dt, fecha_final_dt, exclude_current_hour=exclude_current_hour)
+        df = load_heatmap_rollup(variable, fecha_inicio_dt, fecha_final_dt)
+        if df is None:
+            df = leer_archivos_txt_por_variable(variable, fecha_inicio_dt, fecha_final_dt, exclude_current_hour=exclude_current_hour)
         if df.empty:
             logger.error(f"No hay datos para {VARIABLES_DISPLAY[variable]} en el rango")
             st.error("No hay datos disponibles en el rango seleccionado.")
             return None
-        df["intervalo"] = df["fecha"].dt.floor('15min').dt.strftime('%H:%M')
-        df["fecha_dia"] = df["fecha"].dt.strftime('%b-%d')
         dias_mostrar = [fecha_final_dt.date() - timedelta(days=x) for x in range(7, -1, -1)]
-        dias_orden = [d.strftime('%b-%d') for d in dias_mostrar]
-        horas = [f"{h:02d}:{m:02d}" for h in range(24) for m in (0, 15, 30, 45)]
-        horas_completas = [f"{h:02d}:00" for h in range(24)]
-        base = pd.MultiIndex.from_product([dias_orden, horas], names=["fecha_dia", "intervalo"]).to_frame(index=False)
-        heatmap_data = df.groupby(["fecha_dia", "intervalo"])["valor"].mean().reset_index()
-        heatmap_full = base.merge(heatmap_data, on=["fecha_dia", "intervalo"], how="left")
+        z_data = heatmap_store.day_grid(df, dias_mostrar)
         if fecha_final_dt.date() == datetime.now().date() and not manual_config:
             ultima_hora_completa = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
             current_interval = ultima_hora_completa.strftime('%H:%M')
-            mask_future = (heatmap_full["fecha_dia"] == dias_orden[0]) & (heatmap_full["intervalo"] > current_interval)
-            heatmap_full.loc[mask_future, "valor"] = None
-        heatmap_full["fecha_dia"] = pd.Categorical(heatmap_full["fecha_dia"], categories=dias_orden, ordered=True)
-        heatmap_full = heatmap_full.sort_values(["fecha_dia", "intervalo"])
-        heatmap_pivot = heatmap_full.pivot(index="fecha_dia", columns="intervalo", values="valor")
-        heatmap_pivot = heatmap_pivot[horas]
-        z_data = np.array(heatmap_pivot.values)
-        valid_data = z_data[~np.isnan(z_data)]
-        if valid_data.size == 0:
+            z_data[0, [i for i, hora in enumerate(heatmap_store.HORAS) if hora > current_interval]] = np.nan
+        if np.isnan(z_data).all():
             logger.error("No hay datos validos para generar el mapa de calor")
             st.error("No hay datos validos para generar el mapa de calor.")
             return None
-        if variable == 'Voltaje_fase_1':
-            zmin = 105
-            zmax = 135
-            valid_data = valid_data[(valid_data >= 105) & (valid_data <= 135)]
-            if valid_data.size == 0:
-                logger.error("No hay valores válidos para Voltaje_fase_1 en el rango 105-135 V")
-                st.error("No hay valores validos para Voltaje_fase_1 en el rango 105-135 V.")
-                return None
-        elif variable == 'frecuencia':
-            zmin = 59
-            zmax = 61
-            valid_data = valid_data[(valid_data >= 59) & (valid_data <= 61)]
-            if valid_data.size == 0:
-                logger.error("No hay valores válidos para frecuencia en el rango 59-61 Hz")
-                st.error("No hay valores válidos para frecuencia en el rango 59-61 Hz.")
-                return None
-        else:
-            zmin = 0
-            zmax = valid_data.max()
-            valid_data = valid_data[valid_data >= 0]
-            if valid_data.size == 0:
-                logger.error(f"No hay valores validos para {variable} (todos son negativos)")
-                st.error(f"No hay valores validos para {variable} (todos son negativos).")
-                return None
-        if zmin == zmax:
-            zmin = zmin - 0.1
-            zmax = zmax + 0.1
+        scale = heatmap_store.color_scale(variable, z_data)
+        if scale is None:
+            rango = heatmap_store.COLOR_RANGES.get(variable)
+            detalle = f"en el rango {rango[0]}-{rango[1]} {UNITS[variable]}" if rango else "(todos son negativos)"
+            logger.error(f"No hay valores validos para {variable} {detalle}")
+            st.error(f"No hay valores validos para {VARIABLES_DISPLAY[variable]} {detalle}.")
+            return None
+        zmin, zmax = scale
         logger.info(f"Escala de colores para {variable}: zmin={zmin}, zmax={zmax}")
-        fig = go.Figure(data=go.Heatmap(
-            z=z_data,
-            x=heatmap_pivot.columns.tolist(),
-            y=heatmap_pivot.index.tolist(),
-            colorscale=[
-                [0.0, "rgb(128, 128, 128)"],
-                [0.001, "rgb(246, 255, 80)"],
-                [0.25, "rgb(252, 206, 80)"],
-                [0.5, "rgb(252, 149, 0)"],
-                [0.75, "rgb(252, 95, 0)"],
-                [1.0, "rgb(252, 0, 0)"]
-            ],
-            colorbar=dict(title=f"Valor ({UNITS[variable]})", tickformat=".2f"),
-            hovertemplate='Dia: %{y}<br>Hora: %{x}<br>Valor: %{z:.2f} ' + UNITS[variable] + '<extra></extra>',
-            zmin=zmin,
-            zmax=zmax,
-            zauto=False,
-            connectgaps=False,
-            showscale=True
-        ))
-        fig.update_traces(
-            xgap=1,
-            ygap=1
-        )
-        fig.update_layout(
-            xaxis=dict(
-                tickmode="array",
-                tickvals=horas[::4],
-                ticktext=horas_completas,
-                tickangle=-45,
-                tickfont=dict(size=12, color="white"),
-                showgrid=False,
-                zeroline=False,
-                showline=False
-            ),
-            yaxis=dict(
-                tickfont=dict(size=12, color="white", family="Segoe UI"),
-                automargin=True,
-                ticklabelposition="outside",
-                ticklabeloverflow="allow",
-                autorange="reversed",
-                showgrid=False,
-                zeroline=False,
-                showline=False
-            ),
-            title=f"{VARIABLES_DISPLAY[variable]} ({UNITS[variable]}), desde {fecha_inicio_dt.strftime('%Y-%m-%d')} hasta {fecha_final_dt.strftime('%Y-%m-%d')}",
-            title_font=dict(size=14, color="white", family="Arial", weight="normal"),
-            plot_bgcolor="#000000",
-            paper_bgcolor="#000000",
-            margin=dict(l=0, r=0, t=40, b=0),
-            height=300,
-            showlegend=False
-        )
-        save_heatmap_data(fig, variable, fecha_final_dt.strftime('%Y-%m-%d'), manual_config=manual_config)
+        heatmap = {
+            'z': z_data,
+            'dias': heatmap_store.day_labels(dias_mostrar),
+            'horas': heatmap_store.HORAS,
+            'variable': variable,
+            'fecha_inicio': fecha_inicio_dt.strftime('%Y-%m-%d'),
+            'fecha_final': fecha_final_dt.strftime('%Y-%m-%d'),
+            'zmin': zmin,
+            'zmax': zmax
+        }
+        save_heatmap_data(heatmap, manual_config=manual_config)
+        fig = render_heatmap(heatmap)
         st.success("Mapa de calor generado. Ver el resultado en el panel principal.")
         return fig
     except Exception as e:
@@ -662,12 +658,28 @@ def run():
                     key="heatmap_fecha_final",
                     disabled=not bool(available_dates)
                 )
+            tipo = st.radio(
+                "Tipo de mapa:",
+                options=["Ultimos 8 dias", "Perfil semanal"],
+                horizontal=True,
+                key="heatmap_tipo"
+            )
             col_submit = st.columns(1)[0]
             with col_submit:
                 generar = st.form_submit_button("Generar Mapa de Calor", disabled=not bool(available_dates))
             if generar:
                 with st.spinner("Generando mapa de calor..."):
-                    fig = generate_heatmap(variable, fecha_final, manual_config=True)
+                    perfil = tipo == "Perfil semanal"
+                    heatmap = load_precomputed_heatmap(variable, fecha_final, perfil=perfil)
+                    if heatmap is not None:
+                        save_heatmap_data(heatmap, manual_config=True)
+                        fig = render_heatmap(heatmap)
+                    elif perfil:
+                        fig = None
+                        st.error(f"El perfil semanal de {VARIABLES_DISPLAY[variable]} aun no se ha calculado.")
+                    else:
+                        # Fecha sin mapa precalculado: se arma desde los datos
+                        fig = generate_heatmap(variable, fecha_final, manual_config=True)
                     if fig:
                         st.session_state.heatmap_fig = fig
                         st.session_state.heatmap_variable = variable
@@ -10,10 +10,15 @@ import pandas as pd
 import os
 import sys
 import numpy as np
-import re
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from data_collector import VARIABLES, UNITS
+import columnar_storage
+import data_catalog
+import txt_reader
 from config import BASE_DIR, LOG_DIR, STATISTICS_OUTPUT_DIR
 
 # Configurar logging
@@ -25,150 +30,75 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def clean_value(value):
-    """Remove non-printable characters and return cleaned value."""
-    try:
-        if value is None or str(value).strip().lower() in ['none', '', 'nan']:
-            logger.warning(f"Value is None, empty, or 'nan': {value}")
-            return None
-        cleaned = re.sub(r'[^\x20-\x7E]', '', str(value)).strip()
-        if not cleaned:
-            logger.warning(f"Empty value after cleaning: {value}")
-            return None
-        value_float = float(cleaned)
-        return value_float
-    except (ValueError, TypeError) as e:
-        logger.error(f"Error cleaning value {value}: {e}", exc_info=True)
-        return None
-
-def format_date(date):
-    """Format date to match YYYY-MM-DD HH:MM:SS."""
-    try:
-        date = str(date).strip().split('.')[0]
-        date_dt = pd.to_datetime(date, format='%Y-%m-%d %H:%M:%S', errors='raise')
-        return date_dt
-    except Exception as e:
-        logger.error(f"Error formatting date: {date}, error: {e}", exc_info=True)
-        return None
-
-def convert_power_factor(fpr):
-    """Convert recorded power factor to valid range."""
-    try:
-        if fpr is None:
-            return None
-        fpr = float(fpr)
-        if -1 <= fpr <= 1:
-            return fpr
-        elif -2 <= fpr < -1:
-            return -2 - fpr
-        elif 1 < fpr <= 2:
-            return 2 - fpr
-        else:
-            logger.warning(f"Power factor out of expected range: {fpr}")
-            return fpr
-    except (ValueError, TypeError):
-        logger.error(f"Invalid power factor value: {fpr}", exc_info=True)
-        return None
+def convert_power_factor_array(values):
+    """Vectorized version of convert_power_factor for a NumPy array."""
+    values = np.asarray(values, dtype='float64')
+    return np.where((values >= -2) & (values < -1), -2 - values,
+                    np.where((values > 1) & (values <= 2), 2 - values, values))
 
 def read_text_files_by_variable(main_folder, variable, start_date, end_date):
     """Read text files for a variable within the specified date range."""
     try:
         start_date = pd.to_datetime(start_date)
         end_date = pd.to_datetime(end_date).replace(hour=23, minute=59, second=59)
-        dates = pd.date_range(start=start_date.floor('h'), end=end_date.floor('h'), freq='h')
-        full_content = []
-        files_checked = []
-        invalid_lines = []
-        sample_lines = []
-        variable_lower = variable.lower()
-        logger.debug(f"Reading files for variable {variable} ({variable_lower}) from {start_date} to {end_date}")
+        logger.debug(f"Reading files for variable {variable} from {start_date} to {end_date}")
 
+        frames = []
+        txt_files = []
         files_found = False
-        for date_hour in dates:
-            date_day = date_hour.strftime('%Y-%m-%d')
-            hour = date_hour.strftime('%H')
-            date_folder = None
-            base_date_path = os.path.join(main_folder, date_day)
-            if os.path.exists(base_date_path):
-                for folder in os.listdir(base_date_path):
-                    if folder.lower() == variable_lower:
-                        date_folder = os.path.join(base_date_path, folder)
-                        break
-            if not date_folder:
-                logger.debug(f"No folder found for {variable_lower} on {date_day}")
-                continue
-            file_name = f"{date_day} {hour}.txt"
-            file_path = os.path.join(date_folder, file_name)
-            files_checked.append(file_path)
-
-            if os.path.isfile(file_path):
+        # Hourly text files in range come from the catalog instead of listing each date folder
+        catalog_files = data_catalog.list_files(variable, start_date, end_date)
+        binary_days = set()
+        day = start_date.normalize()
+        while day <= end_date:
+            if columnar_storage.has_day(variable, day.date()):
+                # Dia completo desde el almacenamiento binario
+                binary_days.add(day.date())
                 files_found = True
-                if not os.access(file_path, os.R_OK):
-                    logger.warning(f"No read permissions for file: {file_path}")
-                    continue
-                logger.debug(f"Reading file: {file_path}")
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    lines = f.readlines()
-                    if not lines:
-                        logger.warning(f"Empty file: {file_path}")
-                        continue
-                    if len(sample_lines) < 5:
-                        sample_lines.extend(lines[:5-len(sample_lines)])
-                    for line in lines:
-                        try:
-                            parts = line.strip().split(',')
-                            if len(parts) != 2:
-                                logger.warning(f"Invalid line format in {file_path}: {line}")
-                                invalid_lines.append(line.strip())
-                                continue
-                            date, value = parts
-                            date_dt = format_date(date)
-                            if not date_dt:
-                                logger.warning(f"Invalid date in {file_path}: {line}")
-                                invalid_lines.append(line.strip())
-                                continue
-                            if start_date <= date_dt <= end_date:
-                                value_float = clean_value(value)
-                                if value_float is None and variable not in ['Factor_Potencia', 'Factor_Potencia_Conversion']:
-                                    logger.warning(f"Invalid value in {file_path}: {line}")
-                                    invalid_lines.append(line.strip())
-                                    continue
-                                if variable in ['Factor_Potencia', 'Factor_Potencia_Conversion']:
-                                    value_float = convert_power_factor(value_float)
-                                if value_float is not None:
-                                    full_content.append([date_dt, value_float])
-                            else:
-                                logger.debug(f"Line outside date range in {file_path}: {line}")
-                        except Exception as e:
-                            logger.warning(f"Error processing line in {file_path}: {line}, error: {e}")
-                            invalid_lines.append(line.strip())
-                            continue
-            else:
+                day_start = max(start_date, day)
+                day_end = min(end_date, day + pd.Timedelta(hours=23, minutes=59, seconds=59))
+                df_day = columnar_storage.read_range(variable, day_start, day_end)
+                logger.debug(f"Read {len(df_day)} binary records for {variable} on {day.date()}")
+                frames.append(df_day)
+            day += pd.Timedelta(days=1)
+        for file_hour, file_path in catalog_files:
+            if file_hour.date() in binary_days:
+                continue
+            if not os.path.isfile(file_path):
                 logger.debug(f"File not found: {file_path}")
+                continue
+            files_found = True
+            if not os.access(file_path, os.R_OK):
+                logger.warning(f"No read permissions for file: {file_path}")
+                continue
+            txt_files.append(file_path)
 
         if not files_found:
             error_msg = (
                 f"No files found for variable {variable} in range {start_date} to {end_date}. "
-                f"Checked paths: {files_checked[:5]}"
+                f"Checked paths: {[path for _, path in catalog_files][:5]}"
             )
             logger.error(error_msg)
             raise FileNotFoundError(error_msg)
 
-        if full_content:
-            df = pd.DataFrame(full_content, columns=['date', 'value'])
-            df = df.sort_values('date').dropna().reset_index(drop=True)
-            if df.empty:
-                error_msg = (
-                    f"No valid data points for {variable} in range {start_date} to {end_date}. "
-                    f"Sample lines: {sample_lines[:5]}. Invalid lines: {invalid_lines[:5]}"
-                )
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-            logger.info(f"Loaded {len(df)} data points for {variable} from {start_date} to {end_date}")
-            return df
+        if txt_files:
+            # All text files are parsed in one vectorized pass instead of line by line
+            df_txt = txt_reader.read_txt_files(txt_files, strip_non_printable=True)
+            frames.append(df_txt[(df_txt['fecha'] >= start_date) & (df_txt['fecha'] <= end_date)])
+            logger.debug(f"Read {len(df_txt)} text records for {variable} from {len(txt_files)} files")
+
+        frames = [frame for frame in frames if not frame.empty]
+        if frames:
+            df = pd.concat(frames, ignore_index=True).rename(columns={'fecha': 'date', 'valor': 'value'})
+            if variable in ['Factor_Potencia', 'Factor_Potencia_Conversion']:
+                df['value'] = convert_power_factor_array(df['value'].to_numpy(dtype='float64'))
+            df = df.sort_values('date', kind='stable').dropna().reset_index(drop=True)
+            if not df.empty:
+                logger.info(f"Loaded {len(df)} data points for {variable} from {start_date} to {end_date}")
+                return df
         error_msg = (
             f"No valid data found for {variable} in range {start_date} to {end_date}. "
-            f"Sample lines: {sample_lines[:5]}. Invalid lines: {invalid_lines[:5]}"
+            f"Text files read: {txt_files[:5]}"
         )
         logger.error(error_msg)
         raise ValueError(error_msg)
@@ -249,6 +179,85 @@ def analyze_data(df, variable):
         logger.error(f"Error analyzing data for {variable}: {e}", exc_info=True)
         raise RuntimeError(f"Error analyzing data for {variable}: {e}")
 
+# Processes for per-variable work (the Pi has 4 cores)
+MAX_PROCESSES = min(4, os.cpu_count() or 1)
+_pool = None
+
+def _get_pool():
+    """Persistent process pool, reused across calls so workers import pandas only once."""
+    global _pool
+    if _pool is None:
+        # forkserver: workers do not inherit the threads of the calling process (e.g. the dashboard)
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['procesar_estadisticas'])
+        _pool = ProcessPoolExecutor(max_workers=MAX_PROCESSES, mp_context=context)
+    return _pool
+
+def process_variable(variable, start_date, end_date, decimation_factor=1):
+    """Read and analyze one variable. Returns (results, error) with exactly one of them set."""
+    if variable not in VARIABLES:
+        logger.warning(f"Variable {variable} not in VARIABLES list: {VARIABLES}")
+        return None, "Variable desconocida"
+    try:
+        df = read_text_files_by_variable(BASE_DIR, variable, start_date, end_date)
+        if decimation_factor > 1:
+            df = df.iloc[::decimation_factor].reset_index(drop=True)
+        results = analyze_data(df, variable)
+        if not results:
+            logger.warning(f"No results generated for {variable}")
+            return None, "No se generaron resultados"
+        results['Variable'] = variable
+        logger.info(f"Successfully processed variable: {variable}")
+        return results, None
+    except Exception as e:
+        logger.error(f"Failed to process variable {variable}: {e}", exc_info=True)
+        return None, str(e)
+
+def process_variables(variables, start_date, end_date, decimation_factor=1, progress=None, parallel=True):
+    """
+    Compute statistics for each variable, in parallel across processes when there
+    is more than one. Returns (results_list, errors) in the order of variables, where
+    errors maps variable -> message. progress(variable, done), if given, is called
+    with the last finished variable and the number finished so far.
+    """
+    global _pool
+    outcomes = {}
+    if progress is not None:
+        progress(None, 0)
+    if parallel and len(variables) > 1:
+        try:
+            pool = _get_pool()
+            futures = {
+                pool.submit(process_variable, variable, start_date, end_date, decimation_factor): variable
+                for variable in variables
+            }
+            for future in as_completed(futures):
+                outcomes[futures[future]] = future.result()
+                if progress is not None:
+                    progress(futures[future], len(outcomes))
+        except (BrokenProcessPool, OSError) as e:
+            logger.error(f"Process pool failed, processing serially: {e}", exc_info=True)
+            _pool = None
+    for variable in variables:
+        if variable not in outcomes:
+            outcomes[variable] = process_variable(variable, start_date, end_date, decimation_factor)
+            if progress is not None:
+                progress(variable, len(outcomes))
+    results_list = [outcomes[variable][0] for variable in variables if outcomes[variable][0]]
+    errors = {variable: outcomes[variable][1] for variable in variables if outcomes[variable][1]}
+    return results_list, errors
+
+def export_results_excel(results_list, path=None):
+    """Save results to an Excel file (statistics_outputs/statistics_results_<timestamp>.xlsx by default)."""
+    if path is None:
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        path = os.path.join(STATISTICS_OUTPUT_DIR, f"statistics_results_{timestamp}.xlsx")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame(results_list).to_excel(path, index=False)
+    os.chmod(path, 0o664)
+    logger.info(f"Results saved to {path}")
+    return path
+
 def main():
     """Process statistics for given variables and date range, and save to Excel with timestamp."""
     logger.info(f"Starting procesar_estadisticas.py with arguments: {sys.argv}")
@@ -264,37 +273,12 @@ def main():
         decimation_factor = int(sys.argv[4])
         logger.info(f"Processing variables: {variables}, start_date: {start_date}, end_date: {end_date}, decimation_factor: {decimation_factor}")
 
-        results_list = []
-        for variable in variables:
-            if variable not in VARIABLES:
-                logger.warning(f"Variable {variable} not in VARIABLES list: {VARIABLES}")
-                print(f"Warning: Variable {variable} not in VARIABLES list")
-                continue
-            try:
-                df = read_text_files_by_variable(BASE_DIR, variable, start_date, end_date)
-                if decimation_factor > 1:
-                    df = df.iloc[::decimation_factor].reset_index(drop=True)
-                results = analyze_data(df, variable)
-                if results:
-                    results['Variable'] = variable
-                    results_list.append(results)
-                    logger.info(f"Successfully processed variable: {variable}")
-                else:
-                    logger.warning(f"No results generated for {variable}")
-                    print(f"Warning: No results generated for {variable}")
-            except Exception as e:
-                logger.error(f"Failed to process variable {variable}: {e}", exc_info=True)
-                print(f"Error processing variable {variable}: {e}")
-                continue
+        results_list, errors = process_variables(variables, start_date, end_date, decimation_factor)
+        for variable, error in errors.items():
+            print(f"Error processing variable {variable}: {error}")
 
         if results_list:
-            df_results = pd.DataFrame(results_list)
-            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-            results_excel = os.path.join(STATISTICS_OUTPUT_DIR, f"statistics_results_{timestamp}.xlsx")
-            os.makedirs(STATISTICS_OUTPUT_DIR, exist_ok=True)
-            df_results.to_excel(results_excel, index=False)
-            os.chmod(results_excel, 0o664)
-            logger.info(f"Results saved to {results_excel}")
+            export_results_excel(results_list)
         else:
             error_msg = (
                 f"No se generaron resultados para ninguna variable. "
@@ -0,0 +1,194 @@
+# rollups.py
+"""
+Agregados precalculados por variable a 1 minuto, 15 minutos, 1 hora y 1 dia.
+
+Cada nivel guarda por intervalo el minimo, maximo, suma, conteo y ultimo valor
+(la media es suma/conteo) en ROLLUPS_FILE (SQLite). El colector acumula el minuto
+en curso en memoria y al cerrarlo lo combina con los cuatro niveles en una sola
+transaccion. Las graficas leen el nivel mas grueso que todavia da target_points.
+
+Para recuperar o completar dias anteriores desde el almacenamiento binario:
+"python rollups.py reconstruir YYYY-MM-DD [YYYY-MM-DD]".
+"""
+import os
+import sys
+import math
+import sqlite3
+import logging
+from contextlib import closing
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import columnar_storage
+from buffer_segments import set_file_owner
+from config import ROLLUPS_FILE
+
+logger = logging.getLogger(__name__)
+
+# Niveles de agregacion en segundos, de fino a grueso
+TIERS = {'1m': 60, '15m': 900, '1h': 3600, '1d': 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    variable TEXT NOT NULL,
+    nivel TEXT NOT NULL,
+    inicio INTEGER NOT NULL,
+    minimo REAL NOT NULL,
+    maximo REAL NOT NULL,
+    suma REAL NOT NULL,
+    conteo INTEGER NOT NULL,
+    ultimo REAL NOT NULL,
+    PRIMARY KEY (variable, nivel, inicio)
+)
+"""
+
+# Combina un agregado nuevo con el intervalo existente
+MERGE_SQL = """
+INSERT INTO rollups (variable, nivel, inicio, minimo, maximo, suma, conteo, ultimo)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (variable, nivel, inicio) DO UPDATE SET
+    minimo = MIN(minimo, excluded.minimo),
+    maximo = MAX(maximo, excluded.maximo),
+    suma = suma + excluded.suma,
+    conteo = conteo + excluded.conteo,
+    ultimo = excluded.ultimo
+"""
+
+REPLACE_SQL = """
+INSERT OR REPLACE INTO rollups (variable, nivel, inicio, minimo, maximo, suma, conteo, ultimo)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _connect():
+    new_file = not os.path.exists(ROLLUPS_FILE)
+    conn = sqlite3.connect(ROLLUPS_FILE, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    if new_file:
+        try:
+            set_file_owner(ROLLUPS_FILE)
+        except OSError as e:
+            logger.warning(f"No se pudo ajustar permisos de {ROLLUPS_FILE}: {e}")
+    return conn
+
+class RollupWriter:
+    """Acumula el minuto en curso por variable y lo escribe en todos los niveles al cerrarse."""
+
+    def __init__(self):
+        self.minute = None
+        self.pending = {}
+
+    def add(self, timestamp, values):
+        minute = columnar_storage.to_epoch(timestamp) // TIERS['1m'] * TIERS['1m']
+        if self.minute is not None and minute != self.minute:
+            self.flush()
+        self.minute = minute
+        for variable, value in values.items():
+            if value is None or math.isnan(value):
+                continue
+            agg = self.pending.get(variable)
+            if agg is None:
+                self.pending[variable] = [value, value, value, 1, value]
+            else:
+                agg[0] = min(agg[0], value)
+                agg[1] = max(agg[1], value)
+                agg[2] += value
+                agg[3] += 1
+                agg[4] = value
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        rows = []
+        for variable, (minimo, maximo, suma, conteo, ultimo) in self.pending.items():
+            for tier, seconds in TIERS.items():
+                rows.append((variable.lower(), tier, self.minute // seconds * seconds, minimo, maximo, suma, conteo, ultimo))
+        with closing(_connect()) as conn, conn:
+            conn.executemany(MERGE_SQL, rows)
+        self.pending = {}
+        return len(rows)
+
+def last_minutes():
+    """{variable: inicio del ultimo minuto guardado} para saber que muestras reaplicar tras un corte."""
+    if not os.path.exists(ROLLUPS_FILE):
+        return {}
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT variable, MAX(inicio) FROM rollups WHERE nivel = '1m' GROUP BY variable").fetchall()
+    return dict(rows)
+
+def choose_tier(start, end, target_points):
+    """Nivel mas grueso que da al menos target_points intervalos entre start y end, o None (datos crudos)."""
+    span = (end - start).total_seconds()
+    for tier, seconds in sorted(TIERS.items(), key=lambda item: -item[1]):
+        if span / seconds >= target_points:
+            return tier
+    return None
+
+def read_rollup(variable, tier, start, end):
+    """DataFrame fecha/minimo/maximo/media/conteo/ultimo de los intervalos que empiezan entre start y end."""
+    start_epoch = columnar_storage.to_epoch(start) // TIERS[tier] * TIERS[tier]
+    end_epoch = columnar_storage.to_epoch(end)
+    if not os.path.exists(ROLLUPS_FILE):
+        return pd.DataFrame(columns=['fecha', 'minimo', 'maximo', 'media', 'conteo', 'ultimo'])
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT inicio, minimo, maximo, suma, conteo, ultimo FROM rollups "
+            "WHERE variable = ? AND nivel = ? AND inicio BETWEEN ? AND ? ORDER BY inicio",
+            (variable.lower(), tier, start_epoch, end_epoch)).fetchall()
+    if not rows:
+        return pd.DataFrame(columns=['fecha', 'minimo', 'maximo', 'media', 'conteo', 'ultimo'])
+    data = np.array(rows, dtype='float64')
+    return pd.DataFrame({
+        'fecha': pd.to_datetime(data[:, 0].astype('int64'), unit='s'),
+        'minimo': data[:, 1],
+        'maximo': data[:, 2],
+        'media': data[:, 3] / data[:, 4],
+        'conteo': data[:, 4].astype('int64'),
+        'ultimo': data[:, 5]
+    })
+
+def covers(variable, tier, start):
+    """True si el nivel tiene datos desde start (el primer intervalo no es posterior a start)."""
+    if not os.path.exists(ROLLUPS_FILE):
+        return False
+    with closing(_connect()) as conn:
+        first = conn.execute(
+            "SELECT MIN(inicio) FROM rollups WHERE variable = ? AND nivel = ?",
+            (variable.lower(), tier)).fetchone()[0]
+    return first is not None and first <= columnar_storage.to_epoch(start) // TIERS[tier] * TIERS[tier] + TIERS[tier]
+
+def rebuild_day(date, variables):
+    """Recalcula los agregados de un dia desde el almacenamiento binario (reemplaza los existentes)."""
+    rows = []
+    for variable in variables:
+        records = columnar_storage.load_day(variable, date)
+        if not records.size:
+            continue
+        records = np.array(records[~np.isnan(records['v'])])
+        if not records.size:
+            continue
+        records = records[np.argsort(records['t'], kind='stable')]
+        df = pd.DataFrame({'t': records['t'], 'v': records['v'].astype('float64')})
+        for tier, seconds in TIERS.items():
+            grouped = df.groupby(df['t'] // seconds * seconds)['v'].agg(['min', 'max', 'sum', 'count', 'last'])
+            rows.extend(
+                (variable.lower(), tier, int(inicio), row[0], row[1], row[2], int(row[3]), row[4])
+                for inicio, row in zip(grouped.index, grouped.itertuples(index=False))
+            )
+    with closing(_connect()) as conn, conn:
+        conn.executemany(REPLACE_SQL, rows)
+    logger.info(f"Agregados reconstruidos para {date}: {len(rows)} intervalos")
+    return len(rows)
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != 'reconstruir':
+        print("Uso: python rollups.py reconstruir YYYY-MM-DD [YYYY-MM-DD]")
+        sys.exit(1)
+    from data_collector import VARIABLES
+    day = datetime.strptime(sys.argv[2], '%Y-%m-%d').date()
+    last_day = datetime.strptime(sys.argv[-1], '%Y-%m-%d').date()
+    total = 0
+    while day <= last_day:
+        total += rebuild_day(day, VARIABLES)
+        day += timedelta(days=1)
+    print(f"Intervalos reconstruidos: {total}")
@@ -0,0 +1,192 @@
+# sample_wal.py
+"""
+Registro de escritura anticipada (WAL) binario de las muestras crudas del colector.
+
+El WAL es un consumidor mas del colector: cada muestra se agrega al segmento de
+su hora (SAMPLE_WAL_DIR/wal_YYYY-MM-DD_HH.bin) en cuanto llega y se sincroniza
+con un solo fsync secuencial, asi los demas consumidores pueden sincronizar a
+disco con menos frecuencia: tras un corte de energia, read_samples() devuelve las
+muestras del WAL y cada consumidor reaplica solo las que no alcanzo a guardar.
+
+Formato de un segmento:
+  encabezado: b'MWAL', version (uint8), largo (uint16) y nombres de las variables separados por comas
+  registro:   largo del contenido (uint32), CRC32 del contenido (uint32) y contenido:
+              timestamp (float64, segundos desde 1970 en hora local), muestra valida (uint8),
+              mascara de variables leidas (uint64) y un float64 por variable (NaN = None)
+La lectura de un segmento se detiene en el primer registro incompleto o con CRC
+invalido (la escritura que se interrumpio). Los segmentos se borran cuando ya
+no son de las ultimas WAL_KEEP_HOURS horas.
+"""
+import os
+import math
+import struct
+import zlib
+import logging
+from datetime import datetime, timedelta
+from buffer_segments import set_file_owner
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MWAL'
+VERSION = 1
+HEADER_STRUCT = struct.Struct('<4sBH')
+RECORD_HEADER = struct.Struct('<II')
+SAMPLE_HEADER = struct.Struct('<dBQ')
+SEGMENT_PREFIX = "wal_"
+SEGMENT_FORMAT = "%Y-%m-%d_%H"
+EPOCH = datetime(1970, 1, 1)
+# Horas de WAL que se conservan; para entonces todos los consumidores ya sincronizaron
+WAL_KEEP_HOURS = 2
+
+def _encode(sample, variables):
+    mask = 0
+    data = sample['data']
+    for i, variable in enumerate(variables):
+        if variable in sample['values']:
+            mask |= 1 << i
+    values = [float('nan') if data.get(variable) is None else data[variable] for variable in variables]
+    payload = SAMPLE_HEADER.pack((sample['timestamp'] - EPOCH).total_seconds(), 1 if sample['valid'] else 0, mask)
+    payload += struct.pack(f'<{len(variables)}d', *values)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+def _decode(payload, variables):
+    seconds, valid, mask = SAMPLE_HEADER.unpack_from(payload)
+    values = struct.unpack_from(f'<{len(variables)}d', payload, SAMPLE_HEADER.size)
+    timestamp = EPOCH + timedelta(seconds=seconds)
+    data = {'timestamp': timestamp}
+    samples = {}
+    for i, (variable, value) in enumerate(zip(variables, values)):
+        data[variable] = None if math.isnan(value) else value
+        if mask & (1 << i):
+            samples[variable] = data[variable]
+    return {'timestamp': timestamp, 'data': data, 'values': samples, 'valid': bool(valid)}
+
+def _scan_segment(path):
+    """(muestras validas en orden hasta el primer registro danado, offset donde terminan)."""
+    samples = []
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_STRUCT.size)
+        if len(header) < HEADER_STRUCT.size:
+            return samples, 0
+        magic, version, names_size = HEADER_STRUCT.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            logger.error(f"{path} no es un segmento de WAL valido")
+            return samples, 0
+        variables = f.read(names_size).decode('utf-8').split(',')
+        end = f.tell()
+        while True:
+            record_header = f.read(RECORD_HEADER.size)
+            if not record_header:
+                break
+            if len(record_header) < RECORD_HEADER.size:
+                logger.warning(f"Registro incompleto al final de {path}")
+                break
+            size, crc = RECORD_HEADER.unpack(record_header)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                logger.warning(f"Registro danado en {path} (offset {f.tell() - len(payload) - RECORD_HEADER.size}), se ignora el resto")
+                break
+            samples.append(_decode(payload, variables))
+            end = f.tell()
+    return samples, end
+
+def read_segment(path):
+    return _scan_segment(path)[0]
+
+class SampleWAL:
+    def __init__(self, directory, variables, fsync_samples=1):
+        self.directory = directory
+        self.variables = list(variables)
+        self.fsync_samples = fsync_samples
+        self._file = None
+        self._segment = None
+        self._unsynced = 0
+
+    def list_segments(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith('.bin')
+        )
+
+    def read_samples(self):
+        """Todas las muestras de los segmentos existentes, en orden."""
+        samples = []
+        for path in self.list_segments():
+            try:
+                samples.extend(read_segment(path))
+            except OSError as e:
+                logger.error(f"Error leyendo {path}: {e}")
+        if samples:
+            logger.info(f"WAL: {len(samples)} muestras desde {samples[0]['timestamp']} hasta {samples[-1]['timestamp']}")
+        return samples
+
+    def _segment_path(self, timestamp):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{timestamp.strftime(SEGMENT_FORMAT)}.bin")
+
+    def _header(self):
+        names = ','.join(self.variables).encode('utf-8')
+        return HEADER_STRUCT.pack(MAGIC, VERSION, len(names)) + names
+
+    def _open_segment(self, path):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        header = self._header()
+        new_file = not os.path.exists(path)
+        if not new_file:
+            with open(path, 'rb') as f:
+                same_header = f.read(len(header)) == header
+            if not same_header:
+                # Segmento de una ejecucion con otras variables; ya se reaplico al arrancar
+                logger.warning(f"{path} tiene otro encabezado, se reinicia")
+                new_file = True
+            else:
+                # Quitar un registro a medias de la ejecucion anterior antes de seguir agregando
+                end = _scan_segment(path)[1]
+                if end < os.path.getsize(path):
+                    logger.warning(f"Se recorta {path} de {os.path.getsize(path)} a {end} bytes")
+                    os.truncate(path, end)
+        self._file = open(path, 'wb' if new_file else 'ab')
+        if new_file:
+            self._file.write(header)
+            set_file_owner(path)
+        self._segment = path
+        self._remove_old_segments()
+
+    def _remove_old_segments(self):
+        keep = {self._segment}
+        current = datetime.strptime(os.path.basename(self._segment)[len(SEGMENT_PREFIX):-4], SEGMENT_FORMAT)
+        for hours in range(1, WAL_KEEP_HOURS):
+            keep.add(self._segment_path(current - timedelta(hours=hours)))
+        for path in self.list_segments():
+            if path not in keep:
+                os.remove(path)
+                logger.info(f"Segmento de WAL {path} eliminado")
+
+    def write_batch(self, batch):
+        """Agrega las muestras al segmento de su hora; al volver ya estan sincronizadas (segun fsync_samples)."""
+        for sample in batch:
+            path = self._segment_path(sample['timestamp'])
+            if path != self._segment:
+                if self._segment is not None and path < self._segment:
+                    # Muestra con hora anterior (p. ej. reloj ajustado): se queda en el segmento actual
+                    path = self._segment
+                else:
+                    self._open_segment(path)
+            self._file.write(_encode(sample, self.variables))
+            self._unsynced += 1
+        if self._unsynced >= self.fsync_samples:
+            self.sync()
+
+    def sync(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
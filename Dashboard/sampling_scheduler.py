@@ -0,0 +1,75 @@
+# sampling_scheduler.py
+"""
+Programador de lecturas a tasa fija sin deriva.
+
+Los ticks caen en multiplos exactos del reloj de pared (p. ej. :00, :05, :10 con
+periodo de 5 s) y se esperan con plazos de time.monotonic, asi el tiempo de
+lectura y escritura no se acumula como desfase. Cada grupo de variables tiene su
+propio periodo (multiplo del tick base): en cada tick se devuelven los grupos que
+tocan. Si el trabajo de un tick se atrasa mas de un periodo base, los ticks
+perdidos se saltan, se cuentan y se registran en el log en lugar de leerlos
+tarde. Si el reloj de pared salta (NTP) se vuelve a alinear.
+"""
+import math
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Diferencia maxima (segundos) entre el reloj de pared y el monotonic antes de realinear
+MAX_CLOCK_DRIFT = 1.0
+
+class SamplingScheduler:
+    def __init__(self, periods, monotonic=time.monotonic, wall_clock=time.time, sleep=time.sleep):
+        """periods: {grupo: segundos enteros}; el tick base es su maximo comun divisor."""
+        if not periods or any(int(period) != period or period < 1 for period in periods.values()):
+            raise ValueError(f"Los periodos deben ser enteros de al menos 1 s: {periods}")
+        self.periods = {name: int(period) for name, period in periods.items()}
+        self.base = math.gcd(*self.periods.values())
+        self._monotonic = monotonic
+        self._wall_clock = wall_clock
+        self._sleep = sleep
+        self.missed_ticks = 0
+        self.late_ticks = 0
+        self._align()
+
+    def _align(self):
+        """Fija el siguiente tick en el proximo multiplo del periodo base del reloj de pared."""
+        now_wall = self._wall_clock()
+        self._offset = now_wall - self._monotonic()
+        self._tick = math.floor(now_wall / self.base + 1) * self.base
+        logger.info(f"Lecturas alineadas cada {self.base} s, primer tick {datetime.fromtimestamp(self._tick)}")
+
+    def wait_next(self):
+        """Espera el siguiente tick y devuelve (hora programada, grupos que tocan, ticks perdidos antes de este)."""
+        deadline = self._tick - self._offset
+        now = self._monotonic()
+        missed = 0
+        if now >= deadline + self.base:
+            missed = int((now - deadline) // self.base)
+            logger.warning(
+                f"{missed} lecturas perdidas desde {datetime.fromtimestamp(self._tick):%Y-%m-%d %H:%M:%S} "
+                f"(atraso de {now - deadline:.2f} s)"
+            )
+            self._tick += missed * self.base
+            self.missed_ticks += missed
+            deadline = self._tick - self._offset
+        delay = deadline - self._monotonic()
+        if delay > 0:
+            self._sleep(delay)
+        elif delay < 0:
+            self.late_ticks += 1
+        drift = self._wall_clock() - (self._monotonic() + self._offset)
+        if abs(drift) > MAX_CLOCK_DRIFT:
+            logger.warning(f"El reloj de pared se movio {drift:+.2f} s, realineando lecturas")
+            self._align()
+            tick, due, more_missed = self.wait_next()
+            return tick, due, missed + more_missed
+        tick = self._tick
+        self._tick += self.base
+        due = [name for name, period in self.periods.items() if round(tick) % period == 0]
+        return datetime.fromtimestamp(tick), due, missed
+
+    def stats(self):
+        return {'perdidas': self.missed_ticks, 'atrasadas': self.late_ticks}
@@ -0,0 +1,186 @@
+# statistics_jobs.py
+"""
+Estadisticas como trabajos dentro del proceso del dashboard.
+
+submit() encola el calculo (procesar_estadisticas.process_variables) en un pool
+de hilos del proceso, sin lanzar otro interprete, y devuelve un Job con su
+estado y progreso (variables terminadas de total). Los resultados se guardan en
+cache por (variables, rango, diezmado): en memoria y como JSON en
+STATISTICS_CACHE_DIR. Un rango que incluye el dia de hoy sigue creciendo, asi
+que solo se guarda en memoria durante OPEN_RANGE_TTL segundos.
+
+El Excel ya no es el formato de intercambio; procesar_estadisticas.export_results_excel
+queda como exportacion opcional.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import procesar_estadisticas
+from buffer_segments import set_file_owner
+from config import STATISTICS_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Trabajos simultaneos (cada uno ya reparte sus variables entre los nucleos)
+MAX_WORKERS = 1
+# Segundos que vale en memoria el resultado de un rango que incluye hoy
+OPEN_RANGE_TTL = 300
+# Trabajos terminados que se conservan para consultar su estado
+MAX_FINISHED_JOBS = 20
+
+PENDING = 'en_cola'
+RUNNING = 'procesando'
+DONE = 'terminado'
+FAILED = 'error'
+
+class Job:
+    def __init__(self, key, variables, start_date, end_date, decimation_factor):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.variables = list(variables)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.decimation_factor = decimation_factor
+        self.state = PENDING
+        self.done = 0
+        self.current = None
+        self.results = None
+        self.errors = {}
+        self.error = None
+        self.from_cache = False
+        self.created = datetime.now()
+        self.finished = None
+
+    @property
+    def total(self):
+        return len(self.variables)
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def running(self):
+        return self.state in (PENDING, RUNNING)
+
+_lock = threading.Lock()
+_executor = None
+_jobs = {}
+_memory_cache = {}
+
+def cache_key(variables, start_date, end_date, decimation_factor):
+    return json.dumps([sorted(variables), str(start_date), str(end_date), int(decimation_factor)])
+
+def _cache_path(key):
+    return os.path.join(STATISTICS_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+def _is_open_range(end_date):
+    return str(end_date) >= datetime.now().strftime('%Y-%m-%d')
+
+def _json_value(value):
+    # Los conteos de numpy (p. ej. eventos fuera de rango) no son serializables directamente
+    return value.item() if hasattr(value, 'item') else str(value)
+
+def get_cached(key, end_date):
+    """{'resultados', 'errores', 'calculado'} de la cache, o None si no hay o ya no vale."""
+    open_range = _is_open_range(end_date)
+    entry = _memory_cache.get(key)
+    if entry is not None and (not open_range or time.monotonic() - entry[0] < OPEN_RANGE_TTL):
+        return entry[1]
+    if open_range:
+        return None
+    try:
+        with open(_cache_path(key), 'r') as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Cache de estadisticas danada en {_cache_path(key)}: {e}")
+        return None
+    _memory_cache[key] = (time.monotonic(), payload)
+    return payload
+
+def _store(key, end_date, payload):
+    _memory_cache[key] = (time.monotonic(), payload)
+    if _is_open_range(end_date):
+        return
+    try:
+        os.makedirs(STATISTICS_CACHE_DIR, exist_ok=True)
+        path = _cache_path(key)
+        temp_file = path + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(payload, f, default=_json_value)
+        os.replace(temp_file, path)
+        set_file_owner(path)
+    except OSError as e:
+        logger.error(f"Error guardando la cache de estadisticas: {e}")
+
+def _run(job):
+    job.state = RUNNING
+    logger.info(f"Trabajo {job.id}: {job.variables} de {job.start_date} a {job.end_date}, diezmado {job.decimation_factor}")
+
+    def progress(variable, done):
+        job.current = variable
+        job.done = done
+
+    try:
+        results, errors = procesar_estadisticas.process_variables(
+            job.variables, job.start_date, job.end_date, job.decimation_factor, progress=progress)
+        payload = {
+            'resultados': results,
+            'errores': errors,
+            'calculado': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        if results:
+            _store(job.key, job.end_date, payload)
+        job.results = results
+        job.errors = errors
+        job.state = DONE
+        logger.info(f"Trabajo {job.id} terminado: {len(results)} variables, errores: {errors}")
+    except Exception as e:
+        job.error = str(e)
+        job.state = FAILED
+        logger.error(f"Error en el trabajo de estadisticas {job.id}: {e}", exc_info=True)
+    finally:
+        job.current = None
+        job.finished = datetime.now()
+
+def _prune_jobs():
+    finished = sorted((job for job in _jobs.values() if not job.running), key=lambda job: job.created)
+    for job in finished[:-MAX_FINISHED_JOBS]:
+        del _jobs[job.id]
+
+def submit(variables, start_date, end_date, decimation_factor=1):
+    """Devuelve el Job de la consulta: uno ya en curso con la misma clave, uno resuelto desde la cache o uno nuevo."""
+    global _executor
+    key = cache_key(variables, start_date, end_date, decimation_factor)
+    with _lock:
+        for job in _jobs.values():
+            if job.key == key and job.running:
+                return job
+        job = Job(key, variables, start_date, end_date, decimation_factor)
+        cached = get_cached(key, end_date)
+        if cached is not None:
+            job.results = cached['resultados']
+            job.errors = cached.get('errores', {})
+            job.done = job.total
+            job.state = DONE
+            job.from_cache = True
+            job.finished = datetime.now()
+            logger.info(f"Estadisticas desde la cache para {variables} de {start_date} a {end_date}")
+        else:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='estadisticas')
+            _executor.submit(_run, job)
+        _jobs[job.id] = job
+        _prune_jobs()
+    return job
+
+def get_job(job_id):
+    return _jobs.get(job_id)
@@ -0,0 +1,91 @@
+# system_probes.py
+"""
+Sondas del sistema (CPU, disco, temperatura, Internet) que corren fuera del bucle
+de alertas.
+
+Cada sonda se ejecuta en su propio hilo con su periodo y guarda su ultimo
+resultado; el bucle principal solo lee ese resultado en cache, asi un ping lento
+o una lectura de CPU nunca retrasan la revision de variables electricas ni el
+latido.
+"""
+import subprocess
+import threading
+import logging
+from datetime import datetime
+import psutil
+
+logger = logging.getLogger(__name__)
+
+THERMAL_ZONE_FILE = "/sys/class/thermal/thermal_zone0/temp"
+PING_HOST = "8.8.8.8"
+PING_TIMEOUT = 5
+
+def read_cpu_percent():
+    """Uso de CPU desde la llamada anterior (sin bloquear); la primera llamada solo fija la referencia."""
+    return psutil.cpu_percent(interval=None)
+
+def read_disk_usage():
+    """(porcentaje de uso, espacio libre en GB) de la particion raiz."""
+    usage = psutil.disk_usage('/')
+    return usage.percent, usage.free / (1024**3)
+
+def read_temperature():
+    """Temperatura del SoC en C desde sysfs (el archivo esta en milesimas de grado)."""
+    with open(THERMAL_ZONE_FILE, 'r') as f:
+        return int(f.read().strip()) / 1000.0
+
+def check_internet():
+    try:
+        result = subprocess.run(['ping', '-c', '1', PING_HOST], capture_output=True, text=True, timeout=PING_TIMEOUT)
+        return result.returncode == 0
+    except subprocess.TimeoutExpired:
+        return False
+
+class ProbeResult:
+    def __init__(self, value, timestamp):
+        self.value = value
+        self.timestamp = timestamp
+
+class ProbeScheduler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._probes = {}
+        self._results = {}
+        self._stop = threading.Event()
+        self._threads = []
+
+    def register(self, name, func, period, delay=0):
+        """Registra una sonda; func se ejecuta cada period segundos (la primera vez despues de delay) en su propio hilo."""
+        self._probes[name] = (func, period, delay)
+
+    def _run_once(self, name, func):
+        try:
+            value = func()
+            logger.debug(f"Sonda {name}: {value}")
+        except Exception as e:
+            logger.error(f"Error en la sonda {name}: {e}", exc_info=True)
+            value = None
+        with self._lock:
+            self._results[name] = ProbeResult(value, datetime.now())
+
+    def _run(self, name, func, period, delay):
+        if delay and self._stop.wait(delay):
+            return
+        while not self._stop.is_set():
+            self._run_once(name, func)
+            self._stop.wait(period)
+
+    def start(self):
+        for name, (func, period, delay) in self._probes.items():
+            thread = threading.Thread(target=self._run, args=(name, func, period, delay), name=f"sonda_{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Sondas iniciadas: {', '.join(f'{name} cada {period}s' for name, (_, period, _) in self._probes.items())}")
+
+    def stop(self):
+        self._stop.set()
+
+    def latest(self, name):
+        """Ultimo ProbeResult de la sonda, o None si aun no termina su primera ejecucion."""
+        with self._lock:
+            return self._results.get(name)
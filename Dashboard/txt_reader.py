@@ -0,0 +1,80 @@
+# txt_reader.py
+"""
+Lectura en bloque de los .txt por hora ('YYYY-MM-DD HH:MM:SS,valor' por linea).
+
+Un archivo (o un lote de archivos) se parsea en una sola pasada con el parser de C
+de pandas y una sola conversion vectorizada de fechas. Igual que el lector linea
+por linea anterior, se descartan las lineas con mas de dos campos, las fechas
+invalidas y los valores no numericos ('None'), y se ignoran las fracciones de segundo.
+"""
+import io
+import csv
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def empty_frame():
+    return pd.DataFrame(columns=['fecha', 'valor'])
+
+def parse_txt_text(text, strip_non_printable=False):
+    """
+    Parsea el contenido de uno o varios .txt y devuelve un DataFrame fecha/valor ordenado.
+    Con strip_non_printable, los valores que no son numericos se reintentan sin los
+    caracteres no imprimibles (como el clean_value de procesar_estadisticas).
+    """
+    if not text or not text.strip():
+        return empty_frame()
+    if strip_non_printable:
+        # El parser de C corta el campo en un NUL: se quitan antes de parsear
+        text = text.replace('\x00', '')
+    raw = pd.read_csv(
+        io.StringIO(text),
+        sep=',',
+        header=None,
+        names=['fecha', 'valor', 'extra'],
+        dtype=str,
+        quoting=csv.QUOTE_NONE,
+        na_filter=False,
+        index_col=False,
+        on_bad_lines='skip',
+        skip_blank_lines=True,
+        engine='c'
+    )
+    # Las lineas con un tercer campo no tienen el formato fecha,valor
+    raw = raw[raw['extra'] == '']
+    fechas = raw['fecha'].str.strip().str.split('.', n=1).str[0]
+    valores = pd.to_numeric(raw['valor'].str.strip(), errors='coerce')
+    if strip_non_printable:
+        invalid = valores.isna()
+        if invalid.any():
+            cleaned = raw.loc[invalid, 'valor'].str.replace(r'[^\x20-\x7E]', '', regex=True).str.strip()
+            valores[invalid] = pd.to_numeric(cleaned, errors='coerce')
+    df = pd.DataFrame({
+        'fecha': pd.to_datetime(fechas, format=DATE_FORMAT, errors='coerce'),
+        'valor': valores
+    })
+    df = df.dropna().sort_values('fecha', kind='stable').reset_index(drop=True)
+    return df
+
+def read_file_text(file_path):
+    with open(file_path, 'rb') as f:
+        text = f.read().decode('utf-8', errors='ignore')
+    if text and not text.endswith('\n'):
+        text += '\n'
+    return text
+
+def read_txt_file(file_path):
+    return parse_txt_text(read_file_text(file_path))
+
+def read_txt_files(file_paths, strip_non_printable=False):
+    """Lee un lote de archivos y los parsea juntos; los archivos ilegibles se omiten."""
+    texts = []
+    for file_path in file_paths:
+        try:
+            texts.append(read_file_text(file_path))
+        except OSError as e:
+            logger.warning(f"Error leyendo archivo {file_path}: {e}")
+    return parse_txt_text(''.join(texts), strip_non_printable)
@@ -4,6 +4,9 @@ import pickle
 import os
 import logging
 import csv
+import columnar_storage
+import txt_reader
+import demand_summary
 from data_collector import VARIABLES, VARIABLES_DISPLAY, UNITS
 
 logging.basicConfig(
@@ -16,42 +19,31 @@ logger = logging.getLogger(__name__)
 CONSUMO_CONFIG_FILE = "/home/pi/Desktop/Medidor/Dashboard/consumo_config.pkl"
 CONSUMO_CSV_FILE = "/home/pi/Desktop/Medidor/Dashboard/consumo_metrics.csv"
 BASE_DIR = "/home/pi/Desktop/Medidor/Rasp_Greco"
-
-def limpiar_valor(valor):
-    try:
-        return float(valor)
-    except (ValueError, TypeError):
-        logger.warning(f"Valor no numerico: {valor}")
-        return None
+ENERGIA_VARIABLE = 'Energia_importada_activa_total'
+DEMANDA_VARIABLE = 'Potencia_activa_Total'
 
 def read_single_txt_file(file_path):
     try:
-        contenido = []
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                parts = line.strip().split(',')
-                if len(parts) != 2:
-                    continue
-                fecha, valor = parts
-                fecha = fecha.strip().split('.')[0]
-                valor_limpio = limpiar_valor(valor)
-                if valor_limpio is None:
-                    continue
-                fecha_dt = pd.to_datetime(fecha, format='%Y-%m-%d %H:%M:%S', errors='coerce')
-                if pd.isna(fecha_dt):
-                    continue
-                contenido.append([fecha_dt, valor_limpio])
-        if not contenido:
+        df = txt_reader.read_txt_file(file_path)
+        if df.empty:
             logger.warning(f"No se encontraron datos validos en {file_path}")
-            return pd.DataFrame(columns=['fecha', 'valor'])
-        df = pd.DataFrame(contenido, columns=['fecha', 'valor'])
-        df = df.sort_values('fecha').dropna().reset_index(drop=True)
+            return df
         logger.info(f"Datos leidos de {file_path}: {len(df)} filas")
         return df
     except Exception as e:
         logger.error(f"Error leyendo archivo {file_path}: {e}")
         return pd.DataFrame(columns=['fecha', 'valor'])
 
+def read_hour_data(variable, hour):
+    """Lee una hora de datos desde el almacenamiento binario si existe el dia, si no desde el .txt."""
+    if columnar_storage.has_day(variable, hour.date()):
+        return columnar_storage.read_hour(variable, hour)
+    file_path = os.path.join(BASE_DIR, hour.strftime('%Y-%m-%d'), variable.lower(), f"{hour.strftime('%Y-%m-%d %H')}.txt")
+    if os.path.exists(file_path):
+        return read_single_txt_file(file_path)
+    logger.warning(f"Archivo {file_path} no encontrado")
+    return pd.DataFrame(columns=['fecha', 'valor'])
+
 def load_consumo_data():
     default_data = {
         'fecha_inicio': 'No disponible',
@@ -64,6 +56,7 @@ def load_consumo_data():
         'consumo_hoy': 0.0,
         'costo_hoy': 0.0,
         'demanda_maxima': 0.0,
+        'demanda_maxima_fecha': None,
         'estimacion_factura': 0.0,
         'fecha_fin': 'No disponible'
     }
@@ -81,7 +74,7 @@ def load_consumo_data():
         logger.error(f"Error al cargar {CONSUMO_CONFIG_FILE}: {e}")
     return default_data
 
-def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energia, consumo, costo, dias_transcurridos, consumo_hoy, costo_hoy, demanda_maxima, estimacion_factura, fecha_fin):
+def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energia, consumo, costo, dias_transcurridos, consumo_hoy, costo_hoy, demanda_maxima, estimacion_factura, fecha_fin, demanda_maxima_fecha=None):
     try:
         os.makedirs(os.path.dirname(CONSUMO_CONFIG_FILE), exist_ok=True)
         data = {
@@ -95,6 +88,7 @@ def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energ
             'consumo_hoy': consumo_hoy,
             'costo_hoy': costo_hoy,
             'demanda_maxima': demanda_maxima,
+            'demanda_maxima_fecha': demanda_maxima_fecha,
             'estimacion_factura': estimacion_factura,
             'fecha_fin': fecha_fin
         }
@@ -109,6 +103,7 @@ def save_consumo_data(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energ
             'consumo_hoy': consumo_hoy,
             'costo_hoy': costo_hoy,
             'demanda_maxima': demanda_maxima,
+            'demanda_maxima_fecha': demanda_maxima_fecha or '',
             'consumo_acumulado': consumo,
             'costo_acumulado': costo,
             'estimacion_factura': estimacion_factura
@@ -134,95 +129,60 @@ def calcular_metricas(fecha_inicio, costo_kwh, energia_inicial, usar_valor_energ
         if days_elapsed < 0:
             days_elapsed = 0
         previous_hour = (datetime.now() - timedelta(hours=1)).replace(minute=59, second=59, microsecond=0)
+        previous_hour_start = previous_hour.replace(minute=0, second=0)
         previous_hour_str = previous_hour.strftime('%Y-%m-%d %H')
         today_start = datetime.combine(today, datetime.min.time())
         today_start_str = today_start.strftime('%Y-%m-%d %H')
-        energia_dir = os.path.join(BASE_DIR, today.strftime('%Y-%m-%d'), 'energia_importada_activa_total')
         consumo_hoy = 0.0
-        logger.info(f"Buscando archivo de la hora anterior: {previous_hour_str}.txt en {energia_dir}")
-        if os.path.exists(energia_dir):
-            today_first_file = os.path.join(energia_dir, f"{today_start_str}.txt")
-            previous_hour_file = os.path.join(energia_dir, f"{previous_hour_str}.txt")
-            if os.path.exists(today_first_file):
-                df_today_first = read_single_txt_file(today_first_file)
-                if not df_today_first.empty:
-                    first_value_today = df_today_first['valor'].iloc[0]
-                    logger.info(f"Primer valor del dia ({today_start_str}.txt): {first_value_today}")
-                    if os.path.exists(previous_hour_file):
-                        df_previous_hour = read_single_txt_file(previous_hour_file)
-                        if not df_previous_hour.empty:
-                            last_value_previous_hour = df_previous_hour['valor'].iloc[-1]
-                            consumo_hoy = last_value_previous_hour - first_value_today
-                            logger.info(f"Ultimo valor de la hora anterior ({previous_hour_str}.txt): {last_value_previous_hour}")
-                            if consumo_hoy < 0:
-                                consumo_hoy = 0.0
-                            logger.info(f"Consumo hoy calculado: {consumo_hoy:.2f} kWh")
-                        else:
-                            logger.warning(f"No hay datos en {previous_hour_file}")
-                    else:
-                        logger.warning(f"Archivo {previous_hour_file} no encontrado")
-                else:
-                    logger.warning(f"No hay datos en {today_first_file}")
+        logger.info(f"Buscando datos de la hora anterior: {previous_hour_str}")
+        df_today_first = read_hour_data(ENERGIA_VARIABLE, today_start)
+        df_previous_hour = read_hour_data(ENERGIA_VARIABLE, previous_hour_start) if previous_hour.date() == today else pd.DataFrame(columns=['fecha', 'valor'])
+        if not df_today_first.empty:
+            first_value_today = df_today_first['valor'].iloc[0]
+            logger.info(f"Primer valor del dia ({today_start_str}): {first_value_today}")
+            if not df_previous_hour.empty:
+                last_value_previous_hour = df_previous_hour['valor'].iloc[-1]
+                consumo_hoy = last_value_previous_hour - first_value_today
+                logger.info(f"Ultimo valor de la hora anterior ({previous_hour_str}): {last_value_previous_hour}")
+                if consumo_hoy < 0:
+                    consumo_hoy = 0.0
+                logger.info(f"Consumo hoy calculado: {consumo_hoy:.2f} kWh")
             else:
-                logger.warning(f"Archivo {today_first_file} no encontrado")
+                logger.warning(f"No hay datos de la hora anterior ({previous_hour_str})")
         else:
-            logger.warning(f"Directorio {energia_dir} no encontrado")
+            logger.warning(f"No hay datos de la primera hora del dia ({today_start_str})")
         costo_hoy = consumo_hoy * costo_kwh
-        demanda_maxima = 0.0
-        for root, _, files in os.walk(BASE_DIR):
-            if 'potencia_activa_total' not in root.lower():
-                continue
-            date_dir = os.path.basename(os.path.dirname(root))
-            try:
-                dir_date = datetime.strptime(date_dir, '%Y-%m-%d').date()
-                if dir_date < fecha_inicio_dt.date():
-                    continue
-            except ValueError:
-                continue
-            for file in sorted(files):
-                if not file.endswith('.txt'):
-                    continue
-                file_path = os.path.join(root, file)
-                df = read_single_txt_file(file_path)
-                if not df.empty:
-                    max_value = df['valor'].max()
-                    if not pd.isna(max_value) and max_value > demanda_maxima:
-                        demanda_maxima = max_value
+        demanda_maxima, demanda_maxima_fecha = demand_summary.peak_demand(fecha_inicio_dt.to_pydatetime())
         consumo_acumulado = 0.0
-        first_file = os.path.join(BASE_DIR, fecha_inicio_dt.strftime('%Y-%m-%d'), 'energia_importada_activa_total', f"{fecha_inicio_dt.strftime('%Y-%m-%d')} 00.txt")
+        first_hour = fecha_inicio_dt.to_pydatetime().replace(hour=0, minute=0, second=0, microsecond=0)
         if usar_valor_energia:
             first_value = energia_inicial
             logger.info(f"Usando valor de energia inicial: {first_value}")
         else:
             first_value = None
-            if os.path.exists(first_file):
-                df_first = read_single_txt_file(first_file)
-                if not df_first.empty:
-                    first_value = df_first['valor'].iloc[0]
-                    logger.info(f"Valor inicial desde {first_file}: {first_value}")
-            else:
-                logger.warning(f"Archivo inicial {first_file} no encontrado")
-        if first_value is not None and os.path.exists(previous_hour_file):
-            df_previous_hour = read_single_txt_file(previous_hour_file)
-            if not df_previous_hour.empty:
-                last_value_previous_hour = df_previous_hour['valor'].iloc[-1]
-                consumo_acumulado = last_value_previous_hour - first_value
-                if consumo_acumulado < 0:
-                    consumo_acumulado = 0.0
-                logger.info(f"Consumo acumulado calculado: {consumo_acumulado:.2f} kWh")
+            df_first = read_hour_data(ENERGIA_VARIABLE, first_hour)
+            if not df_first.empty:
+                first_value = df_first['valor'].iloc[0]
+                logger.info(f"Valor inicial desde {first_hour:%Y-%m-%d %H}: {first_value}")
             else:
-                logger.warning(f"No hay datos en {previous_hour_file} para consumo acumulado")
+                logger.warning(f"No hay datos iniciales en {first_hour:%Y-%m-%d %H}")
+        if first_value is not None and not df_previous_hour.empty:
+            last_value_previous_hour = df_previous_hour['valor'].iloc[-1]
+            consumo_acumulado = last_value_previous_hour - first_value
+            if consumo_acumulado < 0:
+                consumo_acumulado = 0.0
+            logger.info(f"Consumo acumulado calculado: {consumo_acumulado:.2f} kWh")
         else:
-            logger.warning(f"No se pudo calcular consumo acumulado: first_value={first_value}, previous_hour_file_exists={os.path.exists(previous_hour_file)}")
+            logger.warning(f"No se pudo calcular consumo acumulado: first_value={first_value}, datos_hora_anterior={not df_previous_hour.empty}")
         costo_acumulado = consumo_acumulado * costo_kwh
         estimacion_factura = (costo_acumulado / max(days_elapsed, 1)) * 60 if days_elapsed > 0 else costo_acumulado
         logger.info(f"Metricas calculadas: Consumo={consumo_acumulado:.2f} kWh, Costo=${costo_acumulado:.2f} MXN, Dias={days_elapsed}, "
-                    f"Consumo hoy={consumo_hoy:.2f} kWh, Costo hoy=${costo_hoy:.2f} MXN, Demanda maxima={demanda_maxima:.2f} kW, "
+                    f"Consumo hoy={consumo_hoy:.2f} kWh, Costo hoy=${costo_hoy:.2f} MXN, Demanda maxima={demanda_maxima:.2f} kW ({demanda_maxima_fecha}), "
                     f"Estimacion factura=${estimacion_factura:.2f} MXN")
-        return consumo_acumulado, costo_acumulado, days_elapsed, consumo_hoy, costo_hoy, demanda_maxima, estimacion_factura, fecha_fin_dt.strftime('%Y-%m-%d')
+        return consumo_acumulado, costo_acumulado, days_elapsed, consumo_hoy, costo_hoy, demanda_maxima, demanda_maxima_fecha, estimacion_factura, fecha_fin_dt.strftime('%Y-%m-%d')
     except Exception as e:
         logger.error(f"Error calculando metricas: {e}")
-        return 0.0, 0.0, 0, 0.0, 0.0, 0.0, 0.0, (fecha_inicio_dt + timedelta(days=60)).strftime('%Y-%m-%d')
+        return 0.0, 0.0, 0, 0.0, 0.0, 0.0, None, 0.0, (fecha_inicio_dt + timedelta(days=60)).strftime('%Y-%m-%d')
 
 def main():
     global base_dir
@@ -236,12 +196,13 @@ def main():
     costo_kwh = consumo_data['costo_kwh']
     energia_inicial = consumo_data['energia_inicial']
     usar_valor_energia = consumo_data['usar_valor_energia']
-    consumo, costo, dias_transcurridos, consumo_hoy, costo_hoy, demanda_maxima, estimacion_factura, fecha_fin = calcular_metricas(
+    consumo, costo, dias_transcurridos, consumo_hoy, costo_hoy, demanda_maxima, demanda_maxima_fecha, estimacion_factura, fecha_fin = calcular_metricas(
         fecha_inicio, costo_kwh, energia_inicial, usar_valor_energia
     )
     save_consumo_data(
         fecha_inicio, costo_kwh, energia_inicial, usar_valor_energia,
-        consumo, costo, dias_transcurridos, consumo_hoy, costo_hoy, demanda_maxima, estimacion_factura, fecha_fin
+        consumo, costo, dias_transcurridos, consumo_hoy, costo_hoy, demanda_maxima, estimacion_factura, fecha_fin,
+        demanda_maxima_fecha
     )
     logger.info("Actualizacion de consumo completada")
 
@@ -2,7 +2,8 @@
 import logging
 import os
 from datetime import datetime, timedelta
-from pages.personalizar_graficas import generate_heatmap, load_heatmap_config, save_heatmap_data
+import heatmap_store
+import heatmap_worker
 from config import BASE_DIR, LOG_DIR
 
 # Configurar logging
@@ -38,6 +39,8 @@ def update_heatmap():
             logger.info(f"Ejecucion cancelada: no son los 5 minutos de la hora (minuto actual: {now.minute})")
             return
         logger.info("Iniciando actualizacion automatica del mapa de calor")
+        # Mapas precalculados de todas las variables (los usa Personalizar Graficas)
+        heatmap_worker.update_all(now)
         variable = 'Potencia_aparente_total'
         # Usar la hora anterior como fecha final
         fecha_final_dt = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
@@ -46,11 +49,11 @@ def update_heatmap():
         if not check_data_availability(variable, fecha_final_str):
             logger.error(f"No hay datos disponibles para {variable} en la hora anterior ({fecha_final_str})")
             return
-        # Generar mapa de calor
-        fig = generate_heatmap(variable, fecha_final_str, manual_config=False)
-        if fig:
-            save_heatmap_data(fig, variable, fecha_final_str, manual_config=False)
-            logger.info(f"Mapa de calor actualizado para {variable} con fecha final {fecha_final_str}")
+        # El mapa del panel principal es el precalculado de la variable por defecto
+        heatmap = heatmap_store.load_heatmap(heatmap_store.grid_path(variable))
+        if heatmap is not None:
+            heatmap_store.save_heatmap(heatmap)
+            logger.info(f"Mapa de calor actualizado para {variable} con fecha final {heatmap['fecha_final']}")
         else:
             logger.error(f"No se pudo generar el mapa de calor para {variable} en {fecha_final_str}")
     except Exception as e:
@@ -1,18 +1,28 @@
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from pymodbus.client.sync import ModbusSerialClient as ModbusClient
 import time
 import datetime as dt
 import psutil
 import subprocess
 import os
+import sys
+
+# Modulos del dashboard (estado del enlace Modbus que publica el colector)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Dashboard'))
+from config import MODBUS_STATUS_FILE
+from modbus_manager import read_status, TIMESTAMP_FORMAT
 
 
 
 #tiempo entre cada verificacion en segundos
 verificacion=60
 
+# Segundos sin actualizar el estado para considerar detenido el colector
+antiguedad_maxima_estado = 120
+# Segundos sin una lectura valida para dar el medidor por desconectado
+antiguedad_maxima_lectura = 300
+
 
 #limites de dagtos criticos
 cpu=60
@@ -121,21 +131,28 @@ def check_internet():
         print(f"Error al hacer ping: {e}")
         return False
 
+def get_meter_status():
+    """Estado del medidor segun la ultima lectura valida que publica el colector; devuelve (estado, datos del estado)."""
+    estado = read_status(MODBUS_STATUS_FILE, max_age=antiguedad_maxima_estado)
+    if estado is None:
+        return "Sin datos del colector", {}
+    # Se usa la antiguedad de la ultima lectura y no 'conectado': el puerto puede abrir y cerrarse
+    # en cada intento con el medidor apagado, y cada cambio de estado envia un correo
+    ultima_lectura = estado.get('ultima_lectura')
+    if ultima_lectura is None:
+        return "Sin lecturas del medidor", estado
+    antiguedad = (dt.datetime.now() - dt.datetime.strptime(ultima_lectura, TIMESTAMP_FORMAT)).total_seconds()
+    if antiguedad > antiguedad_maxima_lectura:
+        return f"Sin lecturas del medidor en {antiguedad_maxima_lectura} s", estado
+    return "Conexion establecida", estado
+
 def main():
     global log_file
     log_file = '/var/log/boot_time.log'
 
-    # Inicializar el cliente RTU
-    client = ModbusClient(method="rtu", port="/dev/ttyUSB0", stopbits=1, bytesize=8, parity='E', baudrate=38400)
-
-    connection = client.connect()
-    print(connection)
-    print("Method:", client.method)
-    print("Port:", client.port)
-    print("Stopbits:", client.stopbits)
-    print("Bytesize:", client.bytesize)
-    print("Parity:", client.parity)
-    print("Baudrate:", client.baudrate)
+    estado_de_comunicacion, estado = get_meter_status()
+    print("Estado del medidor:", estado_de_comunicacion)
+    print("Puerto:", estado.get('puerto'))
 
     last_status = None
     last_email_time = None  # Para hacer un seguimiento del Ultimo correo electronico enviado
@@ -143,9 +160,13 @@ def main():
 
 
     while True:
-        # Intentar conectar al servidor Modbus
-        connection = client.connect()
-        estado_de_comunicacion = "Conexion establecida" if connection else "Error de conexion"
+        # El colector es el dueno del puerto serie: solo se lee el estado que publica
+        estado_de_comunicacion, estado = get_meter_status()
+        puerto = estado.get('puerto', {})
+        registros = estado.get('registros', {}).values()
+        lecturas = sum(r['lecturas'] for r in registros)
+        errores = sum(r['errores'] for r in registros)
+        errores_crc = sum(r['errores_crc'] for r in registros)
 
         # Verificar la conexion a Internet
         internet_connected = check_internet()
@@ -159,12 +180,16 @@ def main():
                 subject = ' Oficina_Greco-Estado del medidor'#-----------------------------------------------------------
                 body = (f"Fecha y hora actual: {dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
                         f"Estado del medidor: {estado_de_comunicacion}\n"
-                        f"method: {client.method}\n"
-                        f"port: {client.port}\n"
-                        f"stopbits: {client.stopbits}\n"
-                        f"bytesize: {client.bytesize}\n"
-                        f"parity: {client.parity}\n"
-                        f"baudrate: {client.baudrate}\n\n"
+                        f"method: {puerto.get('method')}\n"
+                        f"port: {puerto.get('port')}\n"
+                        f"stopbits: {puerto.get('stopbits')}\n"
+                        f"bytesize: {puerto.get('bytesize')}\n"
+                        f"parity: {puerto.get('parity')}\n"
+                        f"baudrate: {puerto.get('baudrate')}\n"
+                        f"Ultima lectura: {estado.get('ultima_lectura')}\n"
+                        f"Ultimo error: {estado.get('ultimo_error')}\n"
+                        f"Reconexiones: {estado.get('reconexiones')}\n"
+                        f"Lecturas: {lecturas}, errores: {errores}, errores de CRC: {errores_crc}\n\n"
 
                         f"Ultimo apagado: {last_boot_time}\n"
                         f"Ultimo inicio: {formatted_now}\n"
@@ -206,9 +231,6 @@ def main():
                 send_email(subject, body)
                 internet_disconnected_time = None
 
-        # Desconectar despues de la verificacion
-        client.close()
-
         # Esperar 1 minuto antes de la proxima verificacion
         time.sleep(verificacion)
 